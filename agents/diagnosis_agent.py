@@ -1,59 +1,39 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import cached_property
+from typing import Any, AsyncIterator, Callable, Generator, Iterator, Optional
+
 import httpx
 from config.settings import settings
+from tools.semantic_cache import SemanticCache
 
-class DiagnosisAgent:
-    """Agente de raciocínio clínico veterinário"""
-    
-    def __init__(self):
-        self.client = httpx.Client(timeout=60.0)  # Timeout de 60s por chamada
-    
-    def generate_diagnosis(
-        self,
-        animal_info: dict,
-        symptoms: str,
-        visual_analysis: str,
-        knowledge: dict,
-        model: str = None  # Modelo opcional
-    ) -> dict:
-        """
-        Gera diagnóstico diferencial baseado em todas as informações
-        """
-        
-        # Formatar conhecimento
-        doc_context = "\n".join([
-            f"[Documento: {d['source']}]\n{d['content']}"
-            for d in knowledge.get("local_documents", [])[:3]
-        ])
-        
-        web_context = knowledge.get("web_search", "")
-        
-        prompt = f"""És um veterinário experiente a realizar um diagnóstico diferencial.
-
-## INFORMAÇÃO DO CASO
-
-### Dados do Animal:
-- Espécie: {animal_info.get('especie')}
-- Raça: {animal_info.get('raca')}
-- Idade: {animal_info.get('idade')}
-- Peso: {animal_info.get('peso')}
-- Histórico médico: {animal_info.get('historico', 'Não disponível')}
-
-### Sintomas Reportados pelo Tutor:
-{symptoms}
+# orjson (opcional): (de)serialização mais rápida dos pedidos/respostas
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+    _json_loads = json.loads
 
-### Análise Visual das Imagens:
-{visual_analysis}
+# Hosts dos providers - ligação TLS aquecida no arranque
+_PREWARM_URLS = (
+    "https://openrouter.ai",
+    "https://api.mistral.ai",
+)
 
-### Informação de Referência (Literatura e Web):
-{doc_context}
-
-{web_context}
-
----
+# Instruções fixas do diagnóstico. Vão sempre primeiro no pedido para que
+# o prefixo seja idêntico entre chamadas (prompt caching nos providers).
+TASK_INSTRUCTIONS = """És um veterinário experiente a realizar um diagnóstico diferencial.
 
 ## TAREFA
 
-Com base em toda a informação, fornece:
+Com base em toda a informação do caso enviada pelo utilizador, fornece:
 
 ### 1. DIAGNÓSTICOS DIFERENCIAIS
 Lista os 3-5 diagnósticos mais prováveis, ordenados por probabilidade:
@@ -83,135 +63,983 @@ Lembra que isto é uma orientação e não substitui consulta presencial.
 ---
 Raciocina passo a passo antes de concluir."""
 
-        # Tentar múltiplos providers em sequência
-        model_used = "unknown"
-        response = None
+
+# Formato de saída estruturado (caminho não-streaming). Acrescentado ao fim
+# das instruções para manter o mesmo prefixo em cache.
+JSON_OUTPUT_INSTRUCTIONS = """
+
+Responde APENAS com um objeto JSON com as chaves:
+- "differentials": lista de {"name", "probability", "justification"}
+- "exams": lista de exames recomendados
+- "initial_treatment": lista de cuidados/tratamentos iniciais
+- "urgency": nível de urgência
+- "next_steps": lista de recomendações para o tutor
+- "disclaimer": aviso de que não substitui consulta presencial"""
+
+
+def _parse_structured(text: str) -> Optional[dict]:
+    """Interpreta a resposta JSON do LLM (None se não for JSON válido)"""
+    text = text.strip()
+    if text.startswith("```"):
+        # Alguns modelos embrulham o JSON em blocos de código
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = _json_loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _render_report(data: dict) -> str:
+    """Converte o diagnóstico estruturado no relatório markdown"""
+    def bullets(items) -> str:
+        if isinstance(items, str):
+            return items
+        return "\n".join(f"- {item}" for item in items or [])
+    
+    differentials = []
+    for i, d in enumerate(data.get("differentials") or [], 1):
+        if isinstance(d, dict):
+            differentials.append(
+                f"{i}. **{d.get('name', '')}** ({d.get('probability', '?')}) - {d.get('justification', '')}"
+            )
+        else:
+            differentials.append(f"{i}. {d}")
+    
+    return f"""### 1. DIAGNÓSTICOS DIFERENCIAIS
+{chr(10).join(differentials)}
+
+### 2. EXAMES RECOMENDADOS
+{bullets(data.get("exams"))}
+
+### 3. TRATAMENTO INICIAL
+{bullets(data.get("initial_treatment"))}
+
+### 4. NÍVEL DE URGÊNCIA
+{data.get("urgency", "")}
+
+### 5. PRÓXIMOS PASSOS
+{bullets(data.get("next_steps"))}
+
+### 6. DISCLAIMER
+{data.get("disclaimer", "")}"""
+
+
+# Circuit breaker por modelo: model_id -> (aberto_até_ts, falhas_consecutivas)
+_PROVIDER_HEALTH: dict[str, tuple[float, int]] = {}
+_HEALTH_LOCK = threading.Lock()
+_MAX_BACKOFF_S = 60
+
+
+def _is_open(model_id: str) -> bool:
+    """True se o modelo falhou recentemente e ainda está em backoff"""
+    with _HEALTH_LOCK:
+        open_until, _ = _PROVIDER_HEALTH.get(model_id, (0.0, 0))
+    return time.time() < open_until
+
+
+def _record_failure(model_id: str):
+    """Regista falha e abre o circuito com backoff exponencial"""
+    with _HEALTH_LOCK:
+        _, fails = _PROVIDER_HEALTH.get(model_id, (0.0, 0))
+        fails += 1
+        _PROVIDER_HEALTH[model_id] = (time.time() + min(2 ** fails, _MAX_BACKOFF_S), fails)
+
+
+def _record_success(model_id: str):
+    """Fecha o circuito após uma resposta bem sucedida"""
+    with _HEALTH_LOCK:
+        _PROVIDER_HEALTH.pop(model_id, None)
+
+
+class _HedgeCancelled(Exception):
+    """Tentativa abortada porque outro provider respondeu primeiro"""
+
+
+class _DiagnosisBase:
+    """
+    Base comum aos agentes síncrono e assíncrono: prompt, cache semântico,
+    cadeia de providers e formato dos pedidos. Sem cliente HTTP próprio.
+    """
+    
+    # Segundos a aguardar pelo primeiro token do provider atual antes de lançar o seguinte
+    HEDGE_DELAY = 8.0
+    # Segundos máximos até ao primeiro token em streaming
+    FIRST_TOKEN_TIMEOUT = 10.0
+    # Tokens de saída: resposta completa vs. caso urgente (sem pesquisa detalhada)
+    MAX_TOKENS = 4000
+    MAX_TOKENS_FAST = 1500
+    # Caracteres máximos dos documentos no prompt (mantém o prefixo estático dominante)
+    DOC_CONTEXT_BUDGET = 3000
+    
+    # Bloco de instruções estático (prefixo comum a todos os pedidos)
+    _TASK_BLOCK = TASK_INSTRUCTIONS
+    _TASK_BLOCK_JSON = TASK_INSTRUCTIONS + JSON_OUTPUT_INSTRUCTIONS
+    
+    def __init__(self, embed_fn: Optional[Callable[[str], list[float]]] = None):
+        """
+        Args:
+            embed_fn: Função de embeddings (ativa o cache semântico)
+        """
+        # Cache semântico: casos semelhantes (mesma espécie) reutilizam a resposta
+        self._semantic_cache = SemanticCache(embed_fn, threshold=0.92, ttl=3600.0) if embed_fn else None
+    
+    @cached_property
+    def _gemini_model(self):
+        """Modelo Gemini partilhado (configurado no primeiro uso)"""
+        import google.generativeai as genai
+        
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        return genai.GenerativeModel(settings.VLM_MODEL)
+    
+    def _build_prompt(
+        self,
+        animal_info: dict,
+        symptoms: str,
+        visual_analysis: str,
+        knowledge: dict
+    ) -> str:
+        """Constrói a parte dinâmica do prompt (informação do caso)"""
+        # Formatar conhecimento (limitado a DOC_CONTEXT_BUDGET caracteres)
+        budget = self.DOC_CONTEXT_BUDGET
+        per_chunk = budget // 3
+        sio = io.StringIO()
+        # Com variantes (ex: tratamento), reservar um lugar para a melhor delas
+        extra_docs = knowledge.get("extra_documents", [])[:1]
+        documents = knowledge.get("local_documents", [])[:3 - len(extra_docs)] + extra_docs
+        for d in documents:
+            if sio.tell():
+                sio.write("\n")
+            sio.write(f"[Documento: {d['source']}]\n{d['content'][:per_chunk]}")
+            if sio.tell() > budget:
+                break
+        doc_context = sio.getvalue()
+        
+        web_context = knowledge.get("web_search", "")
+        
+        # Apenas a parte dinâmica do caso; as instruções fixas vão à frente
+        # (mensagem de sistema) para aproveitar o prompt caching dos providers
+        return f"""## INFORMAÇÃO DO CASO
+
+### Dados do Animal:
+- Espécie: {animal_info.get('especie')}
+- Raça: {animal_info.get('raca')}
+- Idade: {animal_info.get('idade')}
+- Peso: {animal_info.get('peso')}
+- Histórico médico: {animal_info.get('historico', 'Não disponível')}
+
+### Sintomas Reportados pelo Tutor:
+{symptoms}
+
+### Análise Visual das Imagens:
+{visual_analysis}
+
+### Informação de Referência (Literatura e Web):
+{doc_context}
+
+{web_context}"""
+    
+    def _cache_lookup(self, species: str, fingerprint: str) -> tuple[Optional[tuple], Optional[Any]]:
+        """
+        Consulta o cache semântico (filtrado por espécie).
+        
+        Returns:
+            ((relatório, estruturado) em cache ou None, embedding para guardar depois)
+        """
+        if self._semantic_cache is None:
+            return None, None
+        try:
+            vector = self._semantic_cache.embed(fingerprint)
+            cached = self._semantic_cache.lookup(fingerprint, tag=species, vector=vector)
+            return cached, vector
+        except Exception as e:
+            print(f"   ⚠️ Cache semântico indisponível: {e}")
+            return None, None
+    
+    def _provider_chain(self, model: str = None) -> list[tuple[str, str]]:
+        """
+        Providers por ordem de preferência: modelo selecionado primeiro,
+        depois OpenRouter (gratuitos) -> Mistral -> Gemini.
         
-        # Se um modelo específico foi passado, usar diretamente
+        Returns:
+            Lista de (nome curto, model_id)
+        """
+        chain = []
         if model:
-            try:
-                model_short = model.split("/")[-1].split(":")[0]
-                print(f"   Usando modelo selecionado: {model_short}...")
-                
-                # Determinar provider pelo formato do modelo
-                if model.startswith("mistral"):
-                    response = self._call_mistral(prompt, model)
-                    model_used = model_short
-                elif model.startswith("gemini"):
-                    response = self._call_gemini(prompt)
-                    model_used = model_short
-                else:
-                    # Assumir OpenRouter
-                    response = self._call_openrouter(prompt, model)
-                    model_used = model_short
-                    
-            except Exception as e:
-                print(f"   Modelo selecionado falhou: {e}")
-                # Continuar com fallback
-        
-        # Fallback: tentar múltiplos providers
-        if response is None:
-            # Lista de modelos OpenRouter para tentar (gratuitos)
-            openrouter_models = [
-                (settings.LLM_OPENROUTER_1, "grok-4.1-fast"),
-                (settings.LLM_OPENROUTER_3, "gemma-3-27b"),
-                (settings.LLM_OPENROUTER_2, "deepseek-r1-chimera"),
-                (settings.LLM_OPENROUTER_4, "glm-4.5-air"),
-            ]
-            
-            # 1. Tentar modelos OpenRouter
-            for llm_model, name in openrouter_models:
-                try:
-                    print(f"   Tentando {name}...")
-                    response = self._call_openrouter(prompt, llm_model)
-                    model_used = name
-                    break
-                except Exception as e:
-                    print(f"   {name} falhou: {e}")
-                    continue
+            chain.append((model.split("/")[-1].split(":")[0], model))
         
-        # 2. Se OpenRouter falhou, tentar Mistral
-        if response is None:
-            try:
-                print("   Tentando Mistral...")
-                response = self._call_mistral(prompt)
-                model_used = "mistral-small"
-            except Exception as e2:
-                print(f"   Mistral falhou: {e2}")
-                
-                # 3. Tentar Gemini
-                try:
-                    print("   Tentando Gemini...")
-                    response = self._call_gemini(prompt)
-                    model_used = "gemini"
-                except Exception as e3:
-                    print(f"   Gemini falhou: {e3}")
-                    response = "❌ Não foi possível gerar diagnóstico. Verifique as API keys."
-                    model_used = "none"
+        chain += [
+            ("grok-4.1-fast", settings.LLM_OPENROUTER_1),
+            ("gemma-3-27b", settings.LLM_OPENROUTER_3),
+            ("deepseek-r1-chimera", settings.LLM_OPENROUTER_2),
+            ("glm-4.5-air", settings.LLM_OPENROUTER_4),
+            ("mistral-small", settings.LLM_BACKUP),
+            ("gemini", settings.VLM_MODEL),
+        ]
+        return chain
+    
+    def _max_tokens_for(self, cfg) -> int:
+        """Limite de tokens de saída para a configuração de urgência"""
+        if cfg is not None and not cfg.detailed_research:
+            return self.MAX_TOKENS_FAST
+        return self.MAX_TOKENS
+    
+    def _package_result(self, response: str, model_used: str) -> dict:
+        """
+        Monta o resultado a partir da resposta do LLM.
         
+        Se a resposta for JSON válido, o relatório é gerado a partir dele;
+        caso contrário usa-se o texto tal como veio.
+        """
+        structured = _parse_structured(response) if model_used != "none" else None
         return {
-            "diagnosis_report": response,
+            "diagnosis_report": _render_report(structured) if structured else response,
+            "diagnosis_structured": structured,
             "model_used": model_used
         }
     
-    def _call_openrouter(self, prompt: str, model: str = None) -> str:
-        """Chama modelo via OpenRouter (gratuito)"""
+    def _openrouter_request(
+        self,
+        prompt: str,
+        model: str = None,
+        json_mode: bool = False,
+        max_tokens: int = MAX_TOKENS
+    ) -> tuple[str, dict, dict]:
+        """Constrói (url, headers, body) do pedido OpenRouter"""
         model = model or settings.LLM_OPENROUTER_1  # tngtech/deepseek-r1t-chimera:free
-        response = self.client.post(
+        request = (
             "https://openrouter.ai/api/v1/chat/completions",
-            headers={
+            {
                 "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
                 "Content-Type": "application/json",
                 "HTTP-Referer": "http://localhost",
                 "X-Title": "VetDiagnosis"
             },
-            json={
+            {
                 "model": model,
                 "messages": [
                     {
                         "role": "system",
-                        "content": "És um veterinário especialista em diagnóstico."
+                        "content": [{
+                            "type": "text",
+                            "text": self._TASK_BLOCK_JSON if json_mode else self._TASK_BLOCK,
+                            # Providers com prefix caching (ex: Anthropic) reutilizam este bloco
+                            "cache_control": {"type": "ephemeral"}
+                        }]
                     },
                     {"role": "user", "content": prompt}
                 ],
-                "max_tokens": 4000,
+                "max_tokens": max_tokens,
                 "temperature": 0.2
             }
         )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        if json_mode:
+            request[2]["response_format"] = {"type": "json_object"}
+        return request
     
-    def _call_mistral(self, prompt: str, model: str = None) -> str:
-        """Backup: Mistral AI"""
+    def _mistral_request(
+        self,
+        prompt: str,
+        model: str = None,
+        json_mode: bool = False,
+        max_tokens: int = MAX_TOKENS
+    ) -> tuple[str, dict, dict]:
+        """Constrói (url, headers, body) do pedido Mistral"""
         mistral_model = model or settings.LLM_BACKUP  # mistral-small-latest
-        response = self.client.post(
+        request = (
             "https://api.mistral.ai/v1/chat/completions",
-            headers={
+            {
                 "Authorization": f"Bearer {settings.MISTRAL_API_KEY}",
                 "Content-Type": "application/json"
             },
-            json={
+            {
                 "model": mistral_model,
                 "messages": [
-                    {
-                        "role": "system",
-                        "content": "És um veterinário especialista em diagnóstico."
-                    },
+                    {"role": "system", "content": self._TASK_BLOCK_JSON if json_mode else self._TASK_BLOCK},
                     {"role": "user", "content": prompt}
                 ],
-                "max_tokens": 4000,
+                "max_tokens": max_tokens,
                 "temperature": 0.2
             }
         )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        if json_mode:
+            request[2]["response_format"] = {"type": "json_object"}
+        return request
     
-    def _call_gemini(self, prompt: str) -> str:
+    def _stream_gemini(
+        self,
+        prompt: str,
+        json_mode: bool = False,
+        max_tokens: int = MAX_TOKENS
+    ) -> Iterator[str]:
+        """Streaming via Gemini"""
+        generation_config = {"max_output_tokens": max_tokens}
+        if json_mode:
+            generation_config["response_mime_type"] = "application/json"
+        task_block = self._TASK_BLOCK_JSON if json_mode else self._TASK_BLOCK
+        
+        # Instruções estáticas primeiro, caso no fim
+        for chunk in self._gemini_model.generate_content(
+            f"{task_block}\n\n{prompt}",
+            generation_config=generation_config,
+            stream=True
+        ):
+            if chunk.text:
+                yield chunk.text
+    
+    def _call_gemini(self, prompt: str, json_mode: bool = False, max_tokens: int = MAX_TOKENS) -> str:
         """Backup: Gemini"""
-        import google.generativeai as genai
+        return "".join(self._stream_gemini(prompt, json_mode, max_tokens))
+
+
+class DiagnosisAgent(_DiagnosisBase):
+    """Agente de raciocínio clínico veterinário"""
+    
+    # False quando o cliente HTTP é injetado (quem o criou é que o fecha)
+    _owns_client = True
+    
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[str], list[float]]] = None,
+        client: Optional[httpx.Client] = None
+    ):
+        """
+        Args:
+            embed_fn: Função de embeddings (ativa o cache semântico)
+            client: Cliente HTTP partilhado (por omissão, cria um próprio)
+        """
+        super().__init__(embed_fn)
+        if client is not None:
+            self.client = client  # Sobrepõe-se à cached_property
+            self._owns_client = False
+    
+    @cached_property
+    def client(self) -> httpx.Client:
+        """Cliente HTTP partilhado (criado no primeiro uso)"""
+        # HTTP/2 + pool com keep-alive longo: reutiliza a ligação TLS
+        # entre chamadas (e entre providers no fallback)
+        return httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=32,
+                keepalive_expiry=120.0
+            )
+        )
+    
+    @cached_property
+    def _stream_timeout(self) -> httpx.Timeout:
+        """Timeout dos pedidos em streaming (leitura limitada a FIRST_TOKEN_TIMEOUT)"""
+        return httpx.Timeout(60.0, connect=5.0, read=self.FIRST_TOKEN_TIMEOUT)
+    
+    def prewarm(self):
+        """
+        Abre as ligações aos providers antes do primeiro pedido.
         
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
-        model = genai.GenerativeModel(settings.VLM_MODEL) 
+        O cliente é criado já; os pedidos de aquecimento correm em
+        background e não bloqueiam o arranque.
+        """
+        client = self.client
+        threading.Thread(target=self._prewarm, args=(client,), daemon=True).start()
+    
+    @staticmethod
+    def _prewarm(client: httpx.Client):
+        for url in _PREWARM_URLS:
+            try:
+                client.head(url, timeout=5.0)
+            except Exception:
+                pass  # Best-effort: o pedido real volta a tentar
+    
+    def close(self):
+        """Fecha o pool de ligações (se chegou a ser criado e for nosso)"""
+        if self._owns_client and "client" in self.__dict__:
+            self.client.close()
+    
+    def __enter__(self) -> "DiagnosisAgent":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    def generate_diagnosis(
+        self,
+        animal_info: dict,
+        symptoms: str,
+        visual_analysis: str,
+        knowledge: dict,
+        model: str = None,  # Modelo opcional
+        cfg=None  # DiagnosisConfig opcional (urgência)
+    ) -> dict:
+        """
+        Gera diagnóstico diferencial baseado em todas as informações
+        """
+        
+        # Cache semântico (filtrado por espécie para não misturar casos)
+        species = animal_info.get('especie')
+        fingerprint = f"{species} {symptoms} {visual_analysis}"
+        cached, fingerprint_vec = self._cache_lookup(species, fingerprint)
+        if cached is not None:
+            print("   Diagnóstico obtido do cache semântico")
+            report, structured = cached
+            return {
+                "diagnosis_report": report,
+                "diagnosis_structured": structured,
+                "model_used": "semantic_cache"
+            }
+        
+        prompt = self._build_prompt(animal_info, symptoms, visual_analysis, knowledge)
+        
+        max_tokens = self._max_tokens_for(cfg)
+        attempts = [
+            (
+                lambda cancel, on_first, m=model_id: self._call_model(
+                    prompt, m, True, max_tokens, cancel=cancel, on_first=on_first
+                ),
+                name,
+                model_id
+            )
+            for name, model_id in self._provider_chain(model)
+        ]
+        
+        try:
+            response, model_used = self._run_hedged(attempts)
+        except RuntimeError:
+            response = "❌ Não foi possível gerar diagnóstico. Verifique as API keys."
+            model_used = "none"
+        
+        result = self._package_result(response, model_used)
+        
+        if fingerprint_vec is not None and model_used != "none":
+            self._semantic_cache.add(
+                fingerprint,
+                (result["diagnosis_report"], result["diagnosis_structured"]),
+                tag=species,
+                vector=fingerprint_vec
+            )
+        
+        return result
+    
+    def generate_diagnosis_stream(
+        self,
+        animal_info: dict,
+        symptoms: str,
+        visual_analysis: str,
+        knowledge: dict,
+        model: str = None,
+        cfg=None
+    ) -> Generator[str, None, str]:
+        """
+        Gera o diagnóstico em streaming, devolvendo o texto por partes.
+        
+        Usa o modelo selecionado (ou o OpenRouter por omissão). Se falhar
+        antes do primeiro token, recorre ao fallback de generate_diagnosis
+        e devolve o relatório completo de uma vez.
+        
+        Returns:
+            (valor de retorno do gerador) modelo que gerou o texto, como o
+            model_used de generate_diagnosis ("none" se todos falharam)
+        """
+        species = animal_info.get('especie')
+        fingerprint = f"{species} {symptoms} {visual_analysis}"
+        cached, fingerprint_vec = self._cache_lookup(species, fingerprint)
+        if cached is not None:
+            print("   Diagnóstico obtido do cache semântico")
+            yield cached[0]
+            return "semantic_cache"
+        
+        prompt = self._build_prompt(animal_info, symptoms, visual_analysis, knowledge)
+        model = model or settings.LLM_OPENROUTER_1
+        
+        parts = []
+        if not _is_open(model):
+            try:
+                for chunk in self._stream_model(prompt, model, max_tokens=self._max_tokens_for(cfg)):
+                    parts.append(chunk)
+                    yield chunk
+                _record_success(model)
+            except Exception as e:
+                _record_failure(model)
+                if parts:
+                    raise  # Já foi enviado texto parcial - não misturar respostas
+                print(f"   Streaming com {model} falhou: {e}")
+        
+        if parts:
+            if fingerprint_vec is not None:
+                self._semantic_cache.add(fingerprint, ("".join(parts), None), tag=species, vector=fingerprint_vec)
+            return model.split("/")[-1].split(":")[0]
+        
+        # Fallback: corrida entre providers (sem streaming)
+        result = self.generate_diagnosis(animal_info, symptoms, visual_analysis, knowledge, cfg=cfg)
+        yield result["diagnosis_report"]
+        return result["model_used"]
+    
+    def _call_model(
+        self,
+        prompt: str,
+        model: str,
+        json_mode: bool = False,
+        max_tokens: int = _DiagnosisBase.MAX_TOKENS,
+        cancel: Optional[threading.Event] = None,
+        on_first: Optional[Callable[[], bool]] = None
+    ) -> str:
+        """
+        Chama o provider adequado ao formato do nome do modelo.
+        
+        Args:
+            cancel: Evento que aborta a geração (verificado a cada parte)
+            on_first: Chamado no primeiro token; se devolver False, aborta
+        
+        Returns:
+            Resposta completa
+        """
+        parts = []
+        stream = self._stream_model(prompt, model, json_mode, max_tokens)
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    raise _HedgeCancelled(model)
+                if not parts and on_first is not None and not on_first():
+                    raise _HedgeCancelled(model)
+                parts.append(chunk)
+        finally:
+            # Fechar o gerador fecha a resposta HTTP: o provider deixa de gerar
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        return "".join(parts)
+    
+    def _stream_model(
+        self,
+        prompt: str,
+        model: str,
+        json_mode: bool = False,
+        max_tokens: int = _DiagnosisBase.MAX_TOKENS
+    ) -> Iterator[str]:
+        """Streaming a partir do provider adequado ao nome do modelo"""
+        if model.startswith("mistral"):
+            return self._stream_mistral(prompt, model, json_mode, max_tokens)
+        if model.startswith("gemini"):
+            return self._stream_gemini(prompt, json_mode, max_tokens)
+        # Assumir OpenRouter
+        return self._stream_openrouter(prompt, model, json_mode, max_tokens)
+    
+    def _run_hedged(self, attempts: list) -> tuple[str, str]:
+        """
+        Executa as tentativas em modo "hedged".
+        
+        Cada tentativa é fn(cancel, on_first) em streaming. Lança a
+        primeira; se não chegar nenhum token em HEDGE_DELAY segundos (ou
+        falhar), lança a seguinte. O primeiro provider a produzir um token
+        fica com o pedido: as restantes tentativas são abortadas (a resposta
+        HTTP é fechada) e não se lançam mais. Devolve (resposta, nome).
+        
+        Modelos com o circuito aberto (falharam há pouco) são saltados,
+        exceto se todos estiverem abertos.
+        """
+        healthy = []
+        for attempt in attempts:
+            if _is_open(attempt[2]):
+                print(f"   ⚠️ {attempt[1]} em backoff (falhas recentes) - a saltar")
+            else:
+                healthy.append(attempt)
+        attempts = healthy or attempts
+        
+        self.client  # Criar o pool antes de o partilhar entre threads
+        executor = ThreadPoolExecutor(max_workers=len(attempts))
+        remaining = iter(attempts)
+        pending = {}
+        
+        # Tentativa que já está a produzir tokens (evento de cancelamento dela)
+        lock = threading.Lock()
+        leader = [None]
+        
+        def make_on_first(cancel: threading.Event) -> Callable[[], bool]:
+            def on_first() -> bool:
+                with lock:
+                    if leader[0] is not None and leader[0] is not cancel:
+                        return False  # Outro provider já respondeu
+                    leader[0] = cancel
+                    for _, _, other in pending.values():
+                        if other is not cancel:
+                            other.set()
+                return True
+            return on_first
+        
+        def launch_next() -> bool:
+            for fn, name, model_id in remaining:
+                print(f"   Tentando {name}...")
+                cancel = threading.Event()
+                with lock:
+                    pending[executor.submit(fn, cancel, make_on_first(cancel))] = (name, model_id, cancel)
+                return True
+            return False
+        
+        try:
+            launch_next()
+            while pending:
+                # Com um provider já em streaming, espera-se só por ele
+                timeout = None if leader[0] is not None else self.HEDGE_DELAY
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    with lock:
+                        name, model_id, cancel = pending.pop(future)
+                        if leader[0] is cancel:
+                            leader[0] = None
+                    try:
+                        response = future.result()
+                    except _HedgeCancelled:
+                        continue
+                    except Exception as e:
+                        print(f"   {name} falhou: {e}")
+                        _record_failure(model_id)
+                        continue
+                    _record_success(model_id)
+                    return response, name
+                
+                # Sem primeiro token a tempo (hedge) ou falha: próximo provider
+                if leader[0] is None:
+                    launch_next()
+        finally:
+            # Abortar as tentativas em voo (fecham a resposta no próximo token)
+            with lock:
+                for _, _, cancel in pending.values():
+                    cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        raise RuntimeError("Todos os providers falharam")
+    
+    def _stream_chat(self, url: str, headers: dict, body: dict) -> Iterator[str]:
+        """
+        Faz um pedido chat/completions em streaming (SSE) e devolve os deltas.
+        
+        Aborta se não chegar nenhum token em FIRST_TOKEN_TIMEOUT segundos,
+        para que o fallback avance depressa em endpoints pendurados. O
+        timeout de leitura do pedido é o mesmo valor: um endpoint que não
+        envia nada (nem keep-alive) falha aí, sem esperar pelos 60s do cliente.
+        """
+        first_token_deadline = time.time() + self.FIRST_TOKEN_TIMEOUT
+        got_token = False
+        
+        payload = _json_dumps({**body, "stream": True})
+        with self.client.stream(
+            "POST", url, headers=headers, content=payload, timeout=self._stream_timeout
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not got_token and time.time() > first_token_deadline:
+                    raise TimeoutError(f"Sem resposta em {self.FIRST_TOKEN_TIMEOUT:.0f}s")
+                
+                # Linhas SSE: "data: {...}"; comentários/keep-alive são ignorados
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                
+                choices = _json_loads(data).get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    got_token = True
+                    yield content
+        
+        if not got_token:
+            raise RuntimeError("Resposta vazia do provider")
+    
+    def _stream_openrouter(
+        self,
+        prompt: str,
+        model: str = None,
+        json_mode: bool = False,
+        max_tokens: int = _DiagnosisBase.MAX_TOKENS
+    ) -> Iterator[str]:
+        """Streaming via OpenRouter (gratuito)"""
+        return self._stream_chat(*self._openrouter_request(prompt, model, json_mode, max_tokens))
+    
+    def _stream_mistral(
+        self,
+        prompt: str,
+        model: str = None,
+        json_mode: bool = False,
+        max_tokens: int = _DiagnosisBase.MAX_TOKENS
+    ) -> Iterator[str]:
+        """Streaming via Mistral AI"""
+        return self._stream_chat(*self._mistral_request(prompt, model, json_mode, max_tokens))
+    
+    def _call_openrouter(self, prompt: str, model: str = None, json_mode: bool = False,
+                         max_tokens: int = _DiagnosisBase.MAX_TOKENS) -> str:
+        """Chama modelo via OpenRouter (gratuito)"""
+        return "".join(self._stream_openrouter(prompt, model, json_mode, max_tokens))
+    
+    def _call_mistral(self, prompt: str, model: str = None, json_mode: bool = False,
+                      max_tokens: int = _DiagnosisBase.MAX_TOKENS) -> str:
+        """Backup: Mistral AI"""
+        return "".join(self._stream_mistral(prompt, model, json_mode, max_tokens))
+
+
+class AsyncDiagnosisAgent(_DiagnosisBase):
+    """
+    Variante assíncrona do DiagnosisAgent (aiohttp).
+    
+    As chamadas aos providers são corrotinas em streaming num único event
+    loop, sem threads por pedido. Partilha com o DiagnosisAgent apenas a base (prompt, cache, pedidos):
+    não tem cliente httpx nem API síncrona.
+    """
+    
+    def __init__(self, embed_fn: Optional[Callable[[str], list[float]]] = None):
+        """
+        Args:
+            embed_fn: Função de embeddings (ativa o cache semântico)
+        """
+        super().__init__(embed_fn)
+        # A sessão aiohttp tem de ser criada dentro do event loop
+        self._session = None
+    
+    def _get_session(self):
+        """Devolve a sessão aiohttp (criada no primeiro uso)"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=64,
+                    limit_per_host=16,
+                    keepalive_timeout=120
+                ),
+                timeout=aiohttp.ClientTimeout(total=60, connect=5)
+            )
+        return self._session
+    
+    async def aclose(self):
+        """Fecha a sessão aiohttp"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    async def __aenter__(self) -> "AsyncDiagnosisAgent":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def generate_diagnosis(
+        self,
+        animal_info: dict,
+        symptoms: str,
+        visual_analysis: str,
+        knowledge: dict,
+        model: str = None,
+        cfg=None
+    ) -> dict:
+        """
+        Gera diagnóstico diferencial (versão assíncrona)
+        """
+        species = animal_info.get('especie')
+        fingerprint = f"{species} {symptoms} {visual_analysis}"
+        cached, fingerprint_vec = self._cache_lookup(species, fingerprint)
+        if cached is not None:
+            print("   Diagnóstico obtido do cache semântico")
+            report, structured = cached
+            return {
+                "diagnosis_report": report,
+                "diagnosis_structured": structured,
+                "model_used": "semantic_cache"
+            }
+        
+        prompt = self._build_prompt(animal_info, symptoms, visual_analysis, knowledge)
+        max_tokens = self._max_tokens_for(cfg)
+        attempts = [
+            (
+                lambda on_first, m=model_id: self._acall_model(
+                    prompt, m, True, max_tokens, on_first=on_first
+                ),
+                name,
+                model_id
+            )
+            for name, model_id in self._provider_chain(model)
+        ]
+        
+        try:
+            response, model_used = await self._arun_hedged(attempts)
+        except RuntimeError:
+            response = "❌ Não foi possível gerar diagnóstico. Verifique as API keys."
+            model_used = "none"
+        
+        result = self._package_result(response, model_used)
+        
+        if fingerprint_vec is not None and model_used != "none":
+            self._semantic_cache.add(
+                fingerprint,
+                (result["diagnosis_report"], result["diagnosis_structured"]),
+                tag=species,
+                vector=fingerprint_vec
+            )
+        
+        return result
+    
+    async def _arun_hedged(self, attempts: list) -> tuple[str, str]:
+        """
+        Equivalente assíncrono de _run_hedged.
+        
+        Cada tentativa é fn(on_first) em streaming. Se não chegar nenhum
+        token em HEDGE_DELAY segundos (ou falhar), lança a seguinte; o
+        primeiro provider a produzir um token fica com o pedido e as
+        restantes tarefas são canceladas (a ligação aiohttp é fechada).
+        """
+        healthy = []
+        for attempt in attempts:
+            if _is_open(attempt[2]):
+                print(f"   ⚠️ {attempt[1]} em backoff (falhas recentes) - a saltar")
+            else:
+                healthy.append(attempt)
+        attempts = healthy or attempts
+        
+        remaining = iter(attempts)
+        pending = {}
+        
+        # Tarefa que já está a produzir tokens (um só event loop: sem locks)
+        leader = [None]
+        first_token = asyncio.Event()
+        
+        def on_first() -> bool:
+            task = asyncio.current_task()
+            if leader[0] is not None and leader[0] is not task:
+                return False  # Outro provider já respondeu
+            leader[0] = task
+            first_token.set()
+            for other in pending:
+                if other is not task:
+                    other.cancel()
+            return True
+        
+        def launch_next() -> bool:
+            for fn, name, model_id in remaining:
+                print(f"   Tentando {name}...")
+                pending[asyncio.ensure_future(fn(on_first))] = (name, model_id)
+                return True
+            return False
+        
+        try:
+            launch_next()
+            while pending:
+                if leader[0] is None:
+                    # Acorda no primeiro token, numa conclusão ou no hedge
+                    token_wait = asyncio.ensure_future(first_token.wait())
+                    done, _ = await asyncio.wait(
+                        [*pending, token_wait], timeout=self.HEDGE_DELAY,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    token_wait.cancel()
+                else:
+                    # Com um provider já em streaming, espera-se só por ele
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    if task not in pending:
+                        continue  # token_wait
+                    name, model_id = pending.pop(task)
+                    if leader[0] is task:
+                        leader[0] = None
+                        first_token.clear()
+                    if task.cancelled():
+                        continue
+                    try:
+                        response = task.result()
+                    except _HedgeCancelled:
+                        continue
+                    except Exception as e:
+                        print(f"   {name} falhou: {e}")
+                        _record_failure(model_id)
+                        continue
+                    _record_success(model_id)
+                    return response, name
+                
+                # Sem primeiro token a tempo (hedge) ou falha: próximo provider
+                if leader[0] is None:
+                    launch_next()
+        finally:
+            # Ao contrário das threads, as tarefas perdedoras podem ser canceladas
+            for task in pending:
+                task.cancel()
+        
+        raise RuntimeError("Todos os providers falharam")
+    
+    async def _acall_model(
+        self,
+        prompt: str,
+        model: str,
+        json_mode: bool = False,
+        max_tokens: int = _DiagnosisBase.MAX_TOKENS,
+        on_first: Optional[Callable[[], bool]] = None
+    ) -> str:
+        """
+        Chama o provider adequado ao formato do nome do modelo.
+        
+        Args:
+            on_first: Chamado no primeiro token; se devolver False, aborta
+        
+        Returns:
+            Resposta completa
+        """
+        if model.startswith("gemini"):
+            # SDK Gemini é síncrono - corre numa thread; conta como "primeiro
+            # token" quando termina (a thread não pode ser interrompida)
+            response = await asyncio.to_thread(self._call_gemini, prompt, json_mode, max_tokens)
+            if on_first is not None and not on_first():
+                raise _HedgeCancelled(model)
+            return response
+        
+        if model.startswith("mistral"):
+            request = self._mistral_request(prompt, model, json_mode, max_tokens)
+        else:
+            request = self._openrouter_request(prompt, model, json_mode, max_tokens)
+        
+        parts = []
+        stream = self._astream_chat(*request)
+        try:
+            async for chunk in stream:
+                if not parts and on_first is not None and not on_first():
+                    raise _HedgeCancelled(model)
+                parts.append(chunk)
+        finally:
+            # Fechar o gerador fecha a resposta HTTP: o provider deixa de gerar
+            await stream.aclose()
+        return "".join(parts)
+    
+    async def _astream_chat(self, url: str, headers: dict, body: dict) -> AsyncIterator[str]:
+        """
+        Pedido chat/completions em streaming (SSE) e devolve os deltas.
+        
+        A leitura está limitada a FIRST_TOKEN_TIMEOUT segundos sem dados,
+        como no _stream_chat síncrono.
+        """
+        import aiohttp
+        
+        got_token = False
+        payload = _json_dumps({**body, "stream": True})
+        timeout = aiohttp.ClientTimeout(total=60, connect=5, sock_read=self.FIRST_TOKEN_TIMEOUT)
+        async with self._get_session().post(url, headers=headers, data=payload, timeout=timeout) as resp:
+            resp.raise_for_status()
+            async for raw in resp.content:
+                # Linhas SSE: "data: {...}"; comentários/keep-alive são ignorados
+                line = raw.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                
+                choices = _json_loads(data).get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    got_token = True
+                    yield content
         
-        response = model.generate_content(prompt)
-        return response.text
\ No newline at end of file
+        if not got_token:
+            raise RuntimeError("Resposta vazia do provider")
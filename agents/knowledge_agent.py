@@ -5,7 +5,13 @@ USA: tools/web_search.py (RAGTool)
 USA: tools/web_search_tool.py (WebSearchTool)
 """
 
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import cached_property
 from typing import Optional
+
+import httpx
 from config.settings import settings
 
 # ═══════════════════════════════════════════════════════════════
@@ -18,7 +24,30 @@ from tools.web_search_tool import WebSearchTool
 class KnowledgeAgent:
     """Agente de pesquisa: RAG local + Web Search"""
     
-    def __init__(self):
+    # Validade do cache de pesquisa RAG (segundos)
+    RETRIEVAL_CACHE_TTL = 600
+    # Caracteres da query usados na chave (variações no fim da legenda visual fazem hit)
+    RETRIEVAL_KEY_CHARS = 120
+    
+    def __init__(self, http_client: Optional[httpx.Client] = None):
+        """
+        Args:
+            http_client: Cliente HTTP partilhado, passado ao WebSearchTool
+        """
+        self._http_client = http_client
+        
+        # RAGTool e WebSearchTool são criados no primeiro uso (ver propriedades):
+        # o modelo de embeddings domina o arranque a frio
+        
+        # Cache de resultados RAG: chave -> (timestamp, (doc_results, doc_context, extra_docs))
+        self._retrieval_cache: dict[str, tuple[float, tuple[list, str, list]]] = {}
+        self._cache_epoch = 0  # Incrementado quando a base de conhecimento muda
+        
+        print(f"📚 KnowledgeAgent inicializado")
+    
+    @cached_property
+    def rag_tool(self) -> RAGTool:
+        """RAGTool das tools (carregado no primeiro acesso)"""
         # ═══════════════════════════════════════════════════════
         # INICIALIZA RAGTool das tools
         # ═══════════════════════════════════════════════════════
@@ -26,22 +55,27 @@ class KnowledgeAgent:
             chroma_path=settings.CHROMA_PATH,
             docs_path=settings.DOCS_PATH,
             embedding_model=settings.EMBEDDING_MODEL,
+            embedding_backend=settings.EMBEDDING_BACKEND,
             chunk_size=1000,
             chunk_overlap=200
         )
-        self.rag_tool = RAGTool(config=rag_config)
-        
+        rag_tool = RAGTool(config=rag_config)
+        print(f"   - RAG: {rag_tool.get_stats()['total_documents']} documentos")
+        return rag_tool
+    
+    @cached_property
+    def web_search(self) -> WebSearchTool:
+        """WebSearchTool das tools (criado no primeiro acesso)"""
         # ═══════════════════════════════════════════════════════
         # INICIALIZA WebSearchTool das tools
         # ═══════════════════════════════════════════════════════
-        self.web_search = WebSearchTool(
+        web_search = WebSearchTool(
             google_api_key=settings.GOOGLE_API_KEY,
-            preferred_provider='gemini'  # Usa Gemini Grounding primeiro
+            preferred_provider='gemini',  # Usa Gemini Grounding primeiro
+            client=self._http_client
         )
-        
-        print(f"📚 KnowledgeAgent inicializado")
-        print(f"   - RAG: {self.rag_tool.get_stats()['total_documents']} documentos")
-        print(f"   - Web: {self.web_search.get_available_providers()}")
+        print(f"   - Web: {web_search.get_available_providers()}")
+        return web_search
     
     def ingest_documents(self, docs_path: Optional[str] = None) -> dict:
         """
@@ -66,15 +100,17 @@ class KnowledgeAgent:
         # ═══════════════════════════════════════════════════════
         results = self.rag_tool.hybrid_search(query, k=k)
         
-        return [
-            {
-                "content": r.content,
-                "source": r.source,
-                "page": r.page,
-                "score": r.score
-            }
-            for r in results
-        ]
+        return [self._result_to_dict(r) for r in results]
+    
+    @staticmethod
+    def _result_to_dict(r) -> dict:
+        """Converte um SearchResult no formato usado pelos agentes"""
+        return {
+            "content": r.content,
+            "source": r.source,
+            "page": r.page,
+            "score": r.score
+        }
     
     def search_web(self, query: str) -> str:
         """
@@ -98,67 +134,131 @@ class KnowledgeAgent:
             format_type='markdown'
         )
     
-    def gather_knowledge(self, query: str, visual_analysis: str) -> dict:
+    def _retrieve_local(
+        self,
+        enriched_query: str,
+        extra_queries: tuple[str, ...] = ()
+    ) -> tuple[list[dict], str, list[dict]]:
+        """
+        Pesquisa RAG local (documentos + contexto) com cache TTL.
+        
+        As queries adicionais (ex: foco no tratamento) são pesquisadas no
+        mesmo lote; os seus documentos vêm sem repetições.
+        A chave inclui a época do cache, invalidada ao adicionar casos.
+        """
+        key_src = f"{self._cache_epoch}:{enriched_query[:self.RETRIEVAL_KEY_CHARS]}:{'|'.join(extra_queries)}"
+        key = hashlib.sha1(key_src.encode()).hexdigest()
+        now = time.time()
+        
+        cached = self._retrieval_cache.get(key)
+        if cached and now - cached[0] < self.RETRIEVAL_CACHE_TTL:
+            return cached[1]
+        
+        # Uma só pesquisa (em lote) para os documentos e para o contexto
+        results, doc_context, extra_results = self.rag_tool.search_and_context(
+            enriched_query, k=3, max_tokens=1000, extra_queries=list(extra_queries)
+        )
+        doc_results = [self._result_to_dict(r) for r in results]
+        
+        seen = {r.content for r in results}
+        extra_docs = []
+        for r in (r for batch in extra_results for r in batch):
+            if r.content not in seen:
+                seen.add(r.content)
+                extra_docs.append(self._result_to_dict(r))
+        
+        # Limpar entradas expiradas antes de inserir
+        self._retrieval_cache = {
+            k: v for k, v in self._retrieval_cache.items()
+            if now - v[0] < self.RETRIEVAL_CACHE_TTL
+        }
+        self._retrieval_cache[key] = (now, (doc_results, doc_context, extra_docs))
+        return doc_results, doc_context, extra_docs
+    
+    def gather_knowledge(
+        self,
+        query: str,
+        visual_analysis: str,
+        extra_queries: Optional[list[str]] = None
+    ) -> dict:
         """
         Combina conhecimento de múltiplas fontes.
         
         Esta é a função principal chamada pelo Orchestrator.
         OTIMIZADO: Skip RAG se não há documentos + apenas 1 web search.
+        
+        Args:
+            query: Query principal
+            visual_analysis: Análise visual (enriquece a query RAG)
+            extra_queries: Variantes da query só para o RAG (pesquisa em lote)
         """
-        import time
         t_start = time.perf_counter()
         
-        # Pesquisa enriquecida com contexto visual
-        enriched_query = f"{query}. Observações: {visual_analysis[:200]}"
+        # Pesquisa enriquecida com contexto visual (se já disponível)
+        enriched_query = f"{query}. Observações: {visual_analysis[:200]}" if visual_analysis else query
         
         doc_results = []
         doc_context = ""
+        extra_docs = []
         search_results = []
-        
-        # ═══════════════════════════════════════════════════════
-        # 1. RAG LOCAL - SKIP se não há documentos
-        # ═══════════════════════════════════════════════════════
-        t1 = time.perf_counter()
-        rag_stats = self.rag_tool.get_stats()
-        if rag_stats.get('total_documents', 0) > 0:
-            doc_results = self.search_documents(enriched_query, k=3)
-            doc_context = self.rag_tool.get_relevant_context(enriched_query, max_tokens=1000)
-            print(f"      [Knowledge] RAG local: {time.perf_counter()-t1:.2f}s ({len(doc_results)} docs)")
-        else:
-            print(f"      [Knowledge] RAG local: SKIP (0 documentos)")
-        
-        # ═══════════════════════════════════════════════════════
-        # 2. WEB SEARCH - UMA ÚNICA pesquisa (otimizado)
-        # ═══════════════════════════════════════════════════════
-        t2 = time.perf_counter()
         web_results = ""
         web_context = ""
-        try:
-            # Fazer apenas UMA pesquisa
-            search_results = self.web_search.search(query, max_results=5)
-            if search_results:
-                web_context = self.web_search.format_results(search_results, format_type='plain')
-                web_results = web_context
-                print(f"      [Knowledge] Web search: {time.perf_counter()-t2:.2f}s ({len(search_results)} resultados)")
-                # Debug: mostrar títulos encontrados
-                for i, r in enumerate(search_results[:3], 1):
-                    print(f"         {i}. {r.title[:60]}...")
+        
+        def timed(fn, *args):
+            t0 = time.perf_counter()
+            return fn(*args), time.perf_counter() - t0
+        
+        # RAG local e web search são independentes (I/O) - correm em paralelo
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # ═══════════════════════════════════════════════════
+            # 1. RAG LOCAL - SKIP se não há documentos
+            # ═══════════════════════════════════════════════════
+            rag_future = None
+            rag_stats = self.rag_tool.get_stats()
+            if rag_stats.get('total_documents', 0) > 0:
+                rag_future = executor.submit(
+                    timed, self._retrieve_local, enriched_query, tuple(extra_queries or ())
+                )
             else:
-                print(f"      [Knowledge] Web search: {time.perf_counter()-t2:.2f}s (0 resultados)")
-        except Exception as e:
-            print(f"      ⚠️ Web search falhou: {e}")
+                print(f"      [Knowledge] RAG local: SKIP (0 documentos)")
+            
+            # ═══════════════════════════════════════════════════
+            # 2. WEB SEARCH - UMA ÚNICA pesquisa (otimizado)
+            # ═══════════════════════════════════════════════════
+            web_future = executor.submit(timed, self.web_search.search, query, 5)
+            
+            for future in as_completed([f for f in (rag_future, web_future) if f]):
+                if future is rag_future:
+                    (doc_results, doc_context, extra_docs), elapsed = future.result()
+                    print(f"      [Knowledge] RAG local: {elapsed:.2f}s ({len(doc_results)} docs)")
+                    continue
+                
+                try:
+                    search_results, elapsed = future.result()
+                    if search_results:
+                        web_context = self.web_search.format_results(search_results, format_type='plain')
+                        web_results = web_context
+                        print(f"      [Knowledge] Web search: {elapsed:.2f}s ({len(search_results)} resultados)")
+                        # Debug: mostrar títulos encontrados
+                        for i, r in enumerate(search_results[:3], 1):
+                            print(f"         {i}. {r.title[:60]}...")
+                    else:
+                        print(f"      [Knowledge] Web search: {elapsed:.2f}s (0 resultados)")
+                except Exception as e:
+                    print(f"      ⚠️ Web search falhou: {e}")
         
         print(f"      [Knowledge] TOTAL: {time.perf_counter()-t_start:.2f}s")
         
         return {
             "local_documents": doc_results,
             "local_context": doc_context,
+            "extra_documents": extra_docs,
             "web_search": web_results,
             "web_context": web_context,
             "query_used": enriched_query,
             "sources_count": {
                 "documents": len(doc_results),
-                "web": len(search_results) if 'search_results' in dir() else 0
+                "web": len(search_results)
             }
         }
     
@@ -181,6 +281,7 @@ class KnowledgeAgent:
             metadata={"type": "case_study"},
             source="casos_clinicos"
         )
+        self._cache_epoch += 1  # Resultados RAG em cache deixam de ser válidos
         print("✅ Caso adicionado à base de conhecimento")
     
     def get_stats(self) -> dict:
@@ -1,18 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Optional, List
+from enum import IntEnum
+from functools import lru_cache
+from string import Template
+from typing import Iterator, Optional, List
 from datetime import datetime
+import asyncio
+import atexit
 import hashlib
+import logging
+import logging.handlers
+import queue
+import re
+import sys
 import time
 
+import httpx
+
 from agents.vision_agent import VisionAgent
 from agents.knowledge_agent import KnowledgeAgent
 from agents.diagnosis_agent import DiagnosisAgent
+from config.settings import settings
+from tools.async_runtime import get_loop, run_sync
+from tools.case_store import CaseStore
+from tools.semantic_cache import SemanticCache
+
+try:
+    import ahocorasick  # pyahocorasick (opcional)
+except ImportError:
+    ahocorasick = None
 
 
 # ============================================================
 # CONFIGURAÇÃO BASEADA NA URGÊNCIA
 # ============================================================
 
+class Urgency(IntEnum):
+    """Nível de urgência do caso (ordenado: comparar com >=)"""
+    ROUTINE = 0
+    MODERATE = 1
+    URGENT = 2
+    
+    @classmethod
+    def parse(cls, label: str) -> "Urgency":
+        """Converte o rótulo da UI (com ou sem emoji) no nível; Rotina por omissão"""
+        return _URGENCY_LABELS.get(label.split()[-1] if label else "", cls.ROUTINE)
+
+
+_URGENCY_LABELS = {
+    "Rotina": Urgency.ROUTINE,
+    "Moderada": Urgency.MODERATE,
+    "Urgente": Urgency.URGENT,
+}
+
+
 @dataclass 
 class DiagnosisConfig:
     """Configuração do diagnóstico baseada na urgência"""
@@ -21,40 +62,63 @@ class DiagnosisConfig:
     knowledge_timeout: int = 20
     diagnosis_timeout: int = 60
     detailed_research: bool = True
+    # Imagens mais pequenas nos casos de rotina (menos tokens de imagem e bytes
+    # enviados); resolução total só nos urgentes
+    image_max_size: int = 768
+    image_quality: int = 80
     
     @classmethod
-    def for_urgency(cls, urgency: str) -> "DiagnosisConfig":
+    def for_urgency(cls, urgency: "Urgency | str") -> "DiagnosisConfig":
         """Retorna configuração otimizada para o nível de urgência"""
+        if not isinstance(urgency, Urgency):
+            urgency = Urgency.parse(urgency)
         configs = {
-            "🔴 Urgente": cls(
+            Urgency.URGENT: cls(
                 max_web_results=3,
                 vision_timeout=15,
                 knowledge_timeout=10,
                 diagnosis_timeout=30,
-                detailed_research=False  # Mais rápido
+                detailed_research=False,  # Mais rápido
+                image_max_size=1024,
+                image_quality=88
             ),
-            "🟡 Moderada": cls(
+            Urgency.MODERATE: cls(
                 max_web_results=5,
                 vision_timeout=25,
                 knowledge_timeout=15,
                 diagnosis_timeout=45,
-                detailed_research=True
+                detailed_research=True,
+                image_max_size=768,
+                image_quality=80
             ),
-            "🟢 Rotina": cls(
+            Urgency.ROUTINE: cls(
                 max_web_results=8,
                 vision_timeout=30,
                 knowledge_timeout=25,
                 diagnosis_timeout=60,
-                detailed_research=True
+                detailed_research=True,
+                image_max_size=512,
+                image_quality=70
             )
         }
-        return configs.get(urgency, configs["🟢 Rotina"])
+        return configs[urgency]
 
 
 # ============================================================
 # QUERY BUILDER VETERINÁRIO
 # ============================================================
 
+def _build_automaton(terms: dict):
+    """Compila os termos num autómato Aho-Corasick (None se indisponível)"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pt_term, en_terms in terms.items():
+        automaton.add_word(pt_term, (pt_term, en_terms))
+    automaton.make_automaton()
+    return automaton
+
+
 class VetQueryBuilder:
     """Constrói queries otimizadas para pesquisa veterinária"""
     
@@ -84,63 +148,89 @@ class VetQueryBuilder:
         "ouvido": ["otitis", "ear", "auricular"],
     }
     
+    # Todos os termos encontrados numa única passagem pelo texto
+    _AC = _build_automaton(MEDICAL_TERMS)
+    
     SPECIES_MAP = {
         "Cão": "canine dog",
         "Gato": "feline cat",
         "Outro": "veterinary animal",
     }
+    # Primeiro termo de cada espécie (canine, feline, ...)
+    _SPECIES_TOKEN = {k: v.split()[0] for k, v in SPECIES_MAP.items()}
+    
+    FOCUS_TERMS = {
+        "diagnosis": "differential diagnosis",
+        "treatment": "treatment therapy",
+        "emergency": "emergency urgent critical"
+    }
+    
+    # Heurísticas de idade
+    _YOUNG_TOKENS = frozenset({"filhote", "puppy", "kitten", "meses", "semanas"})
+    _SENIOR_TOKENS = frozenset({"senior", "idoso", "velho"})
+    _SENIOR_AGE_RE = re.compile(r"\b1[2-9]\s*anos\b")
     
     @classmethod
     def build_query(cls, case, focus: str = "diagnosis") -> str:
         """Constrói query otimizada para pesquisa veterinária"""
-        parts = []
-        
-        # 1. Espécie
-        species = cls.SPECIES_MAP.get(case.especie, "veterinary")
-        parts.append(species.split()[0])  # canine, feline, etc.
-        
-        # 2. Sintomas - converter para termos médicos ingleses
-        sintomas_lower = case.sintomas.lower()
-        medical_found = []
-        
+        # Pura sobre (espécie, sintomas, idade, foco) - memoizada
+        return _build_query_cached(case.especie, case.sintomas, case.idade, focus)
+
+
+@lru_cache(maxsize=1024)
+def _build_query_cached(especie: str, sintomas: str, idade: str, focus: str) -> str:
+    """Implementação de VetQueryBuilder.build_query (cache por caso)"""
+    cls = VetQueryBuilder
+    parts = []
+    
+    # 1. Espécie
+    parts.append(cls._SPECIES_TOKEN.get(especie, "veterinary"))  # canine, feline, etc.
+    
+    # 2. Sintomas - converter para termos médicos ingleses
+    sintomas_lower = sintomas.lower()
+    medical_found = []
+    
+    if cls._AC is not None:
+        seen = set()
+        for _, (pt_term, en_terms) in cls._AC.iter(sintomas_lower):
+            if pt_term not in seen:
+                seen.add(pt_term)
+                medical_found.extend(en_terms[:2])  # Max 2 termos por sintoma
+    else:
         for pt_term, en_terms in cls.MEDICAL_TERMS.items():
             if pt_term in sintomas_lower:
                 medical_found.extend(en_terms[:2])  # Max 2 termos por sintoma
-        
-        if medical_found:
-            # Usar termos médicos encontrados
-            parts.extend(list(set(medical_found))[:4])  # Deduplica, max 4
-        else:
-            # Fallback: usar "veterinary" + sintomas simplificados
-            parts.append("veterinary")
-            words = [w for w in case.sintomas.split()[:4] if len(w) > 3]
-            parts.extend(words)
-        
-        # 3. Foco da pesquisa
-        focus_terms = {
-            "diagnosis": "differential diagnosis",
-            "treatment": "treatment therapy",
-            "emergency": "emergency urgent critical"
-        }
-        parts.append(focus_terms.get(focus, "diagnosis"))
-        
-        # 4. Idade se relevante
-        idade_lower = case.idade.lower()
-        if any(t in idade_lower for t in ["filhote", "puppy", "kitten", "meses", "semanas"]):
-            parts.append("puppy" if case.especie == "Cão" else "kitten")
-        elif any(t in idade_lower for t in ["senior", "idoso", "velho", "12 anos", "13 anos", "14 anos", "15 anos"]):
-            parts.append("geriatric senior")
-        
-        return " ".join(parts)
+    
+    if medical_found:
+        # Usar termos médicos encontrados
+        parts.extend(list(set(medical_found))[:4])  # Deduplica, max 4
+    else:
+        # Fallback: usar "veterinary" + sintomas simplificados
+        parts.append("veterinary")
+        words = [w for w in sintomas.split()[:4] if len(w) > 3]
+        parts.extend(words)
+    
+    # 3. Foco da pesquisa
+    parts.append(cls.FOCUS_TERMS.get(focus, "diagnosis"))
+    
+    # 4. Idade se relevante
+    idade_lower = idade.lower()
+    idade_words = frozenset(re.findall(r"\w+", idade_lower))
+    if idade_words & cls._YOUNG_TOKENS:
+        parts.append("puppy" if especie == "Cão" else "kitten")
+    elif idade_words & cls._SENIOR_TOKENS or cls._SENIOR_AGE_RE.search(idade_lower):
+        parts.append("geriatric senior")
+    
+    return " ".join(parts)
 
 
 # ============================================================
 # DATACLASSES
 # ============================================================
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CaseInput:
-    """Input para um caso veterinário"""
+    """Input para um caso veterinário (imutável)"""
     especie: str
     raca: str = "Desconhecida"
     idade: str = "Desconhecida"
@@ -153,8 +243,14 @@ class CaseInput:
     image_paths: List[str] = field(default_factory=list)
     tipos_imagem: List[str] = field(default_factory=list)
     
-    def to_dict(self) -> dict:
-        return {
+    # Calculados uma vez em __post_init__ (o caso é imutável)
+    _dict: dict = field(init=False, repr=False, compare=False)
+    _cache_key: str = field(init=False, repr=False, compare=False)
+    urgency_level: Urgency = field(init=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, "urgency_level", Urgency.parse(self.urgencia))
+        object.__setattr__(self, "_dict", {
             "especie": self.especie,
             "raca": self.raca,
             "idade": self.idade,
@@ -163,12 +259,98 @@ class CaseInput:
             "castrado": self.castrado,
             "historico": self.historico,
             "urgencia": self.urgencia
-        }
+        })
+        content = f"{self.especie}:{self.sintomas}:{self.historico}"
+        object.__setattr__(self, "_cache_key", hashlib.md5(content.encode()).hexdigest()[:16])
+    
+    def to_dict(self) -> dict:
+        """Dados do animal (dicionário partilhado - não modificar)"""
+        return self._dict
     
     def get_cache_key(self) -> str:
         """Gera chave única para cache"""
-        content = f"{self.especie}:{self.sintomas}:{self.historico}"
-        return hashlib.md5(content.encode()).hexdigest()[:16]
+        return self._cache_key
+
+class DiagnosisStream:
+    """
+    Texto do diagnóstico em streaming.
+    
+    Iterável sobre as partes do texto; `results` fica preenchido com o
+    resultado completo do pipeline quando a iteração termina.
+    """
+    
+    def __init__(self, pipeline: Iterator[str]):
+        self._pipeline = pipeline
+        self.results: Optional[dict] = None
+    
+    def __iter__(self) -> Iterator[str]:
+        self.results = yield from self._pipeline
+
+
+# ============================================================
+# LOGGING
+# ============================================================
+
+_LOG_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+
+def _get_logger() -> logging.Logger:
+    """
+    Logger "vet" com escrita assíncrona.
+
+    O pipeline só coloca o registo numa fila (QueueHandler); a formatação
+    e a escrita no stdout correm na thread do QueueListener.
+    """
+    global _LOG_LISTENER
+
+    logger = logging.getLogger("vet")
+    if _LOG_LISTENER is None:
+        log_queue = queue.SimpleQueue()
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%H:%M:%S"))
+
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+        _LOG_LISTENER = logging.handlers.QueueListener(log_queue, stream)
+        _LOG_LISTENER.start()
+        atexit.register(_LOG_LISTENER.stop)
+    return logger
+
+
+# Texto de contingência (estático exceto os dados do caso)
+_URGENT_NOTICE = """
+⚠️ **CASO MARCADO COMO URGENTE**
+Recomenda-se procurar atendimento veterinário imediato.
+"""
+
+_FALLBACK_TMPL = Template("""
+## ⚠️ Diagnóstico de Contingência
+
+Devido a limitações técnicas temporárias, não foi possível gerar um diagnóstico detalhado.
+
+### Dados do Caso
+- **Animal:** ${especie} (${raca})
+- **Idade:** ${idade} | **Peso:** ${peso}
+
+### Sintomas Reportados
+${sintomas}
+
+${urgency_msg}
+
+### Recomendações Gerais
+
+1. **Consulte um médico veterinário presencialmente**
+2. Mantenha o animal em observação
+3. Registe qualquer alteração nos sintomas
+4. Garanta hidratação e conforto
+5. Não administre medicação sem orientação profissional
+
+---
+*Este é um diagnóstico de contingência. Consulte sempre um profissional veterinário.*
+""")
+
 
 class VetDiagnosisOrchestrator:
     """
@@ -183,18 +365,114 @@ class VetDiagnosisOrchestrator:
     """
     
     def __init__(self):
+        self._logger = _get_logger()
+        # Pool persistente para a pesquisa (evita criar threads a cada caso)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vet-knowledge")
+        # Um só cliente HTTP/2 com keep-alive para os agentes síncronos:
+        # as ligações TLS aos providers são reutilizadas entre passos e casos
+        # (a visão usa o cliente assíncrono partilhado do VisionAgent)
+        self._http = httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16,
+                keepalive_expiry=120.0
+            )
+        )
+        
         self.vision_agent = VisionAgent()
-        self.knowledge_agent = KnowledgeAgent()
-        self.diagnosis_agent = DiagnosisAgent()
+        self.knowledge_agent = KnowledgeAgent(http_client=self._http)
+        # Reutiliza o modelo de embeddings do RAG para o cache semântico
+        # (via lambda: o RAG só é carregado quando for preciso)
+        self.diagnosis_agent = DiagnosisAgent(
+            embed_fn=lambda text: self.knowledge_agent.rag_tool.embeddings.embed_query(text),
+            client=self._http
+        )
+        self.diagnosis_agent.prewarm()
+        
+        # Cache semântico de casos completos (espécie + sintomas), filtrado
+        # por espécie, urgência e imagens
+        self._case_cache = SemanticCache(
+            lambda text: self.knowledge_agent.rag_tool.embeddings.embed_query(text),
+            threshold=0.93,
+            ttl=3600.0
+        )
         
         self.case_history = []
+        
+        # Casos anteriores persistidos: histórico + cache semântico sem arranque a frio
+        self._case_store = CaseStore(settings.CASE_STORE_PATH)
+        self._restore_cases()
+    
+    def prewarm(self):
+        """
+        Prepara o sistema antes do primeiro caso (bloqueante: correr em background).
+        
+        Carrega o RAG (modelo de embeddings + coleção Chroma) e abre as
+        ligações do cliente de visão; o DiagnosisAgent já aquece as suas
+        no construtor.
+        """
+        t0 = time.time()
+        try:
+            self.knowledge_agent.rag_tool
+        except Exception as e:
+            self._log("⚠️", f"Aquecimento do RAG falhou: {str(e)[:50]}")
+        try:
+            run_sync(self.vision_agent.prewarm(), timeout=10.0)
+        except Exception:
+            pass  # Best-effort
+        self._log("🔥", f"Sistema aquecido ({int((time.time()-t0)*1000)}ms)")
+    
+    def _restore_cases(self):
+        """Recarrega casos do disco para o histórico e o cache semântico"""
+        try:
+            cases = self._case_store.load(limit=self._case_cache.capacity)
+        except Exception as e:
+            self._log("⚠️", f"Não foi possível carregar casos: {str(e)[:50]}")
+            return
+        
+        for _, tag, embedding, results, ts in cases:
+            self.case_history.append(results)
+            if embedding is not None:
+                self._case_cache.add("", results, tag=tag, vector=embedding, ts=ts)
+        
+        if cases:
+            self._log("💾", f"{len(cases)} casos anteriores carregados")
+    
+    @staticmethod
+    def _case_cache_tag(case: CaseInput) -> tuple:
+        """
+        Filtro exato do cache de casos: espécie, raça, idade, peso,
+        urgência e imagens (o histórico entra no texto embebido).
+        """
+        hasher = hashlib.blake2b(digest_size=16)
+        for path in case.image_paths:
+            try:
+                with open(path, 'rb') as f:
+                    hasher.update(f.read())
+            except OSError:
+                hasher.update(path.encode())
+        return (
+            case.especie,
+            case.raca.strip().lower(),
+            case.idade.strip().lower(),
+            case.peso.strip().lower(),
+            case.urgencia,
+            hasher.hexdigest()
+        )
     
     def _log(self, emoji: str, message: str):
-        """Logging formatado com timestamp"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] {emoji} {message}")
+        """Logging formatado com timestamp (formatado e escrito fora do pipeline)"""
+        self._logger.info("%s %s", emoji, message)
     
-    def run_diagnosis(self, case: CaseInput, vision_model: str = None, text_model: str = None) -> dict:
+    def run_diagnosis(
+        self,
+        case: CaseInput,
+        vision_model: str = None,
+        text_model: str = None,
+        use_cache: bool = True
+    ) -> dict:
         """
         Executa o pipeline completo de diagnóstico
         
@@ -202,11 +480,47 @@ class VetDiagnosisOrchestrator:
             case: Dados do caso clínico
             vision_model: Modelo para análise de imagens (opcional)
             text_model: Modelo para diagnóstico/texto (opcional)
+            use_cache: False ignora o cache de casos (força novo diagnóstico)
+        """
+        stream = DiagnosisStream(self._run_pipeline(case, vision_model, text_model, use_cache=use_cache))
+        for _ in stream:
+            pass
+        return stream.results
+    
+    def run_diagnosis_stream(
+        self,
+        case: CaseInput,
+        vision_model: str = None,
+        text_model: str = None,
+        use_cache: bool = True
+    ) -> "DiagnosisStream":
+        """
+        Executa o pipeline com o diagnóstico em streaming.
+        
+        Iterar o objeto devolvido produz o texto do diagnóstico à medida que
+        é gerado (ex: st.write_stream); no fim, `.results` tem o mesmo
+        dicionário que run_diagnosis devolveria.
+        """
+        return DiagnosisStream(self._run_pipeline(case, vision_model, text_model, stream=True, use_cache=use_cache))
+    
+    def _run_pipeline(
+        self,
+        case: CaseInput,
+        vision_model: str = None,
+        text_model: str = None,
+        stream: bool = False,
+        use_cache: bool = True
+    ) -> Iterator[str]:
+        """
+        Pipeline de diagnóstico (gerador).
+        
+        Com stream=True produz o texto do diagnóstico por partes; o valor de
+        retorno do gerador é o dicionário de resultados.
         """
         start_time = time.time()
         
         # Configuração baseada na urgência
-        config = DiagnosisConfig.for_urgency(case.urgencia)
+        config = DiagnosisConfig.for_urgency(case.urgency_level)
         
         self._log("🏥", f"Iniciando diagnóstico [{case.urgencia}]")
         self._log("🐾", f"{case.especie} - {case.raca} - {case.idade}")
@@ -215,29 +529,98 @@ class VetDiagnosisOrchestrator:
         if text_model:
             self._log("🧠", f"Modelo Texto: {text_model}")
         
+        # Caso semelhante já diagnosticado? (sintomas com outras palavras)
+        cache_text = f"{case.especie}|{case.historico}|{case.sintomas}"
+        cache_tag = self._case_cache_tag(case)
+        cache_vec = None
+        try:
+            cache_vec = self._case_cache.embed(cache_text)
+            cached = self._case_cache.lookup(cache_text, tag=cache_tag, vector=cache_vec) if use_cache else None
+        except Exception as e:
+            self._log("⚠️", f"Cache de casos indisponível: {str(e)[:50]}")
+            cached = None
+        
+        if cached is not None:
+            total_time = int((time.time() - start_time) * 1000)
+            self._log("⚡", f"Caso semelhante em cache ({total_time}ms)")
+            if stream:
+                yield cached.get("diagnosis", "")
+            # Diagnóstico reutilizado; dados do animal são sempre os do caso atual
+            return {
+                **cached,
+                "timestamp": datetime.now().isoformat(),
+                "case_info": case.to_dict(),
+                "symptoms": case.sintomas,
+                "urgency": case.urgencia,
+                "cache_hit": True,
+                "performance": {
+                    "total_ms": total_time,
+                    "total_seconds": round(total_time / 1000, 1)
+                }
+            }
+        
         results = {
             "timestamp": datetime.now().isoformat(),
             "case_info": case.to_dict(),
             "symptoms": case.sintomas,
             "urgency": case.urgencia,
+            "cache_hit": False,
             "steps": [],
             "performance": {}
         }
         
+        # Visão e pesquisa são independentes (ambas I/O de rede):
+        # lançadas em paralelo, resultados processados por ordem.
+        # A visão é assíncrona e corre diretamente no event loop partilhado
+        # (sem ocupar uma thread); a pesquisa (síncrona) vai para o pool.
+        
         # ════════════════════════════════════════════════════
         # PASSO 1: Análise de Imagem
         # ════════════════════════════════════════════════════
         self._log("📸", "Passo 1: Analisando imagens...")
         t1 = time.time()
-        
+        vision_future = None
         if case.image_paths:
-            try:
-                visual_result = self.vision_agent.analyze_image(
+            vision_future = asyncio.run_coroutine_threadsafe(
+                self.vision_agent.aanalyze_image(
                     image_paths=case.image_paths,
                     animal_info=case.to_dict(),
                     symptoms=case.sintomas,
-                    model=vision_model  # Passar modelo selecionado
-                )
+                    model=vision_model,  # Passar modelo selecionado
+                    max_size=config.image_max_size,
+                    quality=config.image_quality
+                ),
+                get_loop()
+            )
+        
+        # ════════════════════════════════════════════════════
+        # PASSO 2: Recolha de Conhecimento
+        # ════════════════════════════════════════════════════
+        self._log("📚", "Passo 2: Pesquisando informação...")
+        t2 = time.time()
+        
+        # Query otimizada com VetQueryBuilder
+        focus = "emergency" if case.urgency_level >= Urgency.URGENT else "diagnosis"
+        query = VetQueryBuilder.build_query(case, focus=focus)
+        self._log("🔍", f"Query: {query[:60]}...")
+        
+        # Pesquisa detalhada: variante de tratamento no mesmo lote RAG
+        extra_queries = None
+        if config.detailed_research:
+            extra_queries = [VetQueryBuilder.build_query(case, focus="treatment")]
+        
+        # A pesquisa não espera pela análise visual (query já inclui sintomas)
+        knowledge_future = self._executor.submit(
+            self.knowledge_agent.gather_knowledge,
+            query=query,
+            visual_analysis="",
+            extra_queries=extra_queries
+        )
+        
+        # Resultado da visão
+        if vision_future is not None:
+            try:
+                visual_result = vision_future.result()
                 results["visual_analysis"] = visual_result["visual_analysis"]
                 results["steps"].append({
                     "step": "vision_analysis",
@@ -263,22 +646,9 @@ class VetDiagnosisOrchestrator:
             })
             self._log("⚠️", "Nenhuma imagem fornecida")
         
-        # ════════════════════════════════════════════════════
-        # PASSO 2: Recolha de Conhecimento
-        # ════════════════════════════════════════════════════
-        self._log("📚", "Passo 2: Pesquisando informação...")
-        t2 = time.time()
-        
-        # Query otimizada com VetQueryBuilder
-        focus = "emergency" if "Urgente" in case.urgencia else "diagnosis"
-        query = VetQueryBuilder.build_query(case, focus=focus)
-        self._log("🔍", f"Query: {query[:60]}...")
-        
+        # Resultado da pesquisa
         try:
-            knowledge = self.knowledge_agent.gather_knowledge(
-                query=query,
-                visual_analysis=results["visual_analysis"]
-            )
+            knowledge = knowledge_future.result()
             
             web_found = len(knowledge.get("web_search", "")) > 0
             results["knowledge_gathered"] = {
@@ -314,27 +684,64 @@ class VetDiagnosisOrchestrator:
         self._log("🩺", "Passo 3: Gerando diagnóstico...")
         t3 = time.time()
         
+        parts = []
         try:
-            diagnosis = self.diagnosis_agent.generate_diagnosis(
-                animal_info=case.to_dict(),
-                symptoms=case.sintomas,
-                visual_analysis=results["visual_analysis"],
-                knowledge=knowledge,
-                model=text_model  # Passar modelo selecionado
-            )
+            if stream:
+                diagnosis_stream = self.diagnosis_agent.generate_diagnosis_stream(
+                    animal_info=case.to_dict(),
+                    symptoms=case.sintomas,
+                    visual_analysis=results["visual_analysis"],
+                    knowledge=knowledge,
+                    model=text_model,
+                    cfg=config
+                )
+                # O valor de retorno do gerador é o modelo que respondeu
+                while True:
+                    try:
+                        chunk = next(diagnosis_stream)
+                    except StopIteration as stop:
+                        model_used = stop.value
+                        break
+                    parts.append(chunk)
+                    yield chunk
+                diagnosis = {
+                    "diagnosis_report": "".join(parts),
+                    "diagnosis_structured": None,
+                    "model_used": model_used
+                }
+            else:
+                diagnosis = self.diagnosis_agent.generate_diagnosis(
+                    animal_info=case.to_dict(),
+                    symptoms=case.sintomas,
+                    visual_analysis=results["visual_analysis"],
+                    knowledge=knowledge,
+                    model=text_model,  # Passar modelo selecionado
+                    cfg=config
+                )
             results["diagnosis"] = diagnosis["diagnosis_report"]
+            results["diagnosis_structured"] = diagnosis.get("diagnosis_structured")
+            # model_used == "none": todos os providers falharam (texto de erro)
+            diagnosis_failed = diagnosis["model_used"] == "none"
             results["steps"].append({
                 "step": "diagnosis",
-                "status": "success",
+                "status": "failed" if diagnosis_failed else "success",
                 "model": diagnosis["model_used"],
                 "duration_ms": int((time.time() - t3) * 1000)
             })
-            self._log("✅", f"Diagnóstico gerado com {diagnosis['model_used']} ({int((time.time()-t3)*1000)}ms)")
+            if diagnosis_failed:
+                self._log("⚠️", "Diagnóstico falhou: nenhum provider respondeu")
+            else:
+                self._log("✅", f"Diagnóstico gerado com {diagnosis['model_used']} ({int((time.time()-t3)*1000)}ms)")
             
         except Exception as e:
             self._log("⚠️", f"Erro no diagnóstico: {str(e)[:50]}")
-            # Usar fallback
-            results["diagnosis"] = self._generate_fallback_diagnosis(case, results)
+            # Usar fallback (a seguir ao texto parcial, se já houver)
+            fallback = self._generate_fallback_diagnosis(case, results)
+            if parts:
+                fallback = "\n\n---\n\n" + fallback
+            if stream:
+                yield fallback
+            results["diagnosis"] = "".join(parts) + fallback
             results["steps"].append({
                 "step": "diagnosis",
                 "status": "fallback",
@@ -353,45 +760,31 @@ class VetDiagnosisOrchestrator:
         # Guardar no histórico
         self.case_history.append(results)
         
+        # Só diagnósticos completos, gerados por um modelo real (sem fallback
+        # nem texto de erro), entram no cache e levam embedding para o disco
+        diagnosis_ok = any(
+            step["step"] == "diagnosis" and step["status"] == "success"
+            and step.get("model") not in (None, "none")
+            for step in results["steps"]
+        )
+        cacheable = cache_vec is not None and diagnosis_ok
+        if cacheable:
+            self._case_cache.add(cache_text, dict(results), tag=cache_tag, vector=cache_vec)
+        self._case_store.put(
+            f"{case.get_cache_key()}:{results['timestamp']}",
+            results,
+            embedding=cache_vec if cacheable else None,
+            tag=cache_tag
+        )
+        
         self._log("🏁", f"Diagnóstico completo em {total_time}ms ({total_time/1000:.1f}s)")
         
         return results
     
     def _generate_fallback_diagnosis(self, case: CaseInput, partial_results: dict) -> str:
         """Gera um diagnóstico básico quando o principal falha"""
-        
-        urgency_msg = ""
-        if "Urgente" in case.urgencia:
-            urgency_msg = """
-⚠️ **CASO MARCADO COMO URGENTE**
-Recomenda-se procurar atendimento veterinário imediato.
-"""
-        
-        return f"""
-## ⚠️ Diagnóstico de Contingência
-
-Devido a limitações técnicas temporárias, não foi possível gerar um diagnóstico detalhado.
-
-### Dados do Caso
-- **Animal:** {case.especie} ({case.raca})
-- **Idade:** {case.idade} | **Peso:** {case.peso}
-
-### Sintomas Reportados
-{case.sintomas}
-
-{urgency_msg}
-
-### Recomendações Gerais
-
-1. **Consulte um médico veterinário presencialmente**
-2. Mantenha o animal em observação
-3. Registe qualquer alteração nos sintomas
-4. Garanta hidratação e conforto
-5. Não administre medicação sem orientação profissional
-
----
-*Este é um diagnóstico de contingência. Consulte sempre um profissional veterinário.*
-"""
+        urgency_msg = _URGENT_NOTICE if case.urgency_level >= Urgency.URGENT else ""
+        return _FALLBACK_TMPL.safe_substitute(case.to_dict(), sintomas=case.sintomas, urgency_msg=urgency_msg)
     
     def print_report(self, results: dict):
         """Imprime o relatório formatado"""
@@ -3,62 +3,290 @@ Agente de Visão - Analisa imagens veterinárias.
 Versão otimizada para performance.
 """
 
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import mmap
+import os
+import stat
+import threading
 import time
-from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+import httpx
 from PIL import Image
 from config.settings import settings
+from tools.async_runtime import run_sync
+
+
+# Buffer JPEG reutilizado por thread (evita um BytesIO novo por imagem)
+_local = threading.local()
+
+
+def _encode_one(img: Image.Image, quality: int = 80) -> str:
+    """Comprime uma imagem em JPEG e devolve-a em base64"""
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    # 4:2:0 e sem segunda passagem Huffman: codificação mais rápida
+    img.save(buffer, format='JPEG', quality=quality, subsampling=2, optimize=False, progressive=False)
+    with buffer.getbuffer() as view:  # sem cópia (getvalue)
+        return base64.b64encode(view).decode('ascii')
+
+
+# Identifica uma imagem no disco: (path, mtime_ns, tamanho, max_size, qualidade).
+# Uma nova submissão do mesmo ficheiro reaproveita a imagem já
+# redimensionada e o base64 em vez de repetir decode/resize/JPEG.
+ImageKey = tuple[str, int, int, int, int]
+
+
+@lru_cache(maxsize=32)
+def _load_optimized(path: str, mtime_ns: int, size: int, max_size: int) -> Image.Image:
+    """Abre e redimensiona uma imagem (cache por path/mtime/tamanho)"""
+    # Ficheiro mapeado em memória: o decoder lê da page cache, sem cópia
+    # para um buffer de leitura Python; os pixels são lidos antes de fechar
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        img = Image.open(mm)
+        img.load()
+    
+    # Converter para RGB se necessário
+    if img.mode in ('RGBA', 'P'):
+        img = img.convert('RGB')
+    
+    # Redimensionar se muito grande
+    if max(img.size) > max_size:
+        ratio = max_size / max(img.size)
+        new_size = tuple(int(dim * ratio) for dim in img.size)
+        img = img.resize(new_size, Image.LANCZOS)
+    
+    return img
+
+
+@lru_cache(maxsize=32)
+def _encode_cached(path: str, mtime_ns: int, size: int, max_size: int, quality: int) -> str:
+    """Base64 JPEG de uma imagem otimizada (cache pela mesma chave)"""
+    return _encode_one(_load_optimized(path, mtime_ns, size, max_size), quality)
+
+
+# Instruções fixas da análise visual. Enviadas como mensagem de sistema,
+# à frente do caso, para que o prefixo seja igual entre pedidos (prompt caching).
+SYSTEM_PROMPT = """És um veterinário experiente a analisar imagens clínicas.
+
+Com base nas imagens e na informação do animal enviada pelo utilizador,
+analisa cada imagem (identificadas por "Imagem 1:", "Imagem 2:", ...) e descreve:
+1. Observações visuais objetivas
+2. Localização das alterações
+3. Gravidade aparente (Leve/Moderada/Grave/Urgente)
+
+Sê conciso e objetivo.
+
+Responde APENAS com um objeto JSON válido, sem texto fora do JSON:
+{"per_image": [{"imagem": 1, "observacoes": "...", "localizacao": "...", "gravidade": "..."}],
+ "global": "síntese das alterações observadas no conjunto das imagens"}"""
+
+
+def _parse_analysis(text: str) -> Optional[dict]:
+    """Extrai o objeto JSON da resposta (None se não for JSON válido)"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _render_analysis(per_image: list, summary: str) -> str:
+    """Converte a análise estruturada em texto para o agente de diagnóstico"""
+    lines = []
+    for item in per_image:
+        details = " | ".join(
+            f"{label}: {item[key]}"
+            for key, label in (("localizacao", "Localização"), ("gravidade", "Gravidade"))
+            if item.get(key)
+        )
+        line = f"**Imagem {item.get('imagem', '?')}:** {item.get('observacoes', '')}"
+        lines.append(f"{line} ({details})" if details else line)
+    if summary:
+        lines.append(f"\n**Síntese:** {summary}")
+    return "\n".join(lines)
+
+
+# Hosts dos providers de visão - ligação aquecida no arranque
+_PREWARM_URLS = (
+    "https://generativelanguage.googleapis.com",
+    "https://api.mistral.ai",
+    "https://openrouter.ai",
+)
+
+
+# Provider por prefixo do nome do modelo: (prefixo, método, nome)
+_PROVIDER_DISPATCH = (
+    ("gemini", "_call_gemini", "Gemini"),
+    ("pixtral", "_call_mistral_vision", "Mistral"),
+)
+_PROVIDER_FALLBACK = ("_call_openrouter_vision", "OpenRouter")
+
+
+@lru_cache(maxsize=32)
+def _resolve_provider(model: str) -> tuple[str, str]:
+    """Devolve (método, nome do provider) para um modelo de visão"""
+    return next(
+        ((method, name) for prefix, method, name in _PROVIDER_DISPATCH if model.startswith(prefix)),
+        _PROVIDER_FALLBACK
+    )
 
 
 class VisionAgent:
     """Agente especializado em análise de imagens veterinárias"""
     
-    SUPPORTED_FORMATS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+    SUPPORTED_FORMATS = frozenset({'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'})
+    
+    # Todas as imagens seguem num único pedido (1 prefill + 1 decode em vez
+    # de N chamadas); acima deste limite dividem-se em lotes concorrentes
+    MAX_IMAGES_PER_CALL = 8
+    
+    # Cliente HTTP/2 partilhado por todas as instâncias (vive no loop de
+    # tools.async_runtime): reutiliza ligações TLS entre análises
+    _CLIENT: Optional[httpx.AsyncClient] = None
+    
+    # Pool para carregar/comprimir imagens em paralelo (o PIL liberta o GIL)
+    _POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+    
+    # Imagens já enviadas para a Gemini Files API: sha256(JPEG) -> (file_uri, expira).
+    # Reenvios do mesmo caso passam só o URI em vez do base64 inline.
+    # Os ficheiros expiram ao fim de 48h; o cache descarta-os antes (47h).
+    _GEMINI_FILES: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+    GEMINI_FILES_MAX = 256
+    GEMINI_FILES_TTL = 47 * 3600
     
     def __init__(self):
         pass  # Não precisa de inicialização pesada
     
+    @classmethod
+    def _client(cls) -> httpx.AsyncClient:
+        """Devolve o cliente assíncrono partilhado (criado no primeiro uso)"""
+        if cls._CLIENT is None:
+            cls._CLIENT = httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        return cls._CLIENT
+    
+    async def prewarm(self):
+        """Abre as ligações TLS/HTTP2 aos providers de visão (best-effort)"""
+        async def head(url: str):
+            try:
+                await self._client().head(url, timeout=5.0)
+            except Exception:
+                pass  # O pedido real volta a tentar
+        
+        await asyncio.gather(*(head(url) for url in _PREWARM_URLS))
+    
+    async def _encode_images(self, images: list[ImageKey]) -> list[str]:
+        """Converte as imagens para base64 em paralelo (reutiliza o cache)"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            loop.run_in_executor(self._POOL, _encode_cached, *key) for key in images
+        ))
+    
+    @staticmethod
+    def _max_tokens_for(n_images: int) -> int:
+        """Limite de saída proporcional ao número de imagens (evita truncar o JSON)"""
+        return min(4096, 500 + 400 * n_images)
+    
+    def _load_image(self, path: str, max_size: int = 800, quality: int = 80) -> Optional[ImageKey]:
+        """Valida e carrega uma imagem (devolve a chave de cache, None se inválida)"""
+        try:
+            print(f"   📂 Path recebido: {path}")
+            # Extensão primeiro (sem syscall), depois um único stat
+            if os.path.splitext(path)[1].lower() in self.SUPPORTED_FORMATS and (st := self._stat(path)):
+                t_load = time.perf_counter()
+                key = self._image_key(path, max_size, quality, st)
+                img = _load_optimized(*key[:4])
+                print(f"   📷 Imagem carregada: {os.path.basename(path)} ({img.size}) em {time.perf_counter()-t_load:.2f}s")
+                return key
+            print(f"   ⚠️ Path inválido ou formato não suportado: {path}")
+        except Exception as e:
+            print(f"   ⚠️ Erro ao carregar {path}: {e}")
+        return None
+    
+    @staticmethod
+    def _stat(path: str) -> Optional[os.stat_result]:
+        """stat de um ficheiro regular (None se não existir)"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st if stat.S_ISREG(st.st_mode) else None
+    
+    @staticmethod
+    def _image_key(
+        image_path: str,
+        max_size: int = 800,
+        quality: int = 80,
+        st: Optional[os.stat_result] = None
+    ) -> ImageKey:
+        """Chave de cache de uma imagem: muda se o ficheiro for alterado"""
+        st = st or os.stat(image_path)
+        return (os.path.abspath(image_path), st.st_mtime_ns, st.st_size, max_size, quality)
+    
     def _optimize_image(self, image_path: str, max_size: int = 800) -> Image.Image:
         """Otimiza imagem para upload rápido"""
-        img = Image.open(image_path)
-        
-        # Converter para RGB se necessário
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        
-        # Redimensionar se muito grande
-        if max(img.size) > max_size:
-            ratio = max_size / max(img.size)
-            new_size = tuple(int(dim * ratio) for dim in img.size)
-            img = img.resize(new_size, Image.LANCZOS)
-        
-        return img
+        return _load_optimized(*self._image_key(image_path, max_size)[:4])
     
     def analyze_image(
         self, 
         image_paths: list[str], 
         animal_info: dict,
         symptoms: str,
-        model: str = None  # Modelo opcional
+        model: str = None,  # Modelo opcional
+        max_size: int = None,
+        quality: int = None
+    ) -> dict:
+        """
+        Analisa imagens do animal e extrai observações clínicas.
+        
+        Args:
+            max_size: Lado maior das imagens enviadas (default: 800 px)
+            quality: Qualidade JPEG das imagens enviadas (default: 80)
+        """
+        # Versão síncrona: corre aanalyze_image no event loop partilhado
+        return run_sync(self.aanalyze_image(
+            image_paths, animal_info, symptoms, model, max_size, quality
+        ))
+    
+    async def aanalyze_image(
+        self, 
+        image_paths: list[str], 
+        animal_info: dict,
+        symptoms: str,
+        model: str = None,
+        max_size: int = None,
+        quality: int = None
     ) -> dict:
-        """Analisa imagens do animal e extrai observações clínicas."""
+        """Versão assíncrona de analyze_image"""
         
         t_start = time.perf_counter()
+        max_size = max_size or 800
+        quality = quality or 80
         
-        # Validar e carregar imagens
-        valid_images = []
-        for path in image_paths:
-            try:
-                print(f"   📂 Path recebido: {path}")
-                p = Path(path)
-                if p.exists() and p.suffix.lower() in self.SUPPORTED_FORMATS:
-                    t_load = time.perf_counter()
-                    img = self._optimize_image(path)
-                    valid_images.append(img)
-                    print(f"   📷 Imagem carregada: {p.name} ({img.size}) em {time.perf_counter()-t_load:.2f}s")
-                else:
-                    print(f"   ⚠️ Path inválido ou formato não suportado: {path}")
-            except Exception as e:
-                print(f"   ⚠️ Erro ao carregar {path}: {e}")
+        # Validar e carregar imagens (em paralelo)
+        loop = asyncio.get_running_loop()
+        loaded = await asyncio.gather(*(
+            loop.run_in_executor(self._POOL, self._load_image, path, max_size, quality)
+            for path in image_paths
+        ))
+        valid_images = [key for key in loaded if key is not None]
         
         if not valid_images:
             return {
@@ -69,23 +297,14 @@ class VisionAgent:
         t_loaded = time.perf_counter()
         print(f"   ⏱️ Imagens carregadas em {t_loaded - t_start:.2f}s")
         
-        # Criar prompt
-        prompt = f"""És um veterinário experiente a analisar imagens clínicas.
-
-**Informação do Animal:**
+        # Criar prompt (só a parte dinâmica; instruções em SYSTEM_PROMPT)
+        prompt = f"""**Informação do Animal:**
 - Espécie: {animal_info.get('especie', 'Não especificado')}
 - Raça: {animal_info.get('raca', 'Não especificado')}
 - Idade: {animal_info.get('idade', 'Não especificado')}
 - Peso: {animal_info.get('peso', 'Não especificado')}
 
-**Sintomas Reportados:** {symptoms}
-
-Analisa as imagens e descreve:
-1. Observações visuais objetivas
-2. Localização das alterações
-3. Gravidade aparente (Leve/Moderada/Grave/Urgente)
-
-Sê conciso e objetivo."""
+**Sintomas Reportados:** {symptoms}"""
 
         # Chamar API apropriada
         t_api = time.perf_counter()
@@ -93,34 +312,102 @@ Sê conciso e objetivo."""
         vision_model = model or settings.VLM_MODEL
         
         # Detectar provider pelo nome do modelo
-        if vision_model.startswith("gemini"):
-            response = self._call_gemini(prompt, valid_images, vision_model)
-            api_name = "Gemini"
-        elif vision_model.startswith("pixtral"):
-            response = self._call_mistral_vision(prompt, valid_images, vision_model)
-            api_name = "Mistral"
-        else:
-            # Fallback: OpenRouter
-            response = self._call_openrouter_vision(prompt, valid_images, vision_model)
-            api_name = "OpenRouter"
+        method, api_name = _resolve_provider(vision_model)
+        call = getattr(self, method)
+        
+        # Lotes de até MAX_IMAGES_PER_CALL imagens, enviados em paralelo
+        step = self.MAX_IMAGES_PER_CALL
+        responses = await asyncio.gather(*(
+            call(prompt, valid_images[i:i + step], vision_model, first=i + 1)
+            for i in range(0, len(valid_images), step)
+        ))
         
         t_done = time.perf_counter()
         
-        print(f"   ⏱️ API {api_name}: {t_done - t_api:.2f}s")
+        print(f"   ⏱️ API {api_name} ({len(responses)} pedido(s)): {t_done - t_api:.2f}s")
         print(f"   ⏱️ Total visão: {t_done - t_start:.2f}s")
         
+        # Juntar os lotes; respostas não-JSON (ex: erros) seguem como texto
+        per_image, summaries = [], []
+        for batch_no, response in enumerate(responses):
+            data = _parse_analysis(response)
+            if data is None:
+                summaries.append(response)
+                continue
+            for pos, item in enumerate(data.get("per_image") or [], start=batch_no * step + 1):
+                item = item if isinstance(item, dict) else {"observacoes": str(item)}
+                item.setdefault("imagem", pos)
+                per_image.append(item)
+            if data.get("global"):
+                summaries.append(str(data["global"]))
+        
+        summary = "\n\n".join(summaries)
+        
         return {
-            "visual_analysis": response,
+            "visual_analysis": _render_analysis(per_image, summary) if per_image else summary,
+            "per_image": per_image,
             "images_analyzed": len(valid_images),
             "model_used": vision_model
         }
     
-    def _call_gemini(self, prompt: str, images: list[Image.Image], model: str = None) -> str:
-        """Chama Gemini Vision API via HTTP direto (mais rápido)"""
-        import base64
-        import io
-        import httpx
+    async def _upload_to_gemini_files(self, img_bytes: bytes) -> str:
+        """
+        Envia uma imagem JPEG para a Gemini Files API (upload resumable).
+        
+        Returns:
+            URI do ficheiro, para usar em partes "file_data"
+        """
+        base_url = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+        start = await self._client().post(
+            base_url,
+            params={"key": settings.GOOGLE_API_KEY},
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(len(img_bytes)),
+                "X-Goog-Upload-Header-Content-Type": "image/jpeg",
+            },
+            json={"file": {"display_name": "vet-image"}},
+            timeout=15.0
+        )
+        start.raise_for_status()
+        
+        upload = await self._client().post(
+            start.headers["x-goog-upload-url"],
+            headers={
+                "X-Goog-Upload-Offset": "0",
+                "X-Goog-Upload-Command": "upload, finalize",
+            },
+            content=img_bytes,
+            timeout=30.0
+        )
+        upload.raise_for_status()
+        return upload.json()["file"]["uri"]
+    
+    async def _gemini_file_uri(self, b64: str) -> Optional[str]:
+        """URI da imagem na Files API (envia no primeiro uso; None se falhar)"""
+        digest = hashlib.sha256(b64.encode()).hexdigest()
+        now = time.time()
+        
+        cached = self._GEMINI_FILES.get(digest)
+        if cached and cached[1] > now:
+            self._GEMINI_FILES.move_to_end(digest)
+            return cached[0]
         
+        try:
+            uri = await self._upload_to_gemini_files(base64.b64decode(b64))
+        except Exception as e:
+            print(f"      [Gemini] Upload falhou, imagem segue inline: {type(e).__name__}: {e}")
+            return None
+        
+        self._GEMINI_FILES[digest] = (uri, now + self.GEMINI_FILES_TTL)
+        self._GEMINI_FILES.move_to_end(digest)
+        while len(self._GEMINI_FILES) > self.GEMINI_FILES_MAX:
+            self._GEMINI_FILES.popitem(last=False)
+        return uri
+    
+    async def _call_gemini(self, prompt: str, images: list[ImageKey], model: str = None, first: int = 1) -> str:
+        """Chama Gemini Vision API via HTTP direto (mais rápido)"""
         t0 = time.perf_counter()
         
         # Usar modelo passado ou default
@@ -134,30 +421,35 @@ Sê conciso e objetivo."""
         # Debug: mostrar primeiros caracteres da key (seguro)
         print(f"      [Gemini] API Key presente: {api_key[:10]}...{api_key[-4:] if len(api_key) > 14 else ''}")
         
-        # Converter imagens para base64
-        image_parts = []
-        for img in images:
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=80)
-            b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            image_parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": b64
-                }
-            })
+        # Converter imagens para base64 (cada uma precedida do seu marcador)
+        encoded = await self._encode_images(images)
         print(f"      [Gemini] Images to base64: {time.perf_counter()-t0:.2f}s")
         
+        # Referência Files API quando disponível; senão base64 inline
+        uris = await asyncio.gather(*(self._gemini_file_uri(b64) for b64 in encoded))
+        image_parts = []
+        for n, (b64, uri) in enumerate(zip(encoded, uris), start=first):
+            media = (
+                {"file_data": {"mime_type": "image/jpeg", "file_uri": uri}} if uri
+                else {"inline_data": {"mime_type": "image/jpeg", "data": b64}}
+            )
+            image_parts += [{"text": f"Imagem {n}:"}, media]
+        print(f"      [Gemini] Files API: {sum(1 for u in uris if u)}/{len(uris)} por referência")
+        
         # Construir request - usar modelo selecionado
         url = f"https://generativelanguage.googleapis.com/v1beta/models/{vision_model}:generateContent?key={settings.GOOGLE_API_KEY}"
         
         payload = {
+            "systemInstruction": {
+                "parts": [{"text": SYSTEM_PROMPT}]
+            },
             "contents": [{
                 "parts": [{"text": prompt}] + image_parts
             }],
             "generationConfig": {
-                "maxOutputTokens": 2048,
-                "temperature": 0.3
+                "maxOutputTokens": self._max_tokens_for(len(images)),
+                "temperature": 0.3,
+                "responseMimeType": "application/json"
             }
         }
         
@@ -165,9 +457,8 @@ Sê conciso e objetivo."""
         print(f"      [Gemini] Sending HTTP request...")
         
         try:
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(url, json=payload)
-                response.raise_for_status()
+            response = await self._client().post(url, json=payload, timeout=30.0)
+            response.raise_for_status()
                 
             result = response.json()
             
@@ -210,52 +501,51 @@ Sê conciso e objetivo."""
             print(f"      [Gemini] Exception: {type(e).__name__}: {e}")
             return f"Erro na análise: {type(e).__name__}: {str(e)}"
 
-    def _call_mistral_vision(self, prompt: str, images: list, model: str) -> str:
+    async def _call_mistral_vision(self, prompt: str, images: list[ImageKey], model: str, first: int = 1) -> str:
         """Chama Mistral Vision API (Pixtral)"""
-        import base64
-        import io
-        import httpx
-        
         t0 = time.perf_counter()
         
         # Converter imagens para base64 com formato URL data
         image_content = []
-        for img in images:
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=80)
-            b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            image_content.append({
-                "type": "image_url",
-                "image_url": f"data:image/jpeg;base64,{b64}"
-            })
+        for n, b64 in enumerate(await self._encode_images(images), start=first):
+            image_content += [
+                {"type": "text", "text": f"Imagem {n}:"},
+                {
+                    "type": "image_url",
+                    "image_url": f"data:image/jpeg;base64,{b64}"
+                }
+            ]
         
         print(f"      [Mistral] Images to base64: {time.perf_counter()-t0:.2f}s")
         
         # Construir mensagem com imagens + texto
-        messages = [{
-            "role": "user",
-            "content": image_content + [{"type": "text", "text": prompt}]
-        }]
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": image_content + [{"type": "text", "text": prompt}]
+            }
+        ]
         
         t1 = time.perf_counter()
         print(f"      [Mistral] Sending request to {model}...")
         
         try:
-            with httpx.Client(timeout=60.0) as client:
-                response = client.post(
-                    "https://api.mistral.ai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.MISTRAL_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "max_tokens": 1500,
-                        "temperature": 0.2
-                    }
-                )
-                response.raise_for_status()
+            response = await self._client().post(
+                "https://api.mistral.ai/v1/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.MISTRAL_API_KEY}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "max_tokens": self._max_tokens_for(len(images)),
+                    "temperature": 0.2,
+                    "response_format": {"type": "json_object"}
+                }
+            )
+            response.raise_for_status()
             
             result = response.json()
             text = result["choices"][0]["message"]["content"]
@@ -267,56 +557,63 @@ Sê conciso e objetivo."""
         except Exception as e:
             return f"Erro na análise: {str(e)}"
 
-    def _call_openrouter_vision(self, prompt: str, images: list, model: str) -> str:
+    async def _call_openrouter_vision(self, prompt: str, images: list[ImageKey], model: str, first: int = 1) -> str:
         """Chama OpenRouter Vision API para modelos como Qwen"""
-        import base64
-        import io
-        import httpx
-        
         t0 = time.perf_counter()
         
         # Converter imagens para base64 com formato URL data
         image_content = []
-        for img in images:
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=80)
-            b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            image_content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{b64}"
+        for n, b64 in enumerate(await self._encode_images(images), start=first):
+            image_content += [
+                {"type": "text", "text": f"Imagem {n}:"},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{b64}"
+                    }
                 }
-            })
+            ]
         
         print(f"      [OpenRouter] Images to base64: {time.perf_counter()-t0:.2f}s")
         
         # Construir mensagem com imagens + texto
-        messages = [{
-            "role": "user",
-            "content": image_content + [{"type": "text", "text": prompt}]
-        }]
+        messages = [
+            {
+                "role": "system",
+                "content": [{
+                    "type": "text",
+                    "text": SYSTEM_PROMPT,
+                    # Providers com prefix caching (ex: Anthropic) reutilizam este bloco
+                    "cache_control": {"type": "ephemeral"}
+                }]
+            },
+            {
+                "role": "user",
+                "content": image_content + [{"type": "text", "text": prompt}]
+            }
+        ]
         
         t1 = time.perf_counter()
         print(f"      [OpenRouter] Sending request to {model}...")
         
         try:
-            with httpx.Client(timeout=60.0) as client:
-                response = client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                        "Content-Type": "application/json",
-                        "HTTP-Referer": "http://localhost",
-                        "X-Title": "VetVision"
-                    },
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "max_tokens": 1500,
-                        "temperature": 0.2
-                    }
-                )
-                response.raise_for_status()
+            response = await self._client().post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+                    "Content-Type": "application/json",
+                    "HTTP-Referer": "http://localhost",
+                    "X-Title": "VetVision"
+                },
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "max_tokens": self._max_tokens_for(len(images)),
+                    "temperature": 0.2,
+                    "response_format": {"type": "json_object"}
+                }
+            )
+            response.raise_for_status()
             
             result = response.json()
             text = result["choices"][0]["message"]["content"]
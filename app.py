@@ -2,21 +2,46 @@
 # ============================================================
 
 # Suprimir warnings
+# (simplefilter por categoria: sem regex a compilar em cada rerun)
 import warnings
-warnings.filterwarnings("ignore", category=FutureWarning)
-warnings.filterwarnings("ignore", category=DeprecationWarning)
+warnings.simplefilter("ignore", FutureWarning)
+warnings.simplefilter("ignore", DeprecationWarning)
 warnings.filterwarnings("ignore", message=".*duckduckgo.*")
 warnings.filterwarnings("ignore", message=".*LangChain.*")
 
 import streamlit as st
 from datetime import datetime
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
+from collections import OrderedDict
+import hashlib
+import io
 import json
 import tempfile
 import os
+import queue
+import re
+import threading
+import time
+
+# orjson (opcional): serialização mais rápida do resultado
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from PIL import Image, ImageOps
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx
+except ImportError:
+    add_script_run_ctx = None
 
-from agents.orchestrator import VetDiagnosisOrchestrator, CaseInput
 from config.settings import settings
+from tools.case_store import CaseStore
+
+# Só para anotações: o orchestrator é importado no primeiro uso
+if TYPE_CHECKING:
+    from agents.orchestrator import CaseInput
 
 # ============================================================
 # CONFIGURAÇÃO DA PÁGINA
@@ -31,7 +56,10 @@ st.set_page_config(
 # ============================================================
 # CSS MODERNO (cores corrigidas para a11y)
 # ============================================================
-st.markdown("""
+@st.cache_data(show_spinner=False)
+def _css() -> str:
+    """Bloco de estilos da página (construído uma vez, reutilizado em cada rerun)"""
+    return """
 <style>
 /* === VARIÁVEIS === */
 :root {
@@ -261,7 +289,8 @@ header {visibility: hidden;}
     background: linear-gradient(135deg, #0d9488 0%, #0f766e 100%) !important;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
 
 # ============================================================
 # CONFIGURAÇÕES / DADOS
@@ -315,6 +344,52 @@ SINTOMAS = {
     "Movimento": ["Claudicação", "Rigidez", "Dor ao mover"]
 }
 
+# Imagens de exemplo (seletor e processamento usam a mesma tabela)
+_EXAMPLE_IMAGES_RAW = {
+    "🐱 Gato - Uveíte": "images/cat-with-Uveitis-compressed.jpg",
+    "🐱 Gato - Prolapso 3ª Pálpebra": "images/cat-with-Prolapsed-Third-Eyelids-compressed.jpg",
+    "🐱 Gato - Conjuntivite": "images/cat-with-infectious-conjunctivitis-compressed.jpg",
+    "🐱 Gato - Cataratas": "images/adorable-fluffy-Siberian-with-cataracts-compressed.jpg",
+    "🐕 Cão - Dermatite Atópica": "images/Dermatite_atpica.jpg",
+}
+
+
+@st.cache_resource
+def _exemplos_disponiveis() -> dict[str, str]:
+    """Exemplos cujo ficheiro existe (verificado uma vez por processo)"""
+    return {k: v for k, v in _EXAMPLE_IMAGES_RAW.items() if os.path.exists(v)}
+
+
+EXAMPLE_IMAGES = _exemplos_disponiveis()
+
+# Chaves (session_state) dos seletores de sintomas comuns
+SINT_KEYS = ("sint_gerais", "sint_digestivos", "sint_respiratorios", "sint_pele", "sint_movimento")
+
+# Uploads guardados por hash do conteúdo (partilhados entre reruns e sessões)
+IMAGE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "vet_images")
+IMAGE_CACHE_MAX = 64
+
+# Barra de progresso: duração esperada inicial (s) e peso da média móvel
+DURACAO_INICIAL = 30.0
+DURACAO_ALPHA = 0.3
+
+# Dados técnicos: tamanho máximo de cada campo de texto mostrado no JSON
+JSON_CAMPO_MAX = 50_000
+
+# Opções dos seletores (calculadas uma vez)
+VISION_MODEL_KEYS = tuple(VISION_MODELS)
+TEXT_MODEL_KEYS = tuple(TEXT_MODELS)
+ESPECIES_KEYS = tuple(ESPECIES)
+RACAS_BY_ESPECIE = {k: tuple(v["racas"]) for k, v in ESPECIES.items()}
+EXAMPLE_CHOICES = ("Nenhuma",) + tuple(EXAMPLE_IMAGES)
+URGENCIA_OPCOES = ("🟢 Rotina", "🟡 Moderada", "🔴 Urgente")
+
+# Remoção do emoji da urgência ("🟢 Rotina" -> "Rotina") numa só passagem
+URGENCIA_TABLE = str.maketrans("", "", "🟢🟡🔴")
+
+# Nome curto do modelo ("google/gemini-2.0-flash-exp:free" -> "gemini-2.0-flash-exp")
+_MODELO_CURTO = re.compile(r"[^/:]+(?=(?::[^/]*)?$)")
+
 # ============================================================
 # INICIALIZAÇÃO DO SISTEMA
 # ============================================================
@@ -322,9 +397,89 @@ SINTOMAS = {
 @st.cache_resource
 def get_vet_system():
     """Inicializa o sistema de diagnóstico (cached)"""
-    return VetDiagnosisOrchestrator()
+    # Import tardio: o orquestrador puxa LangChain/Chroma/embeddings, que
+    # não são precisos para mostrar o formulário
+    from agents.orchestrator import VetDiagnosisOrchestrator
+    orchestrator = VetDiagnosisOrchestrator()
+    orchestrator.prewarm()
+    return orchestrator
+
+
+@st.cache_resource(show_spinner=False)
+def aquecer_sistema() -> threading.Thread:
+    """
+    Constrói o sistema numa thread em background (uma vez por processo).
+    
+    O primeiro clique em "Analisar" já não paga a inicialização; se chegar
+    antes do fim, o get_vet_system espera pela mesma instância.
+    """
+    thread = threading.Thread(target=get_vet_system, name="vet-warmup", daemon=True)
+    if add_script_run_ctx is not None:
+        add_script_run_ctx(thread)
+    thread.start()
+    return thread
+
 
-vet_system = get_vet_system()
+aquecer_sistema()
+
+
+class CacheDiagnosticos:
+    """
+    Resultados por chave exata do caso, em dois níveis:
+    - L1: memória do processo (TTL + capacidade máxima, LRU)
+    - L2: SQLite em disco (sobrevive a reinícios da app), validade 7 dias
+    """
+    
+    def __init__(
+        self,
+        ttl: float = 24 * 3600,
+        max_entries: int = 256,
+        disk_path: Optional[str] = None,
+        disk_ttl: float = 7 * 24 * 3600
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_ttl = disk_ttl
+        self._dados: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disco = None
+        if disk_path:
+            try:
+                self._disco = CaseStore(disk_path, flush_every=1)
+            except Exception as e:
+                print(f"⚠️ Cache em disco indisponível: {e}")
+    
+    def get(self, chave: str) -> Optional[dict]:
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is not None and time.time() - entrada[0] <= self.ttl:
+                self._dados.move_to_end(chave)
+                return entrada[1]
+        
+        if self._disco is None:
+            return None
+        results = self._disco.get(chave, max_age=self.disk_ttl)
+        if results is not None:
+            self._guardar_l1(chave, results)
+        return results
+    
+    def put(self, chave: str, results: dict):
+        self._guardar_l1(chave, results)
+        if self._disco is not None:
+            self._disco.put(chave, results)
+    
+    def _guardar_l1(self, chave: str, results: dict):
+        with self._lock:
+            self._dados[chave] = (time.time(), results)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_entries:
+                self._dados.popitem(last=False)
+
+
+@st.cache_resource
+def get_cache_diagnosticos() -> CacheDiagnosticos:
+    """Cache de respostas partilhado entre sessões (ex: imagens de exemplo)"""
+    return CacheDiagnosticos(disk_path=settings.RESPONSE_CACHE_PATH)
 
 # ============================================================
 # FUNÇÕES AUXILIARES
@@ -343,30 +498,142 @@ def validar_caso(especie: str, idade: str, peso: str, sintomas: str) -> tuple[bo
     return True, ""
 
 
+def resultado_json(results: dict, indent: bool = False) -> str:
+    """Serializa o resultado do diagnóstico para JSON"""
+    if orjson is not None:
+        opcoes = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(results, default=str, option=opcoes).decode()
+    return json.dumps(results, ensure_ascii=False, default=str, indent=2 if indent else None)
+
+
+def truncar_resultado(results: dict, limite: int = JSON_CAMPO_MAX) -> dict:
+    """Cópia do resultado com os campos de texto longos (ex: research) truncados"""
+    return {
+        k: v[:limite] + "…" if isinstance(v, str) and len(v) > limite else v
+        for k, v in results.items()
+    }
+
+
+def mostrar_stream(stream, placeholder, intervalo: float = 0.05) -> str:
+    """
+    Mostra o texto em streaming num placeholder.
+    
+    Os chunks são agrupados e o placeholder só é atualizado a cada
+    `intervalo` segundos (evita uma mensagem para o browser por token).
+    
+    Returns:
+        Texto completo
+    """
+    texto = ""
+    ultimo = 0.0
+    for chunk in stream:
+        texto += chunk
+        agora = time.monotonic()
+        if agora - ultimo >= intervalo:
+            placeholder.markdown(texto + "▌")
+            ultimo = agora
+    placeholder.markdown(texto)
+    return texto
+
+
+class _ErroWorker:
+    """Exceção levantada na thread de trabalho (relançada na principal)"""
+    
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def iterar_em_segundo_plano(iteravel, ao_esperar, intervalo: float = 0.1):
+    """
+    Consome um iterável numa thread de trabalho através de uma queue.Queue.
+    
+    A thread principal (a do Streamlit) só lê da fila: enquanto não chegam
+    itens chama `ao_esperar` a cada `intervalo` segundos, para atualizar a
+    barra de progresso sem bloquear a inferência.
+    
+    Args:
+        iteravel: Iterável a consumir (ex: stream do diagnóstico)
+        ao_esperar: Função chamada sem argumentos enquanto a fila está vazia
+        intervalo: Tempo máximo de espera por item (segundos)
+    
+    Yields:
+        Itens do iterável, pela mesma ordem
+    """
+    fila: queue.Queue = queue.Queue()
+    fim = object()
+    
+    def trabalhar():
+        try:
+            for item in iteravel:
+                fila.put(item)
+        except BaseException as e:
+            fila.put(_ErroWorker(e))
+        finally:
+            fila.put(fim)
+    
+    threading.Thread(target=trabalhar, name="vet-diagnostico", daemon=True).start()
+    
+    while True:
+        try:
+            item = fila.get(timeout=intervalo)
+        except queue.Empty:
+            ao_esperar()
+            continue
+        if item is fim:
+            return
+        if isinstance(item, _ErroWorker):
+            raise item.exc
+        yield item
+
+
+def chave_diagnostico(case: "CaseInput", vision_model_id: str, text_model_id: str) -> str:
+    """SHA-256 do caso, dos modelos e do conteúdo das imagens"""
+    dados = {
+        "caso": case.to_dict(),
+        "sintomas": case.sintomas,
+        "modelos": [vision_model_id, text_model_id]
+    }
+    h = hashlib.sha256(json.dumps(dados, sort_keys=True, ensure_ascii=False).encode())
+    for path in case.image_paths:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+# Resumo do caso: prefixo/sufixo fixos e uma linha da tabela por campo
+_RESUMO_PREFIXO = '<div class="case-summary"><table>'
+_RESUMO_LINHA = "<tr><td>{}</td><td>{}</td></tr>"
+_RESUMO_SUFIXO = (
+    '</table><div style="margin-top: 0.75rem; padding-top: 0.75rem; '
+    'border-top: 1px solid #99f6e4;"><strong>Sintomas:</strong> {}</div></div>'
+)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
 def criar_resumo_html(especie: str, raca: str, idade: str, peso: str, 
                       sexo: str, castrado: bool, sintomas: str) -> str:
     """Cria HTML do resumo do caso"""
     icon = ESPECIES.get(especie, {}).get("icon", "🐾")
-    castrado_txt = "Sim" if castrado else "Não"
+    campos = (
+        (f"{icon} Espécie", especie),
+        ("Raça", raca or "N/A"),
+        ("Idade", idade),
+        ("Peso", f"{peso} kg"),
+        ("Sexo", sexo),
+        ("Castrado", "Sim" if castrado else "Não"),
+    )
+    linhas = "".join([_RESUMO_LINHA.format(nome, valor) for nome, valor in campos])
     sintomas_preview = sintomas[:200] + '...' if len(sintomas) > 200 else sintomas
-    
-    return f"""
-    <div class="case-summary">
-        <table>
-            <tr><td>{icon} Espécie</td><td>{especie}</td></tr>
-            <tr><td>Raça</td><td>{raca or 'N/A'}</td></tr>
-            <tr><td>Idade</td><td>{idade}</td></tr>
-            <tr><td>Peso</td><td>{peso} kg</td></tr>
-            <tr><td>Sexo</td><td>{sexo}</td></tr>
-            <tr><td>Castrado</td><td>{castrado_txt}</td></tr>
-        </table>
-        <div style="margin-top: 0.75rem; padding-top: 0.75rem; border-top: 1px solid #99f6e4;">
-            <strong>Sintomas:</strong> {sintomas_preview}
-        </div>
-    </div>
-    """
+    return _RESUMO_PREFIXO + linhas + _RESUMO_SUFIXO.format(sintomas_preview)
+
+
+def nome_modelo_curto(model_id: str) -> str:
+    """Último segmento do ID do modelo, sem o sufixo de variante (":free")"""
+    m = _MODELO_CURTO.search(model_id)
+    return m.group() if m else model_id
 
 
+@st.cache_data(max_entries=64, show_spinner=False)
 def criar_badges_html(tempo_ms: Optional[float], vision_model: str, text_model: str) -> str:
     """Cria HTML dos badges de performance e modelos"""
     badges = []
@@ -376,11 +643,11 @@ def criar_badges_html(tempo_ms: Optional[float], vision_model: str, text_model:
         badges.append(f'<span class="perf-badge">⏱️ {segundos:.1f}s</span>')
     
     if vision_model:
-        vision_short = vision_model.split("/")[-1].split(":")[0]
+        vision_short = nome_modelo_curto(vision_model)
         badges.append(f'<span class="model-badge">👁️ {vision_short}</span>')
     
     if text_model:
-        text_short = text_model.split("/")[-1].split(":")[0]
+        text_short = nome_modelo_curto(text_model)
         badges.append(f'<span class="model-badge">🧠 {text_short}</span>')
     
     if badges:
@@ -389,25 +656,77 @@ def criar_badges_html(tempo_ms: Optional[float], vision_model: str, text_model:
 
 
 def processar_imagem(uploaded_file) -> Optional[str]:
-    """Processa imagem uploaded e retorna path temporário"""
+    """
+    Processa imagem uploaded e retorna path temporário
+    
+    Imagens grandes (> 400 KB) são reduzidas a 1024 px e recodificadas em
+    JPEG q=85 antes de seguirem para o modelo de visão. O ficheiro é nomeado
+    pelo hash do conteúdo: a mesma imagem reenviada reutiliza o mesmo path
+    (e os caches que dependem dele). A pasta guarda no máximo
+    IMAGE_CACHE_MAX imagens (as mais antigas são apagadas).
+    """
     if uploaded_file is None:
         return None
     
-    # Criar arquivo temporário
     suffix = os.path.splitext(uploaded_file.name)[1] or ".jpg"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(uploaded_file.getvalue())
-        return tmp.name
+    
+    # memoryview sobre o upload (sem copiar os bytes); libertado no fim
+    view = uploaded_file.getbuffer()
+    try:
+        dados = view
+        if view.nbytes > 400 * 1024:
+            try:
+                uploaded_file.seek(0)
+                img = ImageOps.exif_transpose(Image.open(uploaded_file))
+                img.thumbnail((1024, 1024), Image.LANCZOS)
+                buffer = io.BytesIO()
+                img.convert("RGB").save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+                dados, suffix = buffer.getvalue(), ".jpg"
+            except Exception:
+                pass  # Formato que o PIL não lê: enviar original
+        
+        digest = hashlib.sha256(dados).hexdigest()[:32]
+        path = os.path.join(IMAGE_CACHE_DIR, f"{digest}{suffix}")
+        if not os.path.exists(path):
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile(delete=False, dir=IMAGE_CACHE_DIR, suffix=".tmp") as tmp:
+                tmp.write(dados)
+            os.replace(tmp.name, path)  # Escrita atómica
+            limpar_cache_imagens()
+    finally:
+        view.release()
+    return path
+
+def limpar_cache_imagens():
+    """Apaga as imagens mais antigas da pasta de uploads (acima de IMAGE_CACHE_MAX)"""
+    try:
+        entradas = sorted(os.scandir(IMAGE_CACHE_DIR), key=lambda e: e.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for entrada in entradas[IMAGE_CACHE_MAX:]:
+        try:
+            os.remove(entrada.path)
+        except OSError:
+            pass  # Já removida por outra sessão
 
 
 def executar_diagnostico(
     especie: str, raca: str, idade: str, peso: str, sexo: str, 
     castrado: bool, historico: str, sintomas_texto: str,
-    sintomas_selecionados: list, image_path: Optional[str],
+    sintomas_selecionados: list, image_paths: list[str],
     urgencia: str, vision_model_id: str, text_model_id: str,
-    progress_callback
+    progress_callback,
+    stream_callback=None,
+    usar_cache: bool = True
 ) -> dict:
-    """Executa o diagnóstico completo"""
+    """
+    Executa o diagnóstico completo
+    
+    Se stream_callback for dado, recebe o iterável com o texto do
+    diagnóstico (para mostrar à medida que é gerado). Casos idênticos
+    (mesmos dados, modelos e imagens) vêm do cache, exceto com
+    usar_cache=False.
+    """
     
     # Combinar sintomas
     sintomas_final = sintomas_texto
@@ -415,15 +734,13 @@ def executar_diagnostico(
         sintomas_final += f". Sintomas selecionados: {', '.join(sintomas_selecionados)}"
     
     # Mapear urgência (remover emojis)
-    mapa_urgencia = {
-        "🟢 Rotina": "Rotina",
-        "🟡 Moderada": "Moderada", 
-        "🔴 Urgente": "Urgente"
-    }
-    nivel_urgencia = mapa_urgencia.get(urgencia, "Rotina")
+    nivel_urgencia = urgencia.translate(URGENCIA_TABLE).strip() or "Rotina"
     
     progress_callback(10, "Preparando análise...")
     
+    from agents.orchestrator import CaseInput
+    vet_system = get_vet_system()
+    
     # Criar caso
     case = CaseInput(
         especie=especie,
@@ -435,17 +752,61 @@ def executar_diagnostico(
         historico=historico or "",
         sintomas=sintomas_final,
         urgencia=nivel_urgencia,
-        image_paths=[image_path] if image_path else []
+        image_paths=list(image_paths)
     )
     
     progress_callback(30, "Analisando dados clínicos...")
     
-    # Executar diagnóstico
-    results = vet_system.run_diagnosis(
-        case, 
-        vision_model=vision_model_id, 
-        text_model=text_model_id
-    )
+    cache = get_cache_diagnosticos()
+    chave = chave_diagnostico(case, vision_model_id, text_model_id)
+    results = cache.get(chave) if usar_cache else None
+    
+    # Executar diagnóstico (numa thread de trabalho; a barra de progresso
+    # avança pelo tempo decorrido face à média móvel das últimas execuções)
+    if results is not None:
+        pass  # Caso idêntico já diagnosticado
+    else:
+        inicio = time.monotonic()
+        duracao_media = st.session_state.get("duracao_media", DURACAO_INICIAL)
+        
+        def avancar():
+            fracao = min((time.monotonic() - inicio) / duracao_media, 0.98)
+            progress_callback(30 + int(60 * fracao), "Analisando dados clínicos...")
+        
+        if stream_callback is not None:
+            stream = vet_system.run_diagnosis_stream(
+                case,
+                vision_model=vision_model_id,
+                text_model=text_model_id,
+                use_cache=usar_cache
+            )
+            stream_callback(iterar_em_segundo_plano(stream, avancar))
+            results = stream.results
+        else:
+            def diagnosticar():
+                yield vet_system.run_diagnosis(
+                    case, 
+                    vision_model=vision_model_id, 
+                    text_model=text_model_id,
+                    use_cache=usar_cache
+                )
+            results, = iterar_em_segundo_plano(diagnosticar(), avancar)
+        
+        # EMA das durações (guardada por sessão)
+        duracao = time.monotonic() - inicio
+        st.session_state["duracao_media"] = (
+            (1 - DURACAO_ALPHA) * duracao_media + DURACAO_ALPHA * duracao
+        )
+        
+        # Só diagnósticos executados agora e completos (sem fallback nem
+        # falha de todos os providers) ficam em cache; um acerto não é
+        # regravado (não renova o ts do disco)
+        if not results.get("cache_hit") and any(
+            s["step"] == "diagnosis" and s["status"] == "success"
+            and s.get("model") not in (None, "none")
+            for s in results.get("steps", [])
+        ):
+            cache.put(chave, results)
     
     progress_callback(90, "Gerando relatório...")
     
@@ -470,19 +831,19 @@ if "processando" not in st.session_state:
 # HEADER
 # ============================================================
 
-st.markdown("""
+_HEADER_HTML = """
 <div class="app-header">
     <h1>🐾 Vet Agents</h1>
     <p>Sistema inteligente de apoio ao diagnóstico veterinário</p>
 </div>
-""", unsafe_allow_html=True)
-
-st.markdown("""
 <div class="disclaimer">
     <strong>⚠️ Aviso:</strong> Este sistema é uma ferramenta de apoio e não substitui 
     a consulta presencial com um médico veterinário qualificado.
 </div>
-""", unsafe_allow_html=True)
+"""
+
+# CSS + cabeçalho + aviso num único elemento
+st.markdown(_css() + _HEADER_HTML, unsafe_allow_html=True)
 
 # ============================================================
 # DEBUG: VERIFICAR API KEYS (sidebar)
@@ -529,7 +890,7 @@ with col_form:
     with col_vm:
         vision_model = st.selectbox(
             "👁️ Modelo de Visão (imagens)",
-            options=list(VISION_MODELS.keys()),
+            options=VISION_MODEL_KEYS,
             index=0,
             help="Usado para analisar imagens",
             key="vision_model"
@@ -537,7 +898,7 @@ with col_form:
     with col_tm:
         text_model = st.selectbox(
             "🧠 Modelo de Texto (diagnóstico)",
-            options=list(TEXT_MODELS.keys()),
+            options=TEXT_MODEL_KEYS,
             index=0,
             help="Usado para gerar o diagnóstico",
             key="text_model"
@@ -550,13 +911,13 @@ with col_form:
     with col_esp:
         especie = st.selectbox(
             "Espécie",
-            options=list(ESPECIES.keys()),
+            options=ESPECIES_KEYS,
             index=0,
             key="especie"
         )
     with col_raca:
         # Atualizar raças dinamicamente baseado na espécie
-        racas_disponiveis = ESPECIES[especie]["racas"]
+        racas_disponiveis = RACAS_BY_ESPECIE[especie]
         raca = st.selectbox(
             "Raça",
             options=racas_disponiveis,
@@ -605,62 +966,55 @@ with col_form:
     
     # Sintomas comuns (expansível)
     with st.expander("➕ Selecionar sintomas comuns"):
-        sintomas_selecionados = []
-        
         col_s1, col_s2 = st.columns(2)
         with col_s1:
-            sel_gerais = st.multiselect("Gerais", SINTOMAS["Gerais"], key="sint_gerais")
-            sel_digestivos = st.multiselect("Digestivos", SINTOMAS["Digestivos"], key="sint_digestivos")
-            sel_respiratorios = st.multiselect("Respiratórios", SINTOMAS["Respiratórios"], key="sint_respiratorios")
+            st.multiselect("Gerais", SINTOMAS["Gerais"], key="sint_gerais")
+            st.multiselect("Digestivos", SINTOMAS["Digestivos"], key="sint_digestivos")
+            st.multiselect("Respiratórios", SINTOMAS["Respiratórios"], key="sint_respiratorios")
         with col_s2:
-            sel_pele = st.multiselect("Pele", SINTOMAS["Pele"], key="sint_pele")
-            sel_movimento = st.multiselect("Movimento", SINTOMAS["Movimento"], key="sint_movimento")
-        
-        sintomas_selecionados = sel_gerais + sel_digestivos + sel_respiratorios + sel_pele + sel_movimento
+            st.multiselect("Pele", SINTOMAS["Pele"], key="sint_pele")
+            st.multiselect("Movimento", SINTOMAS["Movimento"], key="sint_movimento")
     
     # === IMAGENS ===
     st.markdown('<div class="section-title" style="margin-top: 1rem;">📷 Imagens</div>', unsafe_allow_html=True)
     
     # Imagens de exemplo
     st.markdown("**Imagens de exemplo para teste:**")
-    example_images = {
-        "🐱 Gato - Uveíte": "images/cat-with-Uveitis-compressed.jpg",
-        "🐱 Gato - Prolapso 3ª Pálpebra": "images/cat-with-Prolapsed-Third-Eyelids-compressed.jpg",
-        "🐱 Gato - Conjuntivite": "images/cat-with-infectious-conjunctivitis-compressed.jpg",
-        "🐱 Gato - Cataratas": "images/adorable-fluffy-Siberian-with-cataracts-compressed.jpg",
-        "🐕 Cão - Dermatite Atópica": "images/Dermatite_atpica.jpg",
-    }
-    
     col_ex1, col_ex2 = st.columns(2)
     selected_example = None
     
     with col_ex1:
         example_choice = st.selectbox(
             "Selecionar imagem de exemplo",
-            options=["Nenhuma"] + list(example_images.keys()),
+            options=EXAMPLE_CHOICES,
             key="example_image"
         )
     
     # Mostrar preview da imagem de exemplo
     if example_choice != "Nenhuma":
-        example_path = example_images[example_choice]
-        if os.path.exists(example_path):
-            selected_example = example_path
-            st.image(example_path, caption=f"Exemplo: {example_choice}", use_container_width=True)
+        example_path = EXAMPLE_IMAGES[example_choice]
+        selected_example = example_path
+        st.image(example_path, caption=f"Exemplo: {example_choice}", use_container_width=True)
     
-    uploaded_image = st.file_uploader(
-        "Ou faça upload da sua imagem",
+    # Várias imagens seguem juntas num único pedido ao modelo de visão
+    uploaded_images = st.file_uploader(
+        "Ou faça upload das suas imagens",
         type=["jpg", "jpeg", "png", "webp"],
+        accept_multiple_files=True,
         key="image_upload"
     )
     
-    if uploaded_image:
-        st.image(uploaded_image, caption="Imagem carregada", use_container_width=True)
+    if uploaded_images:
+        st.image(
+            uploaded_images,
+            caption=[f"Imagem {i}" for i in range(1, len(uploaded_images) + 1)],
+            use_container_width=True
+        )
     
     # Urgência
     urgencia = st.radio(
         "Nível de urgência",
-        options=["🟢 Rotina", "🟡 Moderada", "🔴 Urgente"],
+        options=URGENCIA_OPCOES,
         horizontal=True,
         key="urgencia"
     )
@@ -668,6 +1022,11 @@ with col_form:
     # === BOTÃO DE ANÁLISE ===
     st.write("")  # Spacing
     btn_analisar = st.button("🔍 Analisar Caso", type="primary", use_container_width=True)
+    forcar_novo = st.checkbox(
+        "🔄 Forçar nova análise (ignorar cache)",
+        key="forcar_novo",
+        help="Repete as chamadas aos modelos mesmo para um caso já analisado"
+    )
     st.caption("⏱️ A análise pode demorar entre 20 a 90 segundos, dependendo da complexidade do caso.")
 
 
@@ -693,49 +1052,40 @@ if btn_analisar:
             st.error(f"⚠️ {erro}")
             st.warning("Por favor, preencha todos os campos obrigatórios.")
     else:
-        # Processar imagem - priorizar upload, depois exemplo
-        image_path = processar_imagem(uploaded_image)
+        # Processar imagens - priorizar uploads, depois exemplo
+        image_paths = [p for p in map(processar_imagem, uploaded_images or []) if p]
         
         # Se não há upload mas há exemplo selecionado, usar exemplo
-        if not image_path and 'example_image' in st.session_state:
+        if not image_paths and 'example_image' in st.session_state:
             example_choice = st.session_state.example_image
             if example_choice != "Nenhuma":
-                example_images = {
-                    "🐱 Gato - Uveíte": "images/cat-with-Uveitis-compressed.jpg",
-                    "🐱 Gato - Prolapso 3ª Pálpebra": "images/cat-with-Prolapsed-Third-Eyelids-compressed.jpg",
-                    "🐱 Gato - Conjuntivite": "images/cat-with-infectious-conjunctivitis-compressed.jpg",
-                    "🐱 Gato - Cataratas": "images/adorable-fluffy-Siberian-with-cataracts-compressed.jpg",
-                    "🐕 Cão - Dermatite Atópica": "images/Dermatite_atpica.jpg",
-                }
-                example_path = example_images.get(example_choice)
-                if example_path and os.path.exists(example_path):
-                    image_path = example_path
+                example_path = EXAMPLE_IMAGES.get(example_choice)
+                if example_path:
+                    image_paths = [example_path]
         
         # Obter IDs dos modelos
         vision_model_id = VISION_MODELS.get(vision_model, settings.VLM_MODEL)
         text_model_id = TEXT_MODELS.get(text_model, settings.LLM_OPENROUTER_1)
         
         # Coletar sintomas selecionados
-        todos_sintomas = []
-        if 'sint_gerais' in st.session_state:
-            todos_sintomas.extend(st.session_state.sint_gerais)
-        if 'sint_digestivos' in st.session_state:
-            todos_sintomas.extend(st.session_state.sint_digestivos)
-        if 'sint_respiratorios' in st.session_state:
-            todos_sintomas.extend(st.session_state.sint_respiratorios)
-        if 'sint_pele' in st.session_state:
-            todos_sintomas.extend(st.session_state.sint_pele)
-        if 'sint_movimento' in st.session_state:
-            todos_sintomas.extend(st.session_state.sint_movimento)
+        todos_sintomas = [s for k in SINT_KEYS for s in st.session_state.get(k, ())]
         
         with col_results:
             # Progress bar
             progress_bar = st.progress(0, text="Iniciando análise...")
             status_text = st.empty()
             
+            stream_box = st.empty()
+            
             def update_progress(value: int, text: str):
                 progress_bar.progress(value, text=text)
             
+            def render_stream(stream):
+                # Mostrar o diagnóstico enquanto é gerado
+                with stream_box.container():
+                    st.markdown("### 🩺 Diagnóstico e Recomendações")
+                    mostrar_stream(stream, st.empty())
+            
             try:
                 # Executar diagnóstico
                 resultado = executar_diagnostico(
@@ -748,11 +1098,13 @@ if btn_analisar:
                     historico=historico,
                     sintomas_texto=sintomas_texto,
                     sintomas_selecionados=todos_sintomas,
-                    image_path=image_path,
+                    image_paths=image_paths,
                     urgencia=urgencia,
                     vision_model_id=vision_model_id,
                     text_model_id=text_model_id,
-                    progress_callback=update_progress
+                    progress_callback=update_progress,
+                    stream_callback=render_stream,
+                    usar_cache=not forcar_novo
                 )
                 
                 progress_bar.progress(100, text="Concluído! ✅")
@@ -767,12 +1119,13 @@ if btn_analisar:
                 st.session_state.resultado["castrado"] = castrado
                 
                 # Limpar progress após sucesso
-                import time
                 time.sleep(0.5)
                 progress_bar.empty()
+                stream_box.empty()  # Relatório completo é mostrado abaixo
                 
             except Exception as e:
                 progress_bar.empty()
+                stream_box.empty()
                 st.error(f"❌ Erro durante a análise")
                 st.code(str(e), language="text")
                 st.session_state.resultado = None
@@ -846,8 +1199,10 @@ with col_results:
         """, unsafe_allow_html=True)
         
         # Dados técnicos (JSON)
+        # (só serializado a pedido: o conteúdo do expander é gerado mesmo fechado)
         with st.expander("🔧 Dados técnicos (JSON)"):
-            st.json(results)
+            if st.checkbox("Mostrar JSON", key="show_json"):
+                st.code(resultado_json(truncar_resultado(results), indent=True), language="json")
     
     elif not btn_analisar:
         # Mensagem inicial quando não há resultado
@@ -1,4 +1,6 @@
 import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from pathlib import Path
 
 # Carregar variáveis de ambiente do .env (para desenvolvimento local)
@@ -9,103 +11,75 @@ try:
 except ImportError:
     pass
 
+def _get(key: str, default: str = "") -> str:
+    """Obtém valor do Streamlit secrets ou env vars"""
+    # 1. Tentar Streamlit secrets
+    try:
+        import streamlit as st
+        if hasattr(st, 'secrets') and key in st.secrets:
+            return str(st.secrets[key])
+    except Exception:
+        pass
+    
+    # 2. Fallback para variáveis de ambiente
+    return os.getenv(key, default)
+
+
+@dataclass(frozen=True)
 class Settings:
     """
     Configurações com suporte a Streamlit Secrets e variáveis de ambiente.
-    Os secrets são lidos dinamicamente (não no import time).
+    Cada chave é lida uma única vez (em _load); depois são atributos simples.
+    Os valores por omissão abaixo aplicam-se quando a chave não existe.
     """
     
-    @staticmethod
-    def _get(key: str, default: str = "") -> str:
-        """Obtém valor do Streamlit secrets ou env vars"""
-        # 1. Tentar Streamlit secrets
-        try:
-            import streamlit as st
-            if hasattr(st, 'secrets') and key in st.secrets:
-                return str(st.secrets[key])
-        except Exception:
-            pass
-        
-        # 2. Fallback para variáveis de ambiente
-        return os.getenv(key, default)
-    
-    # === API Keys (propriedades dinâmicas) ===
-    @property
-    def GOOGLE_API_KEY(self) -> str:
-        return self._get("GOOGLE_API_KEY", "")
-    
-    @property
-    def OPENROUTER_API_KEY(self) -> str:
-        return self._get("OPENROUTER_API_KEY", "")
-    
-    @property
-    def MISTRAL_API_KEY(self) -> str:
-        return self._get("MISTRAL_API_KEY", "")
-    
-    @property
-    def HUGGINGFACE_API_KEY(self) -> str:
-        return self._get("HUGGINGFACE_API_KEY", "")
-    
-    @property
-    def TOGETHER_API_KEY(self) -> str:
-        return self._get("TOGETHER_API_KEY", "")
+    # === API Keys ===
+    GOOGLE_API_KEY: str = ""
+    OPENROUTER_API_KEY: str = ""
+    MISTRAL_API_KEY: str = ""
+    HUGGINGFACE_API_KEY: str = ""
+    TOGETHER_API_KEY: str = ""
     
     # === VLM Models ===
-    @property
-    def VLM_MODEL(self) -> str:
-        return self._get("VLM_MODEL", "gemini-2.5-flash")
-    
-    @property
-    def VLM_BACKUP(self) -> str:
-        return self._get("VLM_BACKUP", "gemini-2.5-flash-lite")
-    
-    @property
-    def VLM_BACKUP_2(self) -> str:
-        return self._get("VLM_BACKUP_2", "pixtral-12b-2409")
+    VLM_MODEL: str = "gemini-2.5-flash"
+    VLM_BACKUP: str = "gemini-2.5-flash-lite"
+    VLM_BACKUP_2: str = "pixtral-12b-2409"
     
     # === LLM Models ===
-    @property
-    def LLM_MODEL(self) -> str:
-        return self._get("LLM_MODEL", "gemini-2.5-pro")
-    
-    @property
-    def LLM_BACKUP(self) -> str:
-        return self._get("LLM_BACKUP", "mistral-small-latest")
-    
-    @property
-    def LLM_OPENROUTER_1(self) -> str:
-        return self._get("LLM_OPENROUTER_1", "x-ai/grok-4.1-fast:free")
-    
-    @property
-    def LLM_OPENROUTER_2(self) -> str:
-        return self._get("LLM_OPENROUTER_2", "tngtech/deepseek-r1t-chimera:free")
-    
-    @property
-    def LLM_OPENROUTER_3(self) -> str:
-        return self._get("LLM_OPENROUTER_3", "google/gemma-3-27b-it:free")
-    
-    @property
-    def LLM_OPENROUTER_4(self) -> str:
-        return self._get("LLM_OPENROUTER_4", "z-ai/glm-4.5-air:free")
+    LLM_MODEL: str = "gemini-2.5-pro"
+    LLM_BACKUP: str = "mistral-small-latest"
+    LLM_OPENROUTER_1: str = "x-ai/grok-4.1-fast:free"
+    LLM_OPENROUTER_2: str = "tngtech/deepseek-r1t-chimera:free"
+    LLM_OPENROUTER_3: str = "google/gemma-3-27b-it:free"
+    LLM_OPENROUTER_4: str = "z-ai/glm-4.5-air:free"
     
     # === Embeddings ===
-    @property
-    def EMBEDDING_MODEL(self) -> str:
-        return self._get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-    
-    @property
-    def GOOGLE_EMBEDDING_MODEL(self) -> str:
-        return self._get("GOOGLE_EMBEDDING_MODEL", "text-embedding-004")
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # 'onnx' (int8) só com coleção reconstruída
+    GOOGLE_EMBEDDING_MODEL: str = "text-embedding-004"
     
     # === Paths ===
-    @property
-    def CHROMA_PATH(self) -> str:
-        return self._get("CHROMA_PATH", "./knowledge_base/chroma_db")
-    
-    @property
-    def DOCS_PATH(self) -> str:
-        return self._get("DOCS_PATH", "./knowledge_base/documents")
+    CHROMA_PATH: str = "./knowledge_base/chroma_db"
+    DOCS_PATH: str = "./knowledge_base/documents"
+    CASE_STORE_PATH: str = "./knowledge_base/cases.db"
+    RESPONSE_CACHE_PATH: str = "./knowledge_base/responses.db"
+    
+    # === Cache da pesquisa web ===
+    SEARCH_CACHE_MAX: int = 512
+    SEARCH_CACHE_TTL: float = 3600.0        # fresco (s)
+    SEARCH_CACHE_STALE_TTL: float = 21600.0  # servido e revalidado em fundo (s)
+    
+    # === DuckDuckGo ===
+    DDG_PROXY: str = ""          # ex: "socks5h://127.0.0.1:9150" (vazio = sem proxy)
+    DDG_MAX_RETRIES: int = 3     # tentativas em rate limit (RatelimitException)
+
+
+@lru_cache(maxsize=1)
+def _load() -> Settings:
+    """Resolve todas as configurações (secrets/env) uma vez"""
+    # Valores vêm como texto; converter para o tipo do campo (int, float, str)
+    return Settings(**{f.name: f.type(_get(f.name, f.default)) for f in fields(Settings)})
 
 
 # Instância global
-settings = Settings()
+settings = _load()
@@ -0,0 +1,44 @@
+"""
+Event loop partilhado para chamadas assíncronas a partir de código síncrono.
+
+Funcionalidades:
+- Um único event loop persistente numa thread daemon
+- Clientes assíncronos (ex: httpx.AsyncClient) mantêm o pool de ligações
+  entre chamadas, ao contrário de asyncio.run (novo loop a cada chamada)
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Devolve o event loop partilhado (arranca-o no primeiro uso)"""
+    global _loop
+
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name="async-runtime",
+                daemon=True
+            ).start()
+    return _loop
+
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Executa uma corrotina no loop partilhado e espera pelo resultado.
+
+    Args:
+        coro: Corrotina a executar
+        timeout: Tempo máximo de espera em segundos
+
+    Returns:
+        Resultado da corrotina
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
@@ -0,0 +1,176 @@
+"""
+Persistência de casos diagnosticados (SQLite).
+
+Funcionalidades:
+- Escrita em lote: os casos acumulam num buffer em memória e são gravados
+  a cada N casos ou no fim do processo (atexit)
+- SQLite em modo WAL com synchronous=NORMAL (commits rápidos)
+- Guarda o embedding do caso para reconstruir o cache semântico no arranque
+- Resultados serializados com orjson (opcional) e guardados como bytes
+"""
+
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Hashable, Optional
+
+import numpy as np
+
+# orjson (opcional): serialização ~3-5x mais rápida, devolve bytes diretamente
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj) -> bytes:
+    """Serializa para JSON em bytes (valores não suportados via str)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode()
+
+
+# Aceitam str (linhas antigas) e bytes
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+class CaseStore:
+    """
+    Armazenamento persistente de resultados de diagnóstico.
+
+    Tabela `cases(key, tag, embedding, results_json, ts)`: o embedding é
+    guardado como BLOB float32 e a etiqueta (filtro do cache) como JSON.
+    """
+
+    def __init__(self, path: str, flush_every: int = 16):
+        """
+        Args:
+            path: Caminho do ficheiro SQLite
+            flush_every: Número de casos em buffer antes de gravar
+        """
+        self.path = Path(path)
+        self.flush_every = flush_every
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._buffer: list[tuple] = []
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cases (
+                key TEXT PRIMARY KEY,
+                tag TEXT,
+                embedding BLOB,
+                results_json TEXT,
+                ts REAL
+            )"""
+        )
+        self._conn.commit()
+
+        # Gravar o que ficar em buffer quando o processo terminar
+        atexit.register(self.flush)
+
+    def put(
+        self,
+        key: str,
+        results: dict,
+        embedding: Optional[np.ndarray] = None,
+        tag: Hashable = None
+    ):
+        """
+        Adiciona um caso ao buffer (gravado no próximo flush).
+
+        Args:
+            key: Identificador único do caso
+            results: Resultado completo do diagnóstico
+            embedding: Embedding do caso (para o cache semântico)
+            tag: Etiqueta de filtro do cache semântico
+        """
+        row = (
+            key,
+            _dumps(tag),
+            None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes(),
+            _dumps(results),  # gravado como BLOB, sem decode
+            time.time()
+        )
+        with self._lock:
+            self._buffer.append(row)
+            should_flush = len(self._buffer) >= self.flush_every
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Grava o buffer numa única transação"""
+        with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?)", rows
+                )
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """
+        Resultado guardado para uma chave exata.
+        
+        Args:
+            key: Identificador do caso
+            max_age: Idade máxima em segundos (None = sem limite)
+        
+        Returns:
+            Resultado ou None (inexistente ou expirado)
+        """
+        with self._lock:
+            # Entradas ainda em buffer (mais recentes primeiro)
+            row = next((r for r in reversed(self._buffer) if r[0] == key), None)
+            if row is not None:
+                results_json, ts = row[3], row[4]
+            else:
+                found = self._conn.execute(
+                    "SELECT results_json, ts FROM cases WHERE key = ?", (key,)
+                ).fetchone()
+                if found is None:
+                    return None
+                results_json, ts = found
+        
+        if max_age is not None and time.time() - ts > max_age:
+            return None
+        return _loads(results_json)
+    
+    def load(self, limit: int = 1000) -> list[tuple]:
+        """
+        Carrega os casos mais recentes (mais antigo primeiro).
+
+        Returns:
+            Lista de (key, tag, embedding ou None, results, ts)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, tag, embedding, results_json, ts FROM cases "
+                "ORDER BY ts DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+        cases = []
+        for key, tag, embedding, results_json, ts in reversed(rows):
+            tag = _loads(tag)
+            cases.append((
+                key,
+                tuple(tag) if isinstance(tag, list) else tag,
+                None if embedding is None else np.frombuffer(embedding, dtype=np.float32),
+                _loads(results_json),
+                ts
+            ))
+        return cases
+
+    def close(self):
+        """Grava o buffer e fecha a ligação"""
+        self.flush()
+        self._conn.close()
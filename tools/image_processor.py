@@ -11,11 +11,30 @@ Funcionalidades:
 
 import base64
 import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Optional, Union
-from PIL import Image, ImageEnhance, ImageFilter, ExifTags
+import numpy as np
+from PIL import Image, ImageFilter, ExifTags
 import hashlib
+import logging
+
+try:
+    from numba import njit, prange  # opcional
+except ImportError:
+    njit = None
+
+# Mensagens por imagem (filho do logger "vet")
+log = logging.getLogger("vet.images")
+
+# xxhash (opcional): hash não criptográfico muito mais rápido que MD5
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 
 @dataclass
@@ -32,6 +51,52 @@ class ImageInfo:
     exif: Optional[dict] = None
 
 
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _enhance_kernel(arr, smooth, pivot, gain):
+        """Nitidez (1.2), contraste (1.1, em torno de pivot) e brilho (gain) por pixel"""
+        h, w, c = arr.shape
+        out = np.empty_like(arr)
+        a = np.float32(1.1 * gain)
+        b = np.float32(pivot * gain - pivot * 1.1 * gain)
+        for i in prange(h):
+            for j in range(w):
+                for k in range(c):
+                    v = np.float32(1.2) * arr[i, j, k] - np.float32(0.2) * smooth[i, j, k]
+                    v = a * v + b
+                    out[i, j, k] = 0 if v < 0 else (255 if v > 255 else np.uint8(v))
+        return out
+else:
+    def _enhance_kernel(arr, smooth, pivot, gain):
+        """Nitidez (1.2), contraste (1.1, em torno de pivot) e brilho (gain) por pixel"""
+        out = arr.astype(np.float32)
+        out *= 1.2
+        out -= 0.2 * smooth.astype(np.float32)
+        out -= pivot
+        out *= 1.1 * gain
+        out += pivot * gain
+        np.clip(out, 0, 255, out=out)
+        return out.astype(np.uint8)
+
+
+def _process_one(
+    processor: "ImageProcessor",
+    path: Union[str, Path],
+    keep_pil: bool = False
+) -> tuple:
+    """
+    Processa uma imagem num processo do pool (nível de módulo: picklable).
+    
+    Returns:
+        (info, base64, mime_type, PIL.Image ou None) ou a exceção levantada
+    """
+    try:
+        info, img, b64, mime = processor.process_image(path, return_encoded=True, validate=False)
+        return info, b64, mime, img if keep_pil else None
+    except Exception as e:
+        return e
+
+
 class ImageProcessor:
     """
     Processador de imagens otimizado para VLMs.
@@ -52,6 +117,9 @@ class ImageProcessor:
         'default': {'max_size': 1120, 'max_file_mb': 10}
     }
     
+    # Resolução usada para estimar o brilho médio
+    BRIGHTNESS_SAMPLE = (64, 64)
+    
     def __init__(
         self,
         target_vlm: str = 'default',
@@ -69,10 +137,19 @@ class ImageProcessor:
         self.enhance_images = enhance_images
         self.max_size = self.limits['max_size']
     
-    def validate_image(self, image_path: Union[str, Path]) -> tuple[bool, str]:
+    def validate_image(
+        self,
+        image_path: Union[str, Path],
+        verify: bool = True
+    ) -> tuple[bool, str]:
         """
         Valida se uma imagem é suportada.
         
+        Args:
+            image_path: Caminho para a imagem
+            verify: Se deve também abrir e verificar a imagem (com False só
+                verifica existência, extensão e tamanho; o load falha depois)
+        
         Returns:
             (is_valid, message)
         """
@@ -91,6 +168,9 @@ class ImageProcessor:
         if file_size_mb > self.limits['max_file_mb']:
             return False, f"Ficheiro muito grande: {file_size_mb:.1f}MB (max: {self.limits['max_file_mb']}MB)"
         
+        if not verify:
+            return True, "Imagem válida"
+        
         # Tentar abrir a imagem
         try:
             with Image.open(path) as img:
@@ -122,7 +202,7 @@ class ImageProcessor:
         max_size: Optional[int] = None
     ) -> Image.Image:
         """
-        Redimensiona imagem mantendo aspect ratio.
+        Redimensiona imagem mantendo aspect ratio (altera a imagem dada).
         
         Args:
             img: Imagem PIL
@@ -134,12 +214,10 @@ class ImageProcessor:
         if img.width <= max_size and img.height <= max_size:
             return img
         
-        # Calcular novo tamanho mantendo aspect ratio
-        ratio = min(max_size / img.width, max_size / img.height)
-        new_size = (int(img.width * ratio), int(img.height * ratio))
-        
-        # Usar LANCZOS para melhor qualidade
-        return img.resize(new_size, Image.Resampling.LANCZOS)
+        # Redimensionar no próprio objeto (mantém aspect ratio); o reducing_gap
+        # reduz primeiro com um filtro barato e só depois aplica LANCZOS
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        return img
     
     def enhance_image(self, img: Image.Image) -> Image.Image:
         """
@@ -150,26 +228,31 @@ class ImageProcessor:
         - Com pouco contraste
         - Ligeiramente desfocadas
         """
-        # Melhorar contraste ligeiramente
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(1.1)
-        
-        # Melhorar nitidez
-        enhancer = ImageEnhance.Sharpness(img)
-        img = enhancer.enhance(1.2)
-        
-        # Ajustar brilho se muito escura
-        enhancer = ImageEnhance.Brightness(img)
-        # Calcular brilho médio
-        grayscale = img.convert('L')
-        avg_brightness = sum(grayscale.getdata()) / len(list(grayscale.getdata()))
-        
+        return Image.fromarray(self._enhance_array(img), img.mode)
+    
+    def _enhance_array(self, img: Image.Image) -> np.ndarray:
+        """Como enhance_image, mas devolve os pixels (array uint8 HxWxC)"""
+        # Contraste (1.1), nitidez (1.2) e brilho fundidos numa só passagem
+        # (kernel Numba paralelo se disponível), em vez de três imagens
+        # intermédias criadas pelo ImageEnhance
+        arr = np.asarray(img, dtype=np.uint8)
+        smooth = np.asarray(img.filter(ImageFilter.SMOOTH), dtype=np.uint8)
+        
+        # Calcular brilho médio (sobre uma miniatura: basta um escalar);
+        # contraste e nitidez preservam a média, por isso serve também de pivô
+        small = img.convert('L').resize(self.BRIGHTNESS_SAMPLE, Image.Resampling.BILINEAR)
+        avg_brightness = float(np.asarray(small, dtype=np.uint8).mean())
+        
+        # Ajustar brilho se muito escura / muito clara
         if avg_brightness < 80:  # Imagem escura
-            img = enhancer.enhance(1.2)
+            gain = 1.2
         elif avg_brightness > 200:  # Imagem muito clara
-            img = enhancer.enhance(0.9)
+            gain = 0.9
+        else:
+            gain = 1.0
         
-        return img
+        # nitidez: x + 0.2*(x - suave); contraste: média + 1.1*(x - média); brilho: * gain
+        return _enhance_kernel(arr, smooth, np.float32(avg_brightness), np.float32(gain))
     
     def extract_exif(self, img: Image.Image) -> Optional[dict]:
         """Extrai metadados EXIF da imagem"""
@@ -208,33 +291,56 @@ class ImageProcessor:
         
         return b64, mime
     
-    def compute_hash(self, img: Image.Image) -> str:
-        """Calcula hash da imagem para deduplicação"""
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        return hashlib.md5(buffer.getvalue()).hexdigest()[:16]
+    def compute_hash(self, img: Union[Image.Image, np.ndarray]) -> str:
+        """
+        Calcula hash da imagem para deduplicação (sobre os pixels, sem codificar).
+        
+        Com um array uint8 (HxWxC) o hash lê o buffer diretamente via
+        memoryview, sem a cópia de img.tobytes().
+        """
+        if isinstance(img, np.ndarray):
+            h, w = img.shape[:2]
+            bands = img.shape[2] if img.ndim == 3 else 1
+            data = memoryview(np.ascontiguousarray(img)).cast('B')
+        else:
+            w, h = img.size
+            bands = len(img.getbands())
+            data = img.tobytes()
+        
+        header = f"{w}x{h}x{bands}".encode()
+        hasher = xxhash.xxh3_64(header) if xxhash is not None else hashlib.md5(header)
+        hasher.update(data)
+        return hasher.hexdigest()[:16]
     
     def process_image(
         self,
         image_path: Union[str, Path],
-        return_pil: bool = False
-    ) -> Union[ImageInfo, tuple[ImageInfo, Image.Image]]:
+        return_pil: bool = False,
+        return_encoded: bool = False,
+        validate: bool = True
+    ) -> Union[ImageInfo, tuple]:
         """
         Processa uma imagem completamente.
         
         Args:
             image_path: Caminho para a imagem
             return_pil: Se deve retornar também o objeto PIL
+            return_encoded: Se deve retornar também o base64 já calculado
+                (evita uma segunda codificação JPEG)
+            validate: Se deve validar a imagem (False quando o chamador já
+                validou; uma imagem inválida falha no load)
             
         Returns:
-            ImageInfo ou (ImageInfo, PIL.Image)
+            ImageInfo, (ImageInfo, PIL.Image) ou, com return_encoded,
+            (ImageInfo, PIL.Image, base64, mime_type)
         """
         path = Path(image_path)
         
         # Validar
-        is_valid, msg = self.validate_image(path)
-        if not is_valid:
-            raise ValueError(msg)
+        if validate:
+            is_valid, msg = self.validate_image(path)
+            if not is_valid:
+                raise ValueError(msg)
         
         # Carregar
         img = self.load_image(path)
@@ -246,9 +352,11 @@ class ImageProcessor:
         # Redimensionar
         img = self.resize_image(img)
         
-        # Melhorar (se ativado)
+        # Melhorar (se ativado); os pixels ficam para o hash (sem tobytes)
+        pixels = None
         if self.enhance_images:
-            img = self.enhance_image(img)
+            pixels = self._enhance_array(img)
+            img = Image.fromarray(pixels, img.mode)
         
         # Converter para base64
         b64, mime = self.to_base64(img)
@@ -262,10 +370,12 @@ class ImageProcessor:
             mime_type=mime,
             file_size_kb=path.stat().st_size / 1024,
             base64_size_kb=len(b64) / 1024,
-            hash=self.compute_hash(img),
+            hash=self.compute_hash(img if pixels is None else pixels),
             exif=exif
         )
         
+        if return_encoded:
+            return info, img, b64, mime
         if return_pil:
             return info, img
         return info
@@ -273,7 +383,8 @@ class ImageProcessor:
     def process_multiple(
         self,
         image_paths: list[Union[str, Path]],
-        deduplicate: bool = True
+        deduplicate: bool = True,
+        keep_pil: bool = False
     ) -> list[dict]:
         """
         Processa múltiplas imagens.
@@ -281,36 +392,56 @@ class ImageProcessor:
         Args:
             image_paths: Lista de caminhos
             deduplicate: Remove imagens duplicadas (por hash)
+            keep_pil: Inclui também a imagem PIL processada ('pil')
             
         Returns:
-            Lista de dicts com {info, base64, mime_type}
+            Lista de dicts com {info, base64, mime_type, data_url[, pil]}
         """
         results = []
         seen_hashes = set()
         
+        # Validação barata uma só vez (sem abrir a imagem: o load já falha
+        # para ficheiros corrompidos)
+        image_paths_ok = []
         for path in image_paths:
-            try:
-                info, img = self.process_image(path, return_pil=True)
-                
-                # Deduplicação
-                if deduplicate and info.hash in seen_hashes:
-                    print(f"⚠️ Imagem duplicada ignorada: {path}")
-                    continue
-                seen_hashes.add(info.hash)
-                
-                # Obter base64
-                b64, mime = self.to_base64(img)
-                
-                results.append({
-                    'info': info,
-                    'base64': b64,
-                    'mime_type': mime,
-                    'data_url': f"data:{mime};base64,{b64}"
-                })
-                
-            except Exception as e:
-                print(f"❌ Erro ao processar {path}: {e}")
+            is_valid, msg = self.validate_image(path, verify=False)
+            if is_valid:
+                image_paths_ok.append(path)
+            else:
+                log.warning("❌ Erro ao processar %s: %s", path, msg)
+        image_paths = image_paths_ok
+        
+        # Descodificar/redimensionar/codificar em paralelo (CPU-bound, sem GIL);
+        # uma só imagem é processada no próprio processo
+        work = partial(_process_one, self, keep_pil=keep_pil)
+        if len(image_paths) > 1:
+            workers = min(os.cpu_count() or 1, len(image_paths))
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                processed = list(ex.map(work, image_paths, chunksize=4))
+        else:
+            processed = [work(path) for path in image_paths]
+        
+        for path, result in zip(image_paths, processed):
+            if isinstance(result, Exception):
+                log.warning("❌ Erro ao processar %s: %s", path, result)
+                continue
+            info, b64, mime, img = result
+            
+            # Deduplicação (no processo principal, pela ordem original)
+            if deduplicate and info.hash in seen_hashes:
+                log.info("⚠️ Imagem duplicada ignorada: %s", path)
                 continue
+            seen_hashes.add(info.hash)
+            
+            entry = {
+                'info': info,
+                'base64': b64,
+                'mime_type': mime,
+                'data_url': f"data:{mime};base64,{b64}"
+            }
+            if keep_pil:
+                entry['pil'] = img
+            results.append(entry)
         
         return results
     
@@ -329,7 +460,7 @@ class ImageProcessor:
         Returns:
             Lista de content blocks prontos para API
         """
-        processed = self.process_multiple(image_paths)
+        processed = self.process_multiple(image_paths, keep_pil=(format == 'gemini'))
         
         if format == 'openai':
             # Formato OpenAI/Together AI
@@ -356,11 +487,8 @@ class ImageProcessor:
             ]
         
         elif format == 'gemini':
-            # Formato Google Gemini (retorna PIL Images)
-            return [
-                Image.open(io.BytesIO(base64.b64decode(p['base64'])))
-                for p in processed
-            ]
+            # Formato Google Gemini (retorna PIL Images, sem descodificar o JPEG)
+            return [p['pil'] for p in processed]
         
         else:
             raise ValueError(f"Formato não suportado: {format}")
@@ -399,9 +527,7 @@ class ImageProcessor:
 def quick_process(image_path: str) -> dict:
     """Processamento rápido de uma imagem"""
     processor = ImageProcessor()
-    info = processor.process_image(image_path)
-    _, img = processor.process_image(image_path, return_pil=True)
-    b64, mime = processor.to_base64(img)
+    info, _, b64, mime = processor.process_image(image_path, return_encoded=True)
     
     return {
         'info': info,
@@ -0,0 +1,174 @@
+"""
+Cache semântico de respostas.
+
+Funcionalidades:
+- Pesquisa por similaridade de cosseno sobre embeddings normalizados
+- Filtro exato por etiqueta (ex: espécie) antes da pesquisa semântica
+- Expiração por TTL e capacidade máxima (FIFO)
+- Kernel de similaridade compilado com Numba (opcional, fallback NumPy)
+- Embeddings guardados em int8 (1/4 da memória de float32)
+"""
+
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+import numpy as np
+
+try:
+    from numba import njit, prange  # opcional
+except ImportError:
+    njit = None
+
+
+def _quantize(vec: np.ndarray) -> tuple[np.ndarray, np.float32]:
+    """
+    Quantiza um vetor para int8 com escala própria (max |v| -> 127).
+
+    Returns:
+        (vetor int8, escala) com vec ≈ vetor * escala
+    """
+    scale = np.float32(np.abs(vec).max() / 127) or np.float32(1.0)
+    return np.rint(vec / scale).astype(np.int8), scale
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_scores(mat, scales, q, q_scale):
+        """Similaridade de cosseno de cada linha de mat (int8) com q (int8)"""
+        n, d = mat.shape
+        out = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            s = np.int32(0)  # acumular em int32 (int8 * int8 transborda)
+            for j in range(d):
+                s += np.int32(mat[i, j]) * np.int32(q[j])
+            out[i] = s * scales[i] * q_scale
+        return out
+else:
+    def _cosine_scores(mat, scales, q, q_scale):
+        """Similaridade de cosseno de cada linha de mat (int8) com q (int8)"""
+        return (mat @ q.astype(np.float32)) * scales * q_scale
+
+
+class SemanticCache:
+    """
+    Cache de respostas indexado por embedding.
+
+    Equivalente a um índice "flat inner product" sobre vetores
+    L2-normalizados: a similaridade de cosseno é um produto interno.
+    Os vetores ficam em int8 com uma escala por vetor (erro < 0.01 no
+    cosseno, bem abaixo da margem dos limiares usados).
+    Para a capacidade usada (~1000 entradas) a pesquisa exaustiva é
+    suficiente; com Numba instalado corre num kernel paralelo (compilado
+    uma vez e guardado em disco com cache=True).
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], list[float]],
+        threshold: float = 0.92,
+        ttl: float = 3600.0,
+        capacity: int = 1000
+    ):
+        """
+        Args:
+            embed_fn: Função texto -> embedding
+            threshold: Similaridade mínima para considerar hit
+            ttl: Validade das entradas em segundos
+            capacity: Número máximo de entradas
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (N, D) int8
+        self._scales: Optional[np.ndarray] = None  # (N,) float32
+        self._entries: list[tuple[Hashable, Any, float]] = []  # (tag, valor, ts)
+
+    def embed(self, text: str) -> np.ndarray:
+        """Calcula o embedding L2-normalizado de um texto"""
+        vec = np.ascontiguousarray(self.embed_fn(text), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def lookup(
+        self,
+        text: str,
+        tag: Hashable = None,
+        vector: Optional[np.ndarray] = None
+    ) -> Optional[Any]:
+        """
+        Procura uma resposta semelhante.
+
+        Args:
+            text: Texto da pesquisa
+            tag: Só considera entradas com a mesma etiqueta
+            vector: Embedding já calculado (evita recalcular)
+
+        Returns:
+            Valor guardado ou None
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+
+        q, q_scale = _quantize(self.embed(text) if vector is None else vector)
+        now = time.time()
+
+        with self._lock:
+            if self._vectors is None:
+                return None
+
+            scores = _cosine_scores(self._vectors, self._scales, q, q_scale)
+            # Só ordenar os candidatos acima do limiar
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for idx in candidates[np.argsort(-scores[candidates])]:
+                entry_tag, value, ts = self._entries[idx]
+                if entry_tag == tag and now - ts < self.ttl:
+                    return value
+
+        return None
+
+    def add(
+        self,
+        text: str,
+        value: Any,
+        tag: Hashable = None,
+        vector: Optional[np.ndarray] = None,
+        ts: Optional[float] = None
+    ):
+        """
+        Guarda uma resposta no cache.
+
+        Args:
+            ts: Instante de criação (para entradas restauradas do disco)
+        """
+        vec, scale = _quantize(self.embed(text) if vector is None else vector)
+
+        with self._lock:
+            self._entries.append((tag, value, time.time() if ts is None else ts))
+            if self._vectors is None:
+                self._vectors = vec[None, :]
+                self._scales = np.array([scale], dtype=np.float32)
+            else:
+                self._vectors = np.vstack([self._vectors, vec])
+                self._scales = np.append(self._scales, scale)
+
+            # Remover as entradas mais antigas se exceder a capacidade
+            overflow = len(self._entries) - self.capacity
+            if overflow > 0:
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+                self._scales = self._scales[overflow:]
+
+    def clear(self):
+        """Limpa o cache"""
+        with self._lock:
+            self._entries = []
+            self._vectors = None
+            self._scales = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
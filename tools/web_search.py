@@ -15,21 +15,53 @@ warnings.filterwarnings("ignore", message=".*LangChain.*")
 warnings.filterwarnings("ignore", message=".*Chroma.*")
 
 import hashlib
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional, Union
+import importlib.util
 import json
+import logging
 
-# LangChain imports
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    UnstructuredMarkdownLoader
-)
+# LangChain imports (só o core; Chroma, HuggingFace, splitters e loaders
+# puxam torch/pypdf e são importados apenas quando usados)
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import numpy as np
+
+# Mensagens por ficheiro (filho do logger "vet": assíncrono quando o
+# orchestrator o configurou, sem escritas síncronas no stdout por ficheiro)
+log = logging.getLogger("vet.rag")
+
+# xxhash (opcional): hash não criptográfico muito mais rápido que MD5
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Algoritmo usado no fingerprint dos ficheiros ingeridos
+FILE_HASH_ALGO = "xxh3_64" if xxhash is not None else "md5"
+
+# rank_bm25 (opcional): score de keywords BM25 (TF + IDF) no hybrid_search
+try:
+    from rank_bm25 import BM25Okapi
+except ImportError:
+    BM25Okapi = None
+
+# semchunk (opcional): divisão em chunks por tokens (tokenizer tiktoken em Rust)
+try:
+    import semchunk
+except ImportError:
+    semchunk = None
+
+# optimum (opcional): embeddings em ONNX Runtime com quantização dinâmica int8
+# (só se verifica se está instalado; o import puxa transformers/onnxruntime)
+HAS_OPTIMUM = importlib.util.find_spec("optimum") is not None
 
 
 @dataclass
@@ -51,6 +83,172 @@ class RAGConfig:
     chunk_size: int = 1000
     chunk_overlap: int = 200
     collection_name: str = "veterinary_docs"
+    # 'torch' ou 'onnx' (int8, opt-in): os vetores dos dois não são idênticos,
+    # por isso cada backend tem a sua coleção (ONNX: "<collection_name>_onnx")
+    embedding_backend: str = "torch"
+
+
+class _OnnxEmbeddings(Embeddings):
+    """
+    Embeddings sentence-transformers em ONNX Runtime (int8, CPU).
+    
+    O modelo é exportado e quantizado uma vez (dinâmico, AVX2/VNNI) e
+    guardado em disco; o pooling (média + normalização L2) é feito em NumPy,
+    como no HuggingFaceEmbeddings com normalize_embeddings=True.
+    """
+    
+    QUANTIZED_FILE = "model_quantized.onnx"
+    
+    def __init__(self, model_name: str, cache_dir: Union[str, Path],
+                 batch_size: int = 64, max_length: int = 256):
+        """
+        Args:
+            model_name: Modelo HuggingFace (sentence-transformers)
+            cache_dir: Pasta onde guardar o modelo ONNX quantizado
+            batch_size: Textos por forward pass
+            max_length: Tokens máximos por texto
+        """
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+        
+        self.batch_size = batch_size
+        self.max_length = max_length
+        
+        model_dir = Path(cache_dir) / f"{model_name.replace('/', '__')}-int8"
+        if not (model_dir / self.QUANTIZED_FILE).exists():
+            print(f"⚙️ Exportando {model_name} para ONNX (int8)...")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+            ORTQuantizer.from_pretrained(model_dir).quantize(
+                save_dir=model_dir,
+                quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            )
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=self.QUANTIZED_FILE,
+            provider="CPUExecutionProvider"
+        )
+    
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        """Embeddings normalizados (float32) de uma lista de textos"""
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[i:i + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            out.append(pooled.astype(np.float32))
+        return np.concatenate(out) if out else np.empty((0, 0), dtype=np.float32)
+    
+    def embed_query(self, text: str) -> list[float]:
+        return self._encode([text])[0].tolist()
+    
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts).tolist()
+
+
+def _build_embeddings(config: RAGConfig) -> Embeddings:
+    """Modelo de embeddings do RAG (ONNX int8 se pedido e disponível, senão PyTorch)"""
+    if config.embedding_backend == "onnx" and HAS_OPTIMUM:
+        try:
+            return _OnnxEmbeddings(config.embedding_model, Path(config.chroma_path) / "onnx")
+        except Exception as e:
+            print(f"⚠️ ONNX indisponível ({e}), a usar PyTorch")
+    
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=config.embedding_model,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True, 'batch_size': 64}
+    )
+
+
+class _CachedEmbeddings(Embeddings):
+    """
+    Embeddings com cache LRU em memória para queries repetidas.
+    
+    A mesma query (ex: repetições do orchestrator) é embebida uma só vez,
+    tanto na pesquisa semântica como no contexto e no cache semântico.
+    """
+    
+    def __init__(self, base: Embeddings, capacity: int = 2048):
+        """
+        Args:
+            base: Modelo de embeddings real
+            capacity: Número máximo de queries em cache
+        """
+        self.base = base
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def embed_query(self, text: str) -> list[float]:
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        
+        with self._lock:
+            vec = self._cache.get(key)
+            if vec is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vec.tolist()
+            self.misses += 1
+        
+        vec = np.asarray(self.base.embed_query(text), dtype=np.float32)
+        
+        with self._lock:
+            self._cache[key] = vec
+            if len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)  # Remover o menos usado
+        return vec.tolist()
+    
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embeddings de várias queries; as que faltam no cache vão num só lote"""
+        keys = [hashlib.blake2b(t.encode(), digest_size=16).digest() for t in texts]
+        
+        with self._lock:
+            found = {k: self._cache[k] for k in keys if k in self._cache}
+            n_hits = sum(k in found for k in keys)
+            self.hits += n_hits
+            self.misses += len(keys) - n_hits
+        
+        missing = list({k: t for k, t in zip(keys, texts) if k not in found}.items())
+        if missing:
+            # Um único forward pass do modelo para todas as queries em falta
+            vecs = self.base.embed_documents([t for _, t in missing])
+            with self._lock:
+                for (k, _), vec in zip(missing, vecs):
+                    found[k] = self._cache[k] = np.asarray(vec, dtype=np.float32)
+                while len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+        
+        return [found[k].tolist() for k in keys]
+    
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        # Documentos são ingeridos uma vez - sem cache
+        return self.base.embed_documents(texts)
+    
+    def get_stats(self) -> dict:
+        """Métricas do cache (hits, misses, hit rate)"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._cache)
+        }
 
 
 class RAGTool:
@@ -67,6 +265,8 @@ class RAGTool:
         Args:
             config: Configuração personalizada (opcional)
         """
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        
         self.config = config or RAGConfig()
         
         # Criar diretórios se não existirem
@@ -75,30 +275,81 @@ class RAGTool:
         
         # Inicializar embeddings (corre localmente)
         print(f"📦 Carregando modelo de embeddings: {self.config.embedding_model}")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=self.config.embedding_model,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        base_embeddings = _build_embeddings(self.config)
+        self.embedding_backend = "onnx" if isinstance(base_embeddings, _OnnxEmbeddings) else "torch"
+        self.embeddings = _CachedEmbeddings(base_embeddings)
+        
+        # Coleção e cache de ingestão por backend (PyTorch mantém os nomes
+        # originais); nada é apagado ao trocar de backend
+        suffix = "" if self.embedding_backend == "torch" else f"_{self.embedding_backend}"
+        self.collection_name = self.config.collection_name + suffix
         
         # Inicializar/carregar vector store
-        self.vectorstore = Chroma(
-            collection_name=self.config.collection_name,
-            persist_directory=self.config.chroma_path,
-            embedding_function=self.embeddings
-        )
+        self.vectorstore = self._open_vectorstore()
         
-        # Text splitter para ingestão
+        # Text splitter para ingestão (semchunk se disponível; chunk_size em
+        # caracteres convertido para tokens com ~4 caracteres/token)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.config.chunk_size,
             chunk_overlap=self.config.chunk_overlap,
             length_function=len,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
+        self._chunker = None
+        if semchunk is not None:
+            try:
+                self._chunker = semchunk.chunkerify("gpt-3.5-turbo", self.config.chunk_size // 4)
+            except Exception as e:
+                print(f"⚠️ semchunk indisponível ({e}), a usar RecursiveCharacterTextSplitter")
         
         # Cache de documentos ingeridos
-        self.ingested_cache_path = Path(self.config.chroma_path) / "ingested_files.json"
+        self.ingested_cache_path = Path(self.config.chroma_path) / f"ingested_files{suffix}.json"
         self.ingested_files = self._load_cache()
+        
+        # Índice BM25 sobre os chunks (construído na primeira pesquisa híbrida,
+        # invalidado quando se adicionam documentos)
+        self._bm25 = None
+        self._bm25_index: dict[str, int] = {}
+    
+    def _open_vectorstore(self):
+        """Abre (ou cria) a coleção Chroma, registando o backend de embeddings"""
+        from langchain_community.vectorstores import Chroma
+        return Chroma(
+            collection_name=self.collection_name,
+            persist_directory=self.config.chroma_path,
+            embedding_function=self.embeddings,
+            collection_metadata={"embedding_backend": self.embedding_backend}
+        )
+    
+    def _get_bm25(self):
+        """Índice BM25 do corpus (None se rank_bm25 não estiver instalado)"""
+        if BM25Okapi is None:
+            return None
+        if self._bm25 is None:
+            docs = self.vectorstore._collection.get(include=["documents"])["documents"]
+            if not docs:
+                return None
+            self._bm25_index = {content: i for i, content in enumerate(docs)}
+            self._bm25 = BM25Okapi([content.lower().split() for content in docs])
+        return self._bm25
+    
+    def _add_chunks(self, chunks: list[Document]):
+        """Adiciona chunks ao vector store e invalida o índice BM25"""
+        self.vectorstore.add_documents(chunks)
+        self._bm25 = None
+    
+    def _split_documents(self, documents: list[Document]) -> list[Document]:
+        """Divide documentos em chunks (metadados copiados para cada chunk)"""
+        if self._chunker is None:
+            return self.text_splitter.split_documents(documents)
+        
+        overlap = self.config.chunk_overlap / self.config.chunk_size
+        texts = self._chunker([doc.page_content for doc in documents], overlap=overlap)
+        return [
+            Document(page_content=text, metadata=dict(doc.metadata))
+            for doc, doc_chunks in zip(documents, texts)
+            for text in doc_chunks
+        ]
     
     def _load_cache(self) -> dict:
         """Carrega cache de ficheiros ingeridos"""
@@ -112,16 +363,24 @@ class RAGTool:
         with open(self.ingested_cache_path, 'w') as f:
             json.dump(self.ingested_files, f, indent=2)
     
-    def _compute_file_hash(self, file_path: Path) -> str:
-        """Calcula hash de um ficheiro"""
-        hasher = hashlib.md5()
+    def _compute_file_hash(self, file_path: Path, algo: str = FILE_HASH_ALGO) -> str:
+        """Calcula hash de um ficheiro (mapeado em memória, uma só chamada ao hash)"""
+        hasher = xxhash.xxh3_64() if algo == "xxh3_64" else hashlib.new(algo)
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                hasher.update(chunk)
+            # mmap não aceita ficheiros vazios
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hasher.update(mm)
         return hasher.hexdigest()
     
     def _get_loader(self, file_path: Path):
         """Retorna o loader apropriado para o tipo de ficheiro"""
+        from langchain_community.document_loaders import (
+            PyPDFLoader,
+            TextLoader,
+            UnstructuredMarkdownLoader
+        )
+        
         suffix = file_path.suffix.lower()
         
         loaders = {
@@ -136,23 +395,13 @@ class RAGTool:
         
         raise ValueError(f"Tipo de ficheiro não suportado: {suffix}")
     
-    def ingest_file(
-        self,
-        file_path: Union[str, Path],
-        force: bool = False
-    ) -> int:
+    def _prepare_file(self, path: Path, force: bool = False) -> Optional[tuple[str, dict, list]]:
         """
-        Ingere um único ficheiro.
+        Carrega e divide um ficheiro em chunks (sem os adicionar ao store).
         
-        Args:
-            file_path: Caminho do ficheiro
-            force: Força reingestão mesmo se já existe
-            
         Returns:
-            Número de chunks adicionados
+            (cache_key, entrada do cache, chunks) ou None se já foi ingerido
         """
-        path = Path(file_path)
-        
         if not path.exists():
             raise FileNotFoundError(f"Ficheiro não encontrado: {path}")
         
@@ -160,12 +409,16 @@ class RAGTool:
         file_hash = self._compute_file_hash(path)
         cache_key = str(path.absolute())
         
-        if not force and cache_key in self.ingested_files:
-            if self.ingested_files[cache_key]['hash'] == file_hash:
-                print(f"⏭️ Ficheiro já ingerido: {path.name}")
-                return 0
+        entry = self.ingested_files.get(cache_key)
+        if not force and entry:
+            # Entradas antigas (outro algoritmo) comparam com o hash desse algoritmo
+            algo = entry.get('hash_algo', 'md5')
+            previous = file_hash if algo == FILE_HASH_ALGO else self._compute_file_hash(path, algo)
+            if entry['hash'] == previous:
+                log.info("⏭️ Ficheiro já ingerido: %s", path.name)
+                return None
         
-        print(f"📄 Ingerindo: {path.name}")
+        log.info("📄 Ingerindo: %s", path.name)
         
         # Carregar documento
         loader = self._get_loader(path)
@@ -178,21 +431,44 @@ class RAGTool:
             doc.metadata['file_type'] = path.suffix
         
         # Dividir em chunks
-        chunks = self.text_splitter.split_documents(documents)
+        chunks = self._split_documents(documents)
+        
+        return cache_key, {
+            'hash': file_hash,
+            'hash_algo': FILE_HASH_ALGO,
+            'chunks': len(chunks),
+            'name': path.name
+        }, chunks
+    
+    def ingest_file(
+        self,
+        file_path: Union[str, Path],
+        force: bool = False
+    ) -> int:
+        """
+        Ingere um único ficheiro.
+        
+        Args:
+            file_path: Caminho do ficheiro
+            force: Força reingestão mesmo se já existe
+            
+        Returns:
+            Número de chunks adicionados
+        """
+        prepared = self._prepare_file(Path(file_path), force=force)
+        if prepared is None:
+            return 0
+        cache_key, entry, chunks = prepared
         
         # Adicionar ao vector store
         if chunks:
-            self.vectorstore.add_documents(chunks)
+            self._add_chunks(chunks)
             
             # Atualizar cache
-            self.ingested_files[cache_key] = {
-                'hash': file_hash,
-                'chunks': len(chunks),
-                'name': path.name
-            }
+            self.ingested_files[cache_key] = entry
             self._save_cache()
         
-        print(f"   ✅ Adicionados {len(chunks)} chunks")
+        log.info("   ✅ Adicionados %d chunks", len(chunks))
         return len(chunks)
     
     def ingest_directory(
@@ -204,6 +480,10 @@ class RAGTool:
         """
         Ingere todos os documentos de um diretório.
         
+        Os ficheiros são lidos e divididos em paralelo (threads: o parsing
+        de PDF liberta o GIL em zlib) e os chunks de todos eles são
+        embebidos num único add_documents, pela ordem dos ficheiros.
+        
         Args:
             directory: Diretório (usa config.docs_path se None)
             extensions: Lista de extensões a processar
@@ -216,18 +496,34 @@ class RAGTool:
         extensions = extensions or ['.pdf', '.txt', '.md']
         
         stats = {'files_processed': 0, 'chunks_added': 0, 'errors': []}
+        all_chunks = []
+        entries = {}
         
         print(f"📁 Ingerindo documentos de: {dir_path}")
         
-        for ext in extensions:
-            for file_path in dir_path.rglob(f"*{ext}"):
+        files = [f for ext in extensions for f in dir_path.rglob(f"*{ext}")]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            futures = [ex.submit(self._prepare_file, f, force) for f in files]
+            
+            for file_path, future in zip(files, futures):
                 try:
-                    chunks = self.ingest_file(file_path, force=force)
+                    prepared = future.result()
                     stats['files_processed'] += 1
-                    stats['chunks_added'] += chunks
+                    if prepared is None:
+                        continue
+                    cache_key, entry, chunks = prepared
+                    if chunks:
+                        all_chunks.extend(chunks)
+                        entries[cache_key] = entry
                 except Exception as e:
                     stats['errors'].append({'file': str(file_path), 'error': str(e)})
-                    print(f"   ❌ Erro em {file_path.name}: {e}")
+                    log.warning("   ❌ Erro em %s: %s", file_path.name, e)
+        
+        if all_chunks:
+            self._add_chunks(all_chunks)
+            self.ingested_files.update(entries)
+            self._save_cache()
+            stats['chunks_added'] = len(all_chunks)
         
         print(f"\n📊 Resumo: {stats['files_processed']} ficheiros, {stats['chunks_added']} chunks")
         return stats
@@ -303,20 +599,107 @@ class RAGTool:
         """
         # Pesquisa semântica
         semantic_results = self.search(query, k=k*2)
+        return self._keyword_rerank(query, semantic_results, k, keyword_weight)
+    
+    def hybrid_search_batch(
+        self,
+        queries: list[str],
+        k: int = 3,
+        keyword_weight: float = 0.3
+    ) -> list[list[SearchResult]]:
+        """
+        Pesquisa híbrida para várias queries de uma vez.
         
-        # Boost baseado em keywords
-        query_terms = set(query.lower().split())
+        Calcula todos os embeddings num só lote e faz uma única consulta
+        multi-vetor ao ChromaDB.
         
-        for result in semantic_results:
-            content_terms = set(result.content.lower().split())
-            keyword_overlap = len(query_terms & content_terms) / len(query_terms) if query_terms else 0
+        Args:
+            queries: Textos da pesquisa
+            k: Número de resultados por query
+            keyword_weight: Peso do match de keywords
             
-            # Combinar scores
-            result.score = (1 - keyword_weight) * result.score + keyword_weight * keyword_overlap
+        Returns:
+            Lista de resultados por query (mesma ordem)
+        """
+        if not queries:
+            return []
+        
+        query_embeddings = self.embeddings.embed_queries(queries)
+        raw = self.vectorstore._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=k * 2,
+            include=["documents", "metadatas", "distances"]
+        )
+        relevance_fn = self.vectorstore._select_relevance_score_fn()
+        
+        batch_results = []
+        for query, docs, metas, dists in zip(
+            queries, raw["documents"], raw["metadatas"], raw["distances"]
+        ):
+            semantic_results = []
+            for content, metadata, distance in zip(docs, metas, dists):
+                metadata = metadata or {}
+                semantic_results.append(SearchResult(
+                    content=content,
+                    source=metadata.get('source', 'unknown'),
+                    page=metadata.get('page'),
+                    score=float(relevance_fn(distance)),
+                    metadata=metadata
+                ))
+            batch_results.append(self._keyword_rerank(query, semantic_results, k, keyword_weight))
         
-        # Reordenar e limitar
-        semantic_results.sort(key=lambda x: x.score, reverse=True)
-        return semantic_results[:k]
+        return batch_results
+    
+    def _keyword_rerank(
+        self,
+        query: str,
+        semantic_results: list[SearchResult],
+        k: int,
+        keyword_weight: float
+    ) -> list[SearchResult]:
+        """
+        Combina o score semântico com o score de keywords e reordena.
+        
+        Com rank_bm25 usa BM25 (normalizado pelo máximo dos candidatos);
+        sem ele, a fração de termos da query presentes no chunk.
+        """
+        if not semantic_results:
+            return []
+        
+        query_tokens = query.lower().split()
+        bm25 = self._get_bm25()
+        n = len(semantic_results)
+        
+        if bm25 is not None:
+            ids = np.array(
+                [self._bm25_index.get(r.content, -1) for r in semantic_results], dtype=np.int64
+            )
+            known = ids >= 0
+            kw = np.zeros(n)
+            if known.any():
+                kw[known] = bm25.get_batch_scores(query_tokens, ids[known].tolist())
+                top = kw.max()
+                if top > 0:
+                    kw /= top
+        else:
+            # Boost baseado em keywords
+            query_terms = set(query_tokens)
+            kw = np.fromiter(
+                (len(query_terms & set(r.content.lower().split())) for r in semantic_results),
+                dtype=np.float64, count=n
+            ) / max(len(query_terms), 1)
+        
+        # Combinar scores (um só passo vetorizado) e reordenar
+        sem = np.fromiter((r.score for r in semantic_results), dtype=np.float64, count=n)
+        final = (1 - keyword_weight) * sem + keyword_weight * kw
+        order = np.argsort(-final, kind="stable")[:k]
+        
+        top_results = []
+        for i in order:
+            result = semantic_results[i]
+            result.score = float(final[i])
+            top_results.append(result)
+        return top_results
     
     def get_relevant_context(
         self,
@@ -336,7 +719,46 @@ class RAGTool:
             Texto formatado com contexto relevante
         """
         results = self.hybrid_search(query, k=k)
+        return self._format_context(results, max_tokens)
+    
+    def search_and_context(
+        self,
+        query: str,
+        k: int = 3,
+        max_tokens: int = 1000,
+        context_k: int = 10,
+        extra_queries: Optional[list[str]] = None
+    ) -> tuple[list[SearchResult], str, list[list[SearchResult]]]:
+        """
+        Pesquisa uma única vez e devolve resultados + contexto formatado.
+        
+        Equivale a hybrid_search(query, k) + get_relevant_context(query)
+        mas com um só embedding e uma só consulta ao vector store.
         
+        Args:
+            query: Texto da pesquisa
+            k: Número de resultados a devolver
+            max_tokens: Limite aproximado de tokens do contexto
+            context_k: Número máximo de chunks no contexto
+            extra_queries: Queries adicionais, pesquisadas no mesmo lote
+            
+        Returns:
+            (top-k resultados, texto de contexto, top-k de cada query adicional)
+        """
+        if not extra_queries:
+            results = self.hybrid_search(query, k=max(k, context_k))
+            return results[:k], self._format_context(results[:context_k], max_tokens), []
+        
+        # Todas as variantes num só lote (um forward pass + uma consulta)
+        results, *extra = self.hybrid_search_batch([query, *extra_queries], k=max(k, context_k))
+        return (
+            results[:k],
+            self._format_context(results[:context_k], max_tokens),
+            [r[:k] for r in extra]
+        )
+    
+    def _format_context(self, results: list[SearchResult], max_tokens: int) -> str:
+        """Formata resultados como contexto para LLM, limitado a max_tokens"""
         context_parts = []
         current_length = 0
         char_per_token = 4  # Estimativa
@@ -374,9 +796,9 @@ class RAGTool:
         metadata['source'] = source
         
         doc = Document(page_content=content, metadata=metadata)
-        chunks = self.text_splitter.split_documents([doc])
+        chunks = self._split_documents([doc])
         
-        self.vectorstore.add_documents(chunks)
+        self._add_chunks(chunks)
         print(f"✅ Adicionado documento manual: {len(chunks)} chunks")
     
     def delete_by_source(self, source: str):
@@ -394,7 +816,8 @@ class RAGTool:
             'ingested_files': len(self.ingested_files),
             'files': list(self.ingested_files.keys()),
             'embedding_model': self.config.embedding_model,
-            'chunk_size': self.config.chunk_size
+            'chunk_size': self.config.chunk_size,
+            'embedding_cache': self.embeddings.get_stats()
         }
     
     def clear(self, confirm: bool = False):
@@ -405,27 +828,27 @@ class RAGTool:
         
         self.vectorstore.delete_collection()
         self.ingested_files = {}
+        self._bm25 = None
         self._save_cache()
         
-        # Reinicializar
-        self.vectorstore = Chroma(
-            collection_name=self.config.collection_name,
-            persist_directory=self.config.chroma_path,
-            embedding_function=self.embeddings
-        )
+        # Reinicializar (a nova coleção regista o backend atual)
+        self.vectorstore = self._open_vectorstore()
         
         print("🗑️ Vector store limpo")
 
 
 # Função utilitária para uso rápido
+@lru_cache(maxsize=4)
+def _get_rag(docs_path: Optional[str] = None) -> RAGTool:
+    """RAGTool partilhado por pasta de documentos (modelo e Chroma carregados uma vez)"""
+    return RAGTool(RAGConfig(docs_path=docs_path) if docs_path else None)
+
+
 def quick_search(query: str, k: int = 5) -> list[SearchResult]:
     """Pesquisa rápida com configuração padrão"""
-    rag = RAGTool()
-    return rag.search(query, k=k)
+    return _get_rag().search(query, k=k)
 
 
 def quick_ingest(docs_path: str):
     """Ingestão rápida de um diretório"""
-    rag = RAGTool(RAGConfig(docs_path=docs_path))
-    return rag.ingest_directory()
-
+    return _get_rag(docs_path).ingest_directory()
@@ -5,12 +5,74 @@ Funcionalidades:
 - Pesquisa web com DuckDuckGo (gratuito)
 - Pesquisa com Gemini Grounding (Google AI)
 - Formatação de resultados para LLM
+- Versões assíncronas (asearch / asearch_veterinary) com as pesquisas
+  em paralelo
 """
 
+import asyncio
+import io
+import logging
+import random
+import threading
+import time
+import warnings
 import httpx
+from collections import OrderedDict
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 from config.settings import settings
+from tools.async_runtime import run_sync
+
+log = logging.getLogger("vet.search")
+
+# Avisos do ddgs/duckduckgo_search (registados uma vez, no import)
+warnings.filterwarnings("ignore", message=".*duckduckgo.*")
+warnings.filterwarnings("ignore", message=".*ddgs.*")
+
+# Termos que indicam uma query já veterinária (em minúsculas)
+_VET_TERMS = frozenset({
+    'veterinary', 'vet', 'animal', 'dog', 'cat', 'canine', 'feline', 'diagnosis', 'treatment'
+})
+
+# Enriquecimento das queries (constantes: uma só concatenação por query)
+_VET_PREFIX = "veterinary "
+_VET_QUERY_SUFFIX = " diagnosis treatment"
+_ENRICH_SUFFIX = " symptoms diagnosis treatment"
+
+# Tamanho médio de um resultado no contexto para LLM ("[título]: snippet")
+_CONTEXT_CHARS_PER_RESULT = 300
+_CONTEXT_MAX_RESULTS = 5
+
+# Pool do cliente próprio (quando não é injetado um partilhado)
+_CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=100, max_connections=1000)
+
+# Timeout por fase: ligações presas abortam cedo em vez de esperar 30s
+_CLIENT_TIMEOUT = httpx.Timeout(connect=2.0, read=8.0, write=2.0, pool=1.0)
+
+# Retry em rate limit (o backend 'auto' do ddgs já alterna entre motores)
+_DDG_BACKOFF_BASE = 0.5   # s (dobra a cada tentativa)
+_DDG_BACKOFF_JITTER = 0.3  # s
+
+
+@lru_cache(maxsize=1)
+def _ddgs_api() -> tuple[type, type]:
+    """(DDGS, RatelimitException), importados uma vez, no primeiro uso"""
+    # Usar o novo pacote ddgs (mais estável)
+    try:
+        from ddgs import DDGS
+        from ddgs.exceptions import RatelimitException
+    except ImportError:
+        from duckduckgo_search import DDGS
+        from duckduckgo_search.exceptions import RatelimitException
+    return DDGS, RatelimitException
+
+
+@lru_cache(maxsize=1)
+def _genai():
+    """SDK google.generativeai (import pesado, feito só no primeiro uso)"""
+    import google.generativeai as genai
+    return genai
 
 
 @dataclass
@@ -32,19 +94,59 @@ class WebSearchTool:
     def __init__(
         self,
         google_api_key: Optional[str] = None,
-        preferred_provider: str = 'duckduckgo'
+        preferred_provider: str = 'duckduckgo',
+        client: Optional[httpx.Client] = None,
+        proxy: Optional[str] = None
     ):
         """
         Args:
             google_api_key: API key do Google AI (opcional)
             preferred_provider: 'duckduckgo' ou 'gemini'
+            client: Cliente HTTP partilhado (evita um pool de ligações próprio)
+            proxy: Proxy para o DuckDuckGo (por omissão settings.DDG_PROXY)
         """
         self.google_api_key = google_api_key or settings.GOOGLE_API_KEY
         self.preferred_provider = preferred_provider
-        self.client = httpx.Client(timeout=30.0)
+        self.proxy = proxy or settings.DDG_PROXY or None
+        self._owns_client = client is None
+        self.client = client or httpx.Client(timeout=_CLIENT_TIMEOUT, limits=_CLIENT_LIMITS)
         
-        # Cache de resultados
-        self._cache = {}
+        # Sessão DuckDuckGo persistente (criada no primeiro uso; reutiliza
+        # as ligações keep-alive entre pesquisas)
+        self._ddgs = None
+        
+        # Cache de resultados: LRU limitado com TTL; entradas expiradas há
+        # pouco (até SEARCH_CACHE_STALE_TTL) são servidas e revalidadas em fundo
+        self._cache: OrderedDict[tuple[str, int], tuple[float, list]] = OrderedDict()
+        self._cache_lock = threading.RLock()
+        self._refreshing: set[tuple[str, int]] = set()
+        
+        # Modelos Gemini por nome (SDK configurado uma vez, no primeiro uso)
+        self._gemini_models: dict = {}
+        self._gemini_lock = threading.Lock()
+    
+    def _get_ddgs(self):
+        """Sessão DDGS partilhada entre pesquisas"""
+        if self._ddgs is None:
+            self._ddgs = _ddgs_api()[0](proxy=self.proxy)
+        return self._ddgs
+    
+    def close(self):
+        """Fecha a sessão DuckDuckGo e o cliente HTTP (se for nosso)"""
+        ddgs, self._ddgs = self._ddgs, None
+        if ddgs is not None and hasattr(ddgs, "__exit__"):
+            try:
+                ddgs.__exit__(None, None, None)
+            except Exception:
+                pass
+        if self._owns_client:
+            self.client.close()
+    
+    def __enter__(self) -> "WebSearchTool":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
     
     def search(
         self,
@@ -62,47 +164,112 @@ class WebSearchTool:
             Lista de WebSearchResult
         """
         # Verificar cache
-        cache_key = f"{query}:{max_results}"
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        cache_key = (query, max_results)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
         
+        results = self._fetch(query, max_results)
+        # Vazio = falha (ex: rate limit esgotado) ou sem resultados: não fica
+        # em cache, para a próxima pesquisa voltar a tentar
+        if results:
+            self._cache_put(cache_key, results)
+        return results
+    
+    def _fetch(self, query: str, max_results: int) -> list[WebSearchResult]:
+        """Pesquisa sem cache (erros -> lista vazia)"""
         try:
-            results = self._search_duckduckgo(query, max_results)
+            return self._search_duckduckgo(query, max_results)
         except Exception as e:
-            print(f"⚠️ DuckDuckGo falhou: {e}")
-            results = []
+            log.warning("DuckDuckGo falhou: %s", e)
+            return []
+    
+    def _cached(self, cache_key: tuple[str, int]) -> Optional[list[WebSearchResult]]:
+        """
+        Resultados em cache (None se não existem ou expiraram de vez).
         
-        self._cache[cache_key] = results
+        Entre SEARCH_CACHE_TTL e SEARCH_CACHE_STALE_TTL devolve o resultado
+        antigo e agenda uma revalidação em fundo (stale-while-revalidate).
+        """
+        with self._cache_lock:
+            entry = self._cache.get(cache_key)
+            if entry is None:
+                return None
+            ts, results = entry
+            age = time.time() - ts
+            if age > settings.SEARCH_CACHE_STALE_TTL:
+                del self._cache[cache_key]
+                return None
+            self._cache.move_to_end(cache_key)
+            if age > settings.SEARCH_CACHE_TTL and cache_key not in self._refreshing:
+                self._refreshing.add(cache_key)
+                threading.Thread(
+                    target=self._revalidate, args=(cache_key,), daemon=True
+                ).start()
         return results
     
+    def _revalidate(self, cache_key: tuple[str, int]):
+        """Atualiza uma entrada antiga (mantém a antiga se a pesquisa falhar)"""
+        try:
+            results = self._fetch(*cache_key)
+            if results:
+                self._cache_put(cache_key, results)
+        finally:
+            with self._cache_lock:
+                self._refreshing.discard(cache_key)
+    
+    def _cache_put(self, cache_key: tuple[str, int], results: list[WebSearchResult]):
+        """Guarda no cache e remove as entradas menos usadas acima do limite"""
+        with self._cache_lock:
+            self._cache[cache_key] = (time.time(), results)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > settings.SEARCH_CACHE_MAX:
+                self._cache.popitem(last=False)
+    
+    def clear_cache(self):
+        """Esvazia o cache de resultados"""
+        with self._cache_lock:
+            self._cache.clear()
+    
+    def invalidate(self, query: str):
+        """Remove do cache os resultados de uma query (qualquer max_results)"""
+        with self._cache_lock:
+            for cache_key in [k for k in self._cache if k[0] == query]:
+                del self._cache[cache_key]
+    
+    async def asearch(
+        self,
+        query: str,
+        max_results: int = 5
+    ) -> list[WebSearchResult]:
+        """
+        Versão assíncrona de search (a pesquisa corre numa thread, sem
+        bloquear o event loop; partilha o cache).
+        """
+        cached = self._cached((query, max_results))
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self.search, query, max_results)
+    
     def _search_duckduckgo(
         self,
         query: str,
         max_results: int = 5
     ) -> list[WebSearchResult]:
         """Pesquisa usando DuckDuckGo (gratuito) via pacote ddgs"""
-        import warnings
-        warnings.filterwarnings("ignore", message=".*duckduckgo.*")
-        warnings.filterwarnings("ignore", message=".*ddgs.*")
-        
         try:
-            # Usar o novo pacote ddgs (mais estável)
-            try:
-                from ddgs import DDGS
-            except ImportError:
-                from duckduckgo_search import DDGS
+            ddgs = self._get_ddgs()
             
             # Enriquecer query com termos veterinários em inglês
-            vet_terms = ['veterinary', 'vet', 'animal', 'dog', 'cat', 'canine', 'feline', 'diagnosis', 'treatment']
-            has_vet_term = any(term.lower() in query.lower() for term in vet_terms)
+            q_lower = query.lower()
+            has_vet_term = any(term in q_lower for term in _VET_TERMS)
             if not has_vet_term:
-                search_query = f"veterinary {query} symptoms diagnosis treatment"
+                search_query = _VET_PREFIX + query + _ENRICH_SUFFIX
             else:
                 search_query = query
             
-            # Pesquisar (ddgs não usa context manager)
-            ddgs = DDGS()
-            results = list(ddgs.text(search_query, max_results=max_results))
+            # Pesquisar (sessão reutilizada)
+            results = self._ddg_text(ddgs, search_query, max_results)
             
             return [
                 WebSearchResult(
@@ -114,11 +281,30 @@ class WebSearchTool:
                 for r in results
             ]
         except ImportError as ie:
-            print(f"⚠️ ddgs/duckduckgo_search não instalado: {ie}")
+            log.warning("ddgs/duckduckgo_search não instalado: %s", ie)
             return []
         except Exception as e:
-            print(f"⚠️ Erro DuckDuckGo: {e}")
+            log.warning("Erro DuckDuckGo: %s", e)
             return []
+    
+    @staticmethod
+    def _ddg_text(ddgs, search_query: str, max_results: int) -> list[dict]:
+        """
+        ddgs.text com retry em rate limit (RatelimitException).
+        
+        Backoff exponencial com jitter; outros erros propagam de imediato.
+        """
+        ratelimit_error = _ddgs_api()[1]
+        retries = max(1, settings.DDG_MAX_RETRIES)
+        for attempt in range(retries):
+            try:
+                return list(ddgs.text(search_query, max_results=max_results))
+            except ratelimit_error:
+                if attempt == retries - 1:
+                    raise
+                # Corre numa thread (search/asearch): dormir não bloqueia o loop
+                time.sleep(_DDG_BACKOFF_BASE * 2 ** attempt + random.random() * _DDG_BACKOFF_JITTER)
+        return []
 
     def search_veterinary(
         self,
@@ -137,21 +323,36 @@ class WebSearchTool:
         Returns:
             Dict com resultados e análise opcional
         """
-        # Query veterinária direta (sem operadores site: que não funcionam bem no DDG)
-        vet_query = f"veterinary {query} diagnosis treatment"
+        return run_sync(self.asearch_veterinary(query, max_results, use_gemini_analysis))
+    
+    async def asearch_veterinary(
+        self,
+        query: str,
+        max_results: int = 5,
+        use_gemini_analysis: bool = True
+    ) -> dict:
+        """
+        Versão assíncrona de search_veterinary.
         
-        results = self.search(vet_query, max_results)
+        A query original (fallback) só é pesquisada se a veterinária vier
+        vazia: a pesquisa corre numa thread e não pode ser cancelada, por
+        isso lançá-las em paralelo duplicaria os pedidos ao DuckDuckGo (e a
+        exposição ao rate limit).
+        """
+        # Query veterinária direta (sem operadores site: que não funcionam bem no DDG)
+        vet_query = _VET_PREFIX + query + _VET_QUERY_SUFFIX
         
-        # Se não houver resultados, tentar query original
+        results = await self.asearch(vet_query, max_results)
         if not results:
-            results = self.search(query, max_results)
+            # Se não houver resultados, usar a query original
+            results = await self.asearch(query, max_results)
         
         analysis = None
         if use_gemini_analysis and results and self.google_api_key:
             try:
-                analysis = self._analyze_with_gemini(query, results)
+                analysis = await asyncio.to_thread(self._analyze_with_gemini, query, results)
             except Exception as e:
-                print(f"⚠️ Análise Gemini falhou: {e}")
+                log.warning("Análise Gemini falhou: %s", e)
         
         return {
             'query': query,
@@ -159,6 +360,19 @@ class WebSearchTool:
             'analysis': analysis
         }
     
+    def _get_gemini_model(self, model_name: str = "gemini-2.0-flash"):
+        """Modelo Gemini reutilizado entre análises (configure só uma vez)"""
+        model = self._gemini_models.get(model_name)
+        if model is None:
+            with self._gemini_lock:
+                model = self._gemini_models.get(model_name)
+                if model is None:
+                    genai = _genai()
+                    if not self._gemini_models:
+                        genai.configure(api_key=self.google_api_key)
+                    model = self._gemini_models[model_name] = genai.GenerativeModel(model_name)
+        return model
+    
     def _analyze_with_gemini(
         self,
         query: str,
@@ -166,10 +380,7 @@ class WebSearchTool:
     ) -> str:
         """Usa Gemini para analisar e sumarizar resultados"""
         try:
-            import google.generativeai as genai
-            
-            genai.configure(api_key=self.google_api_key)
-            model = genai.GenerativeModel("gemini-2.0-flash")
+            model = self._get_gemini_model("gemini-2.0-flash")
             
             # Formatar resultados para o prompt
             results_text = "\n\n".join([
@@ -206,21 +417,27 @@ Fornece um resumo estruturado com:
         if not results:
             return "Nenhum resultado encontrado."
         
+        # Escrita num só buffer (sem lista de linhas nem join final)
+        buf = io.StringIO()
+        w = buf.write
+        
         if format_type == 'markdown':
-            lines = []
             for i, r in enumerate(results, 1):
-                lines.append(f"### {i}. {r.title}")
-                lines.append(f"{r.snippet}")
-                lines.append(f"*Fonte: [{r.url}]({r.url})*\n")
-            return "\n".join(lines)
+                if i > 1:
+                    w("\n")
+                w(f"### {i}. {r.title}\n")
+                w(f"{r.snippet}\n")
+                w(f"*Fonte: [{r.url}]({r.url})*\n")
+            return buf.getvalue()
         
         elif format_type == 'plain':
-            lines = []
             for i, r in enumerate(results, 1):
-                lines.append(f"{i}. {r.title}")
-                lines.append(f"   {r.snippet}")
-                lines.append(f"   Fonte: {r.url}\n")
-            return "\n".join(lines)
+                if i > 1:
+                    w("\n")
+                w(f"{i}. {r.title}\n")
+                w(f"   {r.snippet}\n")
+                w(f"   Fonte: {r.url}\n")
+            return buf.getvalue()
         
         else:
             return str(results)
@@ -240,19 +457,23 @@ Fornece um resumo estruturado com:
         Returns:
             Texto formatado
         """
-        results = self.search(query, max_results=5)
+        # Pedir só os resultados que cabem no limite (menos bytes na rede e no cache)
+        n_results = min(_CONTEXT_MAX_RESULTS, max(1, max_chars // _CONTEXT_CHARS_PER_RESULT))
+        results = self.search(query, max_results=n_results)
         
-        context_parts = []
-        current_length = 0
+        buf = io.StringIO()
         
         for r in results:
-            snippet = f"[{r.title}]: {r.snippet}"
-            if current_length + len(snippet) > max_chars:
+            # Tamanho conhecido antes de escrever (rejeita sem construir a string);
+            # buf.tell() já inclui os separadores, por isso max_chars é um limite real
+            sep = 2 if buf.tell() else 0
+            if buf.tell() + sep + len(r.title) + len(r.snippet) + 4 > max_chars:
                 break
-            context_parts.append(snippet)
-            current_length += len(snippet)
+            if sep:
+                buf.write("\n\n")
+            buf.write(f"[{r.title}]: {r.snippet}")
         
-        return "\n\n".join(context_parts)
+        return buf.getvalue()
     
     def get_available_providers(self) -> list[str]:
         """Retorna lista de providers disponíveis"""
@@ -263,7 +484,12 @@ Fornece um resumo estruturado com:
 
 
 # Função utilitária
+@lru_cache(maxsize=1)
+def _get_tool() -> WebSearchTool:
+    """WebSearchTool partilhado (cliente, sessão DDGS e cache reutilizados)"""
+    return WebSearchTool()
+
+
 def quick_search(query: str) -> list[WebSearchResult]:
     """Pesquisa rápida com configuração padrão"""
-    tool = WebSearchTool()
-    return tool.search(query)
+    return _get_tool().search(query)
@@ -8,10 +8,22 @@ warnings.filterwarnings("ignore", message=".*duckduckgo.*")
 warnings.filterwarnings("ignore", message=".*LangChain.*")
 
 import gradio as gr
+import asyncio
+import html
+import io
+import re
 from datetime import datetime
+from itertools import chain
 from typing import Optional
 import json
 
+# orjson (opcional): serialização mais rápida do resultado
+try:
+    import orjson
+    _ORJSON_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+except ImportError:
+    orjson = None
+
 from agents.orchestrator import VetDiagnosisOrchestrator, CaseInput
 from config.settings import settings
 
@@ -38,6 +50,17 @@ TEXT_MODELS = {
     "Mistral Small": "mistral-small-latest",
 }
 
+# Modelos por omissão (resolvidos uma vez)
+_DEFAULT_VISION = settings.VLM_MODEL
+_DEFAULT_TEXT = settings.LLM_OPENROUTER_1
+
+# Urgência sem emojis (para o backend)
+_URGENCY_MAP = {
+    "🟢 Rotina": "Rotina",
+    "🟡 Moderada": "Moderada",
+    "🔴 Urgente": "Urgente"
+}
+
 # ============================================================
 # CONFIGURAÇÕES
 # ============================================================
@@ -366,6 +389,43 @@ input, select, .wrap-inner {
 }
 """
 
+# CSS minificado uma vez (sem comentários nem espaços redundantes)
+_CSS_COMENTARIOS = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_ESPACOS = re.compile(r"\s+")
+_CSS_PONTUACAO = re.compile(r"\s*([{};,])\s*")
+
+
+def _minify_css(css: str) -> str:
+    """Remove comentários e espaços desnecessários do CSS"""
+    css = _CSS_COMENTARIOS.sub("", css)
+    css = _CSS_ESPACOS.sub(" ", css)
+    return _CSS_PONTUACAO.sub(r"\1", css).strip()
+
+
+CSS_MIN = _minify_css(CSS)
+_STYLE_TAG = f"<style>{CSS_MIN}</style>"
+
+# Blocos HTML fixos da interface
+_HEADER_HTML = """
+<div class="app-header">
+    <h1>🐾 Vet Agents</h1>
+    <p>Sistema inteligente de apoio ao diagnóstico veterinário</p>
+</div>
+"""
+
+_DISCLAIMER_HTML = """
+<div class="disclaimer">
+    <strong>⚠️ Aviso:</strong> Este sistema é uma ferramenta de apoio e não substitui 
+    a consulta presencial com um médico veterinário qualificado.
+</div>
+"""
+
+_FOOTER_HTML = """
+<div class="app-footer">
+    <p>🐾 Vet Agents © 2025 • Sistema de apoio ao diagnóstico veterinário com IA</p>
+</div>
+"""
+
 # ============================================================
 # FUNÇÕES AUXILIARES
 # ============================================================
@@ -389,34 +449,71 @@ def validar_caso(especie, idade, peso, sintomas):
         return False, "Descreva os sintomas"
     return True, ""
 
-def criar_resumo_html(especie, raca, idade, peso, sexo, castrado, sintomas):
-    """Cria HTML do resumo do caso"""
-    icon = ESPECIES.get(especie, {}).get("icon", "🐾")
-    castrado_txt = "Sim" if castrado else "Não"
-    sintomas_preview = sintomas[:200] + '...' if len(sintomas) > 200 else sintomas
-    
-    return f"""
+class _CamposResumo(dict):
+    """Campos do template do resumo (campo em falta = vazio)"""
+    def __missing__(self, key):
+        return ""
+
+# Comprimento máximo dos sintomas no resumo
+_PREVIEW_MAX = 200
+
+# Template do resumo (formatado com format_map; campos já escapados)
+_RESUMO_TPL = """
     <div class="case-summary">
         <table>
             <tr><td>{icon} Espécie</td><td>{especie}</td></tr>
-            <tr><td>Raça</td><td>{raca or 'N/A'}</td></tr>
+            <tr><td>Raça</td><td>{raca}</td></tr>
             <tr><td>Idade</td><td>{idade}</td></tr>
             <tr><td>Peso</td><td>{peso} kg</td></tr>
             <tr><td>Sexo</td><td>{sexo}</td></tr>
-            <tr><td>Castrado</td><td>{castrado_txt}</td></tr>
+            <tr><td>Castrado</td><td>{castrado}</td></tr>
         </table>
         <div style="margin-top: 0.75rem; padding-top: 0.75rem; border-top: 1px solid #99f6e4;">
-            <strong>Sintomas:</strong> {sintomas_preview}
+            <strong>Sintomas:</strong> {sintomas}
         </div>
     </div>
+    """.format_map
+
+def criar_resumo_html(especie, raca, idade, peso, sexo, castrado, sintomas):
+    """Cria HTML do resumo do caso (campos do utilizador escapados)"""
+    icon = ESPECIES.get(especie, {}).get("icon", "🐾")
+    # Texto curto passa inalterado; o longo é cortado numa só alocação
+    sintomas_preview = sintomas
+    if len(sintomas) > _PREVIEW_MAX:
+        sintomas_preview = f"{sintomas[:_PREVIEW_MAX]}..."
+    
+    return _RESUMO_TPL(_CamposResumo(
+        icon=icon,
+        especie=html.escape(str(especie)),
+        raca=html.escape(str(raca or 'N/A')),
+        idade=html.escape(str(idade)),
+        peso=html.escape(str(peso)),
+        sexo=html.escape(str(sexo)),
+        castrado="Sim" if castrado else "Não",
+        sintomas=html.escape(sintomas_preview)
+    ))
+
+def resultado_json(results: dict) -> str:
     """
+    Serializa o resultado (indentado) para o separador JSON.
+    
+    Usa orjson se disponível (dataclasses e chaves não-str incluídas);
+    se falhar num tipo que não suporta, recorre ao json da stdlib.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(results, default=str, option=_ORJSON_OPTS).decode()
+        except TypeError:
+            pass
+    return json.dumps(results, indent=2, ensure_ascii=False, default=str)
 
 def formatar_resultado(results: dict, vision_model: str = "", text_model: str = "") -> str:
     """Formata resultado em Markdown"""
     if not results:
         return "❌ Não foi possível gerar o diagnóstico."
     
-    md = []
+    buf = io.StringIO()
+    w = buf.write
     
     # Performance badge + Model badges
     perf = results.get("performance", {})
@@ -434,29 +531,29 @@ def formatar_resultado(results: dict, vision_model: str = "", text_model: str =
         badges.append(f'<span class="model-badge">🧠 {text_short}</span>')
     
     if badges:
-        md.append(f'<div style="margin-bottom: 1rem;">{"".join(badges)}</div>\n')
+        w(f'<div style="margin-bottom: 1rem;">{"".join(badges)}</div>\n')
     
     # Análise Visual
     visual = results.get("visual_analysis", "")
     if visual and visual != "Nenhuma imagem fornecida":
-        md.append("\n### 🔍 Análise Visual\n")
-        md.append(visual)
-        md.append("\n\n---\n\n")
+        w("\n### 🔍 Análise Visual\n")
+        w(visual)
+        w("\n\n---\n\n")
     
     # Diagnóstico
     if results.get("diagnosis"):
-        md.append("### 🩺 Diagnóstico e Recomendações\n")
-        md.append(results["diagnosis"])
-        md.append("\n\n")
+        w("### 🩺 Diagnóstico e Recomendações\n")
+        w(results["diagnosis"])
+        w("\n\n")
     
     # Pesquisa Web
     if results.get("research"):
-        md.append("---\n\n### 📚 Informação Complementar\n")
-        md.append(results["research"])
-        md.append("\n")
+        w("---\n\n### 📚 Informação Complementar\n")
+        w(results["research"])
+        w("\n")
     
     # Disclaimer final
-    md.append("""
+    w("""
 <div class="final-disclaimer">
     <span class="icon">⚠️</span>
     <div>
@@ -466,18 +563,23 @@ def formatar_resultado(results: dict, vision_model: str = "", text_model: str =
 </div>
 """)
     
-    return "".join(md)
+    return buf.getvalue()
 
 # ============================================================
 # FUNÇÃO PRINCIPAL
 # ============================================================
 
-def executar_diagnostico(
+async def executar_diagnostico(
     especie, raca, idade, peso, sexo, castrado, historico, sintomas_texto,
     sintomas_gerais, sintomas_digestivos, sintomas_respiratorios, sintomas_pele, sintomas_movimento,
     images, urgencia, vision_model, text_model, progress=gr.Progress()
 ):
-    """Executa o diagnóstico completo"""
+    """
+    Executa o diagnóstico completo.
+    
+    Assíncrono: o Gradio aguarda-o no event loop e o pipeline (bloqueante)
+    corre numa thread, sem ocupar um worker por pedido.
+    """
     
     # Validação
     valido, erro = validar_caso(especie, idade, peso, sintomas_texto)
@@ -485,26 +587,27 @@ def executar_diagnostico(
         return "", f"### ⚠️ {erro}\n\nPor favor, preencha todos os campos obrigatórios.", ""
     
     # Combinar sintomas
-    todos_sintomas = []
-    for lista in [sintomas_gerais, sintomas_digestivos, sintomas_respiratorios, sintomas_pele, sintomas_movimento]:
-        if lista:
-            todos_sintomas.extend(lista)
+    todos_sintomas = [
+        s for s in chain.from_iterable((
+            sintomas_gerais or (),
+            sintomas_digestivos or (),
+            sintomas_respiratorios or (),
+            sintomas_pele or (),
+            sintomas_movimento or ()
+        )) if s
+    ]
     
-    sintomas_final = sintomas_texto
     if todos_sintomas:
-        sintomas_final += f". Sintomas selecionados: {', '.join(todos_sintomas)}"
+        sintomas_final = f"{sintomas_texto}. Sintomas selecionados: {', '.join(todos_sintomas)}"
+    else:
+        sintomas_final = sintomas_texto
     
     # Mapear urgência (remover emojis para o backend)
-    mapa_urgencia = {
-        "🟢 Rotina": "Rotina",
-        "🟡 Moderada": "Moderada",
-        "🔴 Urgente": "Urgente"
-    }
-    nivel_urgencia = mapa_urgencia.get(urgencia, "Rotina")
+    nivel_urgencia = _URGENCY_MAP.get(urgencia, "Rotina")
     
     # Obter IDs dos modelos selecionados
-    vision_model_id = VISION_MODELS.get(vision_model, settings.VLM_MODEL)
-    text_model_id = TEXT_MODELS.get(text_model, settings.LLM_OPENROUTER_1)
+    vision_model_id = VISION_MODELS.get(vision_model, _DEFAULT_VISION)
+    text_model_id = TEXT_MODELS.get(text_model, _DEFAULT_TEXT)
     
     try:
         progress(0.1, desc="Preparando análise...")
@@ -524,13 +627,21 @@ def executar_diagnostico(
         
         progress(0.3, desc="Analisando dados clínicos...")
         # Passar modelos selecionados para o orchestrator
-        results = vet_system.run_diagnosis(case, vision_model=vision_model_id, text_model=text_model_id)
+        diagnosis_task = asyncio.create_task(asyncio.to_thread(
+            vet_system.run_diagnosis, case, vision_model=vision_model_id, text_model=text_model_id
+        ))
+        
+        # O resumo só depende do formulário: montado enquanto o pipeline corre
+        resumo = criar_resumo_html(especie, raca, idade, peso, sexo, castrado, sintomas_final)
+        results = await diagnosis_task
         
         progress(0.9, desc="Gerando relatório...")
         
-        resumo = criar_resumo_html(especie, raca, idade, peso, sexo, castrado, sintomas_final)
-        diagnostico = formatar_resultado(results, vision_model_id, text_model_id)
-        json_str = json.dumps(results, indent=2, ensure_ascii=False)
+        # Markdown e JSON (resultados grandes) formatados em paralelo
+        diagnostico, json_str = await asyncio.gather(
+            asyncio.to_thread(formatar_resultado, results, vision_model_id, text_model_id),
+            asyncio.to_thread(resultado_json, results)
+        )
         
         progress(1.0, desc="Concluído!")
         
@@ -549,23 +660,13 @@ def criar_interface():
     with gr.Blocks(title="🐾 Vet Agents") as app:
         
         # Injetar CSS
-        gr.HTML(f"<style>{CSS}</style>")
+        gr.HTML(_STYLE_TAG)
         
         # Header
-        gr.HTML("""
-        <div class="app-header">
-            <h1>🐾 Vet Agents</h1>
-            <p>Sistema inteligente de apoio ao diagnóstico veterinário</p>
-        </div>
-        """)
+        gr.HTML(_HEADER_HTML)
         
         # Disclaimer
-        gr.HTML("""
-        <div class="disclaimer">
-            <strong>⚠️ Aviso:</strong> Este sistema é uma ferramenta de apoio e não substitui 
-            a consulta presencial com um médico veterinário qualificado.
-        </div>
-        """)
+        gr.HTML(_DISCLAIMER_HTML)
         
         with gr.Row():
             # === COLUNA ESQUERDA: FORMULÁRIO ===
@@ -671,11 +772,7 @@ def criar_interface():
                     json_output = gr.Code(language="json")
         
         # Footer
-        gr.HTML("""
-        <div class="app-footer">
-            <p>🐾 Vet Agents © 2025 • Sistema de apoio ao diagnóstico veterinário com IA</p>
-        </div>
-        """)
+        gr.HTML(_FOOTER_HTML)
         
         # === EVENT HANDLERS ===
         especie.change(